@@ -6,6 +6,8 @@ from bs4 import BeautifulStoneSoup
 
 from django.conf import settings
 
+from anycontest import contest_cache
+
 logger = logging.getLogger('django.request')
 HEADERS = {'Authorization': 'OAuth ' + settings.CONTEST_OAUTH}
 HTTP_RESPONSE_STATUS_OK = 200
@@ -57,18 +59,17 @@ def user_register_to_contest(contest_id, ya_contest_uid):
 
 
 def get_problem_compilers(problem_id, contest_id):
-    contest_req = FakeResponse()
+    contest_json = None
     problem_compilers = []
 
     try:
-        contest_req = requests.get(settings.CONTEST_API_URL + 'contest?contestId=' + str(contest_id),
-                                   headers=HEADERS)
-        for problem in contest_req.json()['result']['problems']:
+        contest_json = contest_cache.get_contest(contest_id)
+        for problem in contest_json['result']['problems']:
             if problem['alias'] == problem_id:
-                problem_compilers = problem['compilers']
+                problem_compilers = list(problem['compilers'])
     except Exception as e:
-        logger.exception("Exception while request to Contest: '%s' : '%s', Exception: '%s'",
-                         contest_req.url, contest_req.json(), e)
+        logger.exception("Exception while request to Contest: contest '%s' : '%s', Exception: '%s'",
+                         contest_id, contest_json, e)
 
     return problem_compilers
 
@@ -226,21 +227,19 @@ def get_contest_mark(contest_id, problem_id, ya_login):
 
 
 def get_contest_info(contest_id, lang=None):
-    contest_req = FakeResponse()
-    contest_api = settings.CONTEST_API_URL + 'contest?contestId={cont_id}&locale={lang}'
+    contest_json = None
 
     try:
         lang_ = 'ru' if lang is None else lang
-        contest_req = requests.get(contest_api.format(lang=lang_, cont_id=str(contest_id)), headers=HEADERS)
+        contest_json = contest_cache.get_contest(contest_id, lang_)
 
-        if 'error' in contest_req.json():
-            return False, contest_req.json()["error"]["message"]
+        if 'error' in contest_json:
+            return False, contest_json["error"]["message"]
 
-        contest_info = contest_req.json()['result']
+        contest_info = contest_json['result']
 
         if lang is None:
-            contest_info_en = requests.get(contest_api.format(lang='en', cont_id=str(contest_id)),
-                                           headers=HEADERS).json()['result']
+            contest_info_en = contest_cache.get_contest(contest_id, 'en')['result']
             json_str = u'{{"ru": "{0}", "en": "{1}"}}'
             for problem in contest_info['problems']:
                 problem_en = next(item for item in contest_info_en['problems']
@@ -255,8 +254,8 @@ def get_contest_info(contest_id, lang=None):
                 )
         got_info = True
     except Exception as e:
-        logger.exception("Exception while request to Contest: '%s' : '%s', Exception: '%s'",
-                         contest_req.url, contest_req.json(), e)
+        logger.exception("Exception while request to Contest: contest '%s' : '%s', Exception: '%s'",
+                         contest_id, contest_json, e)
         contest_info = {}
         got_info = False
 
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+import uuid
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('django.request')
+
+VERSION_KEY = 'contest:version:{0}'
+RESPONSE_KEY = 'contest:response:{0}:{1}:{2}:{3}'
+
+
+def get_version(contest_id):
+    key = VERSION_KEY.format(contest_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(*contest_ids):
+    """
+    Drops cached metadata of the contests, it is requested from Contest on the next access.
+    """
+    if contest_ids:
+        cache.set_many(dict((VERSION_KEY.format(contest_id), uuid.uuid4().hex) for contest_id in contest_ids), None)
+
+
+def get_contest(contest_id, lang='ru'):
+    """
+    Contest `contest?contestId=` response: contest info, its problems with statements and compilers.
+    """
+    return _get(contest_id, 'contest', lang)
+
+
+def get_problems(contest_id, lang=None):
+    """
+    Contest `problems?contestId=` response: problems with their ids, titles and scores.
+    """
+    return _get(contest_id, 'problems', lang)
+
+
+def _get(contest_id, endpoint, lang):
+    """
+    Successful responses are used for CONTEST_METADATA_TTL seconds. After that Contest is asked again,
+    but the old copy is still returned for CONTEST_METADATA_STALE_TTL seconds if Contest does not answer.
+    Error responses are not cached.
+    """
+    key = RESPONSE_KEY.format(contest_id, get_version(contest_id), endpoint, lang or '')
+    entry = cache.get(key)
+    if entry is not None and time.time() - entry['time'] < settings.CONTEST_METADATA_TTL:
+        return entry['data']
+
+    url = settings.CONTEST_API_URL + endpoint + '?contestId=' + str(contest_id)
+    if lang:
+        url += '&locale=' + lang
+    try:
+        data = requests.get(url, headers={'Authorization': 'OAuth ' + settings.CONTEST_OAUTH},
+                            timeout=settings.CONTEST_METADATA_TIMEOUT).json()
+    except (requests.RequestException, ValueError) as e:
+        if entry is None:
+            raise
+        logger.warning("Request to Contest '%s' failed, using cached response: '%s'", url, e)
+        return entry['data']
+
+    if 'result' in data:
+        cache.set(key, {'time': time.time(), 'data': data}, settings.CONTEST_METADATA_STALE_TTL)
+    return data
@@ -7,12 +7,10 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import translation, timezone
 from django.utils.translation import ugettext as _
-from django.db.models import Q
 
 from anycontest.common import comment_verdict  # , set_contest_marks, convert_to_contest_login
-from anycontest.models import ContestSubmission
+from anycontest.poller import ContestPoller
 from anyrb.common import AnyRB
-from users.models import UserProfile
 
 
 logger = logging.getLogger('django.request')
@@ -21,34 +19,37 @@ logger = logging.getLogger('django.request')
 class Command(BaseCommand):
     help = "Check contest submissions and comment verdict"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', dest='workers', type=int, default=None,
+                            help='Concurrent requests to Contest, CONTEST_POLL_WORKERS by default')
+        parser.add_argument('--loop', dest='loop', action='store_true', default=False,
+                            help='Keep checking every CONTEST_POLL_INTERVAL seconds')
+
     def handle(self, **options):
-        start_time = time.time()
-        contest_marks_len = 0
-        contest_submissions = ContestSubmission.objects \
-            .filter(Q(got_verdict=False) & (Q(send_error__isnull=True) | Q(send_error=""))) \
-            .exclude(run_id__exact="") \
-            .exclude(run_id__isnull=True)
-        for contest_submission in contest_submissions:
-            try:
-                contest_marks_len = self.handle_submission(contest_marks_len, contest_submission)
-            except Exception as e:
-                logger.exception(e)
-
-        # for contest_id, students_info in contest_marks.items():
-        #     set_contest_marks(contest_id, students_info)
-
-        # logging to cron log
-        duration = time.time() - start_time
-        print(f"Command check_contest check {len(contest_submissions)} submissions ({contest_marks_len} - with marks) "
-              f"took {duration} seconds")
+        poller = ContestPoller(options['workers'])
+        while True:
+            start_time = time.time()
+            self.contest_marks_len = 0
+            checked = poller.poll(lambda contest_submission, response: self.handle_submission(
+                contest_submission, response, poller))
 
-    @staticmethod
-    def handle_submission(contest_marks_len, contest_submission):
+            # for contest_id, students_info in contest_marks.items():
+            #     set_contest_marks(contest_id, students_info)
+
+            # logging to cron log
+            duration = time.time() - start_time
+            print(f"Command check_contest check {checked} submissions ({self.contest_marks_len} - with marks) "
+                  f"took {duration} seconds")
+
+            if not options['loop']:
+                break
+            time.sleep(max(0, settings.CONTEST_POLL_INTERVAL - duration))
+
+    def handle_submission(self, contest_submission, response, poller):
         issue = contest_submission.issue
         task = issue.task
-        lang = UserProfile.objects.get(user=contest_submission.author).language
-        translation.activate(lang)
-        comment = contest_submission.check_submission()
+        translation.activate(contest_submission.author.profile.language)
+        comment = contest_submission.check_submission(response)
         if contest_submission.got_verdict:
             if contest_submission.verdict == 'ok' and \
                     not task.course.send_rb_and_contest_together and \
@@ -61,12 +62,12 @@ class Command(BaseCommand):
 
             if contest_submission.verdict == 'ok':
                 if issue.task.course.take_mark_from_contest:
-                    contest_submission.get_contest_mark()
-                    contest_marks_len += 1
+                    poller.limiter.wait(settings.CONTEST_OAUTH)
+                    contest_submission.get_contest_mark(poller.session)
+                    self.contest_marks_len += 1
 
             comment_verdict(issue, contest_submission.verdict == 'ok', comment)
         translation.deactivate()
-        return contest_marks_len
 
     @staticmethod
     def submit_to_rb(comment, contest_submission):
@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.core.files.storage import default_storage
 
 from django.contrib.auth.models import User
+from anycontest import contest_cache
 from anycontest.common import FakeResponse, escape, user_register_to_contest
 
 import requests
@@ -53,7 +54,8 @@ class ContestSubmission(models.Model):
         return u"{0} {1}".format(self.issue, self.run_id)
 
     def upload_contest(self, extension=None, compiler_id=None):
-        problem_req = FakeResponse()
+        contest_id = None
+        problems_json = None
         submit_req = FakeResponse()
         reg_req = FakeResponse()
         message = "OK"
@@ -87,10 +89,9 @@ class ContestSubmission(models.Model):
                         return False
             else:
                 oauth = settings.CONTEST_OAUTH
-            problem_req = requests.get(settings.CONTEST_API_URL + 'problems?contestId=' + str(contest_id),
-                                       headers={'Authorization': 'OAuth ' + settings.CONTEST_OAUTH})
+            problems_json = contest_cache.get_problems(contest_id)
             problem_id = None
-            for problem in problem_req.json()['result']['problems']:
+            for problem in problems_json['result']['problems']:
                 if problem['title'] == issue.task.problem_id:
                     problem_id = problem['id']
                     break
@@ -126,8 +127,8 @@ class ContestSubmission(models.Model):
             self.run_id = run_id
             self.save()
         except Exception as e:
-            logger.exception("Exception while request to Contest: '%s' : '%s', '%s' : '%s', Exception: '%s'",
-                             problem_req.url, problem_req.json(), submit_req.url, submit_req.json(), e)
+            logger.exception("Exception while request to Contest: contest '%s' : '%s', '%s' : '%s', Exception: '%s'",
+                             contest_id, problems_json, submit_req.url, submit_req.json(), e)
             sent = False
             message = "Unexpected error"
 
@@ -137,7 +138,7 @@ class ContestSubmission(models.Model):
 
         return sent
 
-    def get_contest_mark(self):
+    def get_contest_mark(self, session=requests):
         results_req = FakeResponse()
         run_id = self.run_id
         issue = self.issue
@@ -145,7 +146,7 @@ class ContestSubmission(models.Model):
         try:
             oauth = settings.CONTEST_OAUTH
             contest_id = issue.task.contest_id
-            results_req = requests.get(
+            results_req = session.get(
                 settings.CONTEST_V1_API_URL + '/contests/' + str(contest_id) + '/submissions/' + str(run_id) + '/full',
                 headers={'Authorization': 'OAuth ' + oauth}
             )
@@ -173,24 +174,33 @@ class ContestSubmission(models.Model):
 
         return settings.CONTEST_EXTENSIONS_COURSE[course_id][extension]
 
-    def check_submission(self):
+    def get_oauth(self):
+        student_profile = self.issue.student.profile
+        if student_profile.ya_contest_oauth and self.issue.task.course.send_to_contest_from_users:
+            return student_profile.ya_contest_oauth
+        return settings.CONTEST_OAUTH
+
+    def request_results(self, session=requests, oauth=None, timeout=None):
+        if oauth is None:
+            oauth = self.get_oauth()
+        return session.get(
+            settings.CONTEST_API_URL + 'results?runId=' + str(self.run_id) + '&contestId=' + str(
+                self.issue.task.contest_id),
+            headers={'Authorization': 'OAuth ' + oauth},
+            timeout=timeout
+        )
+
+    def check_submission(self, response=None):
+        """
+        Parses the run results and saves them, returns comment with the verdict.
+        response is the results already requested with request_results(), otherwise it is requested here.
+        """
         results_req = FakeResponse()
-        issue = self.issue
         comment = ''
         run_id = self.run_id
 
         try:
-            student_profile = issue.student.profile
-            course = issue.task.course
-            if student_profile.ya_contest_oauth and course.send_to_contest_from_users:
-                oauth = student_profile.ya_contest_oauth
-            else:
-                oauth = settings.CONTEST_OAUTH
-            contest_id = issue.task.contest_id
-            results_req = requests.get(
-                settings.CONTEST_API_URL + 'results?runId=' + str(run_id) + '&contestId=' + str(contest_id),
-                headers={'Authorization': 'OAuth ' + oauth}
-            )
+            results_req = response if response is not None else self.request_results()
             results_req_json = results_req.json()
             self.full_response = results_req.content
 
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from anycontest.models import ContestSubmission
+
+logger = logging.getLogger('django.request')
+
+
+class RateLimiter(object):
+    """
+    Lets at most `rate` calls per second through for every key (OAuth token), callers coming earlier are blocked.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1. / rate if rate else 0.
+        self._lock = threading.Lock()
+        self._next_time = {}
+
+    def wait(self, key):
+        with self._lock:
+            now = time.time()
+            call_time = max(now, self._next_time.get(key, now))
+            self._next_time[key] = call_time + self.interval
+        if call_time > now:
+            time.sleep(call_time - now)
+
+
+def get_session(pool_size):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_pending_submissions():
+    return ContestSubmission.objects \
+        .filter(Q(got_verdict=False) & (Q(send_error__isnull=True) | Q(send_error=""))) \
+        .exclude(run_id__exact="") \
+        .exclude(run_id__isnull=True) \
+        .select_related('issue', 'issue__student__profile', 'issue__task__course', 'author__profile') \
+        .order_by('id')
+
+
+def is_poll_due(contest_submission, now):
+    """
+    Runs still waiting or running are checked less often the older they are:
+    after CONTEST_POLL_BACKOFF of their age since the last check, but at least every CONTEST_POLL_MAX_DELAY seconds.
+    """
+    age = (now - contest_submission.create_time).total_seconds()
+    since_check = (now - contest_submission.update_time).total_seconds()
+    return since_check >= min(age * settings.CONTEST_POLL_BACKOFF, settings.CONTEST_POLL_MAX_DELAY)
+
+
+class ContestPoller(object):
+    """
+    Checks pending contest submissions. Results are requested by a pool of threads sharing one keep-alive
+    session and rate limited per OAuth token; they are handled in the calling thread, which also does
+    all database work, committing every CONTEST_POLL_BATCH_SIZE submissions at once.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or settings.CONTEST_POLL_WORKERS
+        self.session = get_session(self.workers)
+        self.limiter = RateLimiter(settings.CONTEST_POLL_RATE)
+
+    def request(self, oauth, contest_submission):
+        self.limiter.wait(oauth)
+        try:
+            return contest_submission.request_results(self.session, oauth, settings.CONTEST_POLL_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning("Run_id %s results request failed: %s", contest_submission.run_id, e)
+            return None
+
+    def poll(self, handle):
+        """
+        Calls handle(contest_submission, response) for every submission due to be checked.
+        :returns number of submissions checked
+        """
+        now = timezone.now()
+        contest_submissions = [x for x in get_pending_submissions() if is_poll_due(x, now)]
+        oauths = [x.get_oauth() for x in contest_submissions]
+
+        checked = 0
+        batch = []
+        with ThreadPoolExecutor(self.workers) as executor:
+            responses = executor.map(self.request, oauths, contest_submissions)
+            for contest_submission, response in zip(contest_submissions, responses):
+                if response is None:
+                    continue
+                batch.append((contest_submission, response))
+                if len(batch) >= settings.CONTEST_POLL_BATCH_SIZE:
+                    checked += self._handle_batch(handle, batch)
+                    batch = []
+            checked += self._handle_batch(handle, batch)
+
+        return checked
+
+    @staticmethod
+    def _handle_batch(handle, batch):
+        with transaction.atomic():
+            for contest_submission, response in batch:
+                try:
+                    with transaction.atomic():
+                        handle(contest_submission, response)
+                except Exception as e:
+                    logger.exception(e)
+        return len(batch)
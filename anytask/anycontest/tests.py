@@ -1,5 +1,6 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from unittest import skip
+from unittest.mock import patch
 from django.conf import settings
 
 from django.contrib.auth.models import User
@@ -7,12 +8,16 @@ from courses.models import Course, IssueField
 from groups.models import Group
 from years.models import Year
 from tasks.models import Task
-from issues.models import Issue, File, Event
+from issues.models import Issue, File, Event, IssueJob
 from issues.model_issue_status import IssueStatus
 from .common import get_contest_info
+from anycontest import contest_cache
 from anycontest.models import ContestSubmission
+from anycontest.poller import RateLimiter, get_pending_submissions, is_poll_due
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 
 import threading
@@ -22,6 +27,10 @@ import time
 import json
 from . import tests_data
 import cgi
+import requests
+import contextlib
+import datetime
+import io
 
 CONTEST_PORT = 8079
 
@@ -337,3 +346,93 @@ class AnyContestTest(TestCase):
 
         contest_submition.check_submission()
         self.assertFalse(contest_submition.got_verdict)
+
+    def _create_submission(self, run_id):
+        event_create_file = Event.objects.create(issue=self.issue, field=IssueField.objects.get(name='file'))
+        f = File.objects.create(file=SimpleUploadedFile('test_rb.py', b'print "hello world!"'), event=event_create_file)
+        return ContestSubmission.objects.create(issue=self.issue, author=self.student, file=f, run_id=run_id)
+
+    def test_check_contest_command(self):
+        User.objects.create_user(username='anytask', password='password')
+        contest_submission_ok = self._create_submission("1")
+        contest_submission_failed = self._create_submission("3")
+
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            call_command('check_contest', '--workers', '2')
+        self.assertIn("check 2 submissions", stdout.getvalue())
+
+        contest_submission_ok.refresh_from_db()
+        self.assertTrue(contest_submission_ok.got_verdict)
+        self.assertEqual(contest_submission_ok.verdict, 'ok')
+        contest_submission_failed.refresh_from_db()
+        self.assertTrue(contest_submission_failed.got_verdict)
+        self.assertEqual(contest_submission_failed.test_number, 4)
+        self.assertEqual(Event.objects.filter(issue=self.issue, field__name='comment').count(), 2)
+        self.assertFalse(get_pending_submissions().exists())
+
+    def test_poll_backoff(self):
+        contest_submission = self._create_submission("1")
+        now = timezone.now()
+        self.assertTrue(is_poll_due(contest_submission, now))
+
+        contest_submission.create_time = now - datetime.timedelta(hours=1)
+        contest_submission.update_time = now - datetime.timedelta(seconds=10)
+        self.assertFalse(is_poll_due(contest_submission, now))
+        contest_submission.update_time = now - datetime.timedelta(seconds=settings.CONTEST_POLL_MAX_DELAY)
+        self.assertTrue(is_poll_due(contest_submission, now))
+
+    def test_contest_cache(self):
+        contest_cache.invalidate(0)
+        with patch('anycontest.contest_cache.requests.get', wraps=requests.get) as mock_get:
+            problems = contest_cache.get_problems(0)['result']['problems']
+            self.assertEqual(contest_cache.get_problems(0)['result']['problems'], problems)
+            self.assertEqual(mock_get.call_count, 1)
+
+            contest_cache.invalidate(0)
+            contest_cache.get_problems(0)
+            self.assertEqual(mock_get.call_count, 2)
+
+        with override_settings(CONTEST_METADATA_TTL=0), \
+                patch('anycontest.contest_cache.requests.get', side_effect=requests.ConnectionError):
+            self.assertEqual(contest_cache.get_problems(0)['result']['problems'], problems)
+            contest_cache.invalidate(0)
+            with self.assertRaises(requests.ConnectionError):
+                contest_cache.get_problems(0)
+
+    @override_settings(CONTEST_EXTENSIONS={'.py': 'python'})
+    def test_upload_contest_job(self):
+        self.task.contest_integrated = True
+        self.task.save()
+        event = self.issue.set_byname('comment', {'files': [SimpleUploadedFile('test.py', b'print "hello world!"')],
+                                                  'comment': 'test_comment',
+                                                  'compilers': [None]}, self.student)
+        contest_submission = ContestSubmission.objects.get(issue=self.issue)
+        self.assertEqual(contest_submission.run_id, '')
+        self.assertEqual(IssueJob.objects.get(event=event).status, IssueJob.STATUS_PENDING)
+        self.assertTrue(Issue.objects.get(id=self.issue.id).is_status_accepted())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('run_issue_jobs')
+        self.assertEqual(IssueJob.objects.get(event=event).status, IssueJob.STATUS_DONE)
+        contest_submission.refresh_from_db()
+        self.assertEqual(contest_submission.run_id, '1')
+        self.assertIn(u'<p>{0}</p>'.format(_(u'otpravleno_v_kontest')), Event.objects.get(id=event.id).value)
+
+
+class RateLimiterTest(TestCase):
+    def test_wait(self):
+        clock = [100.]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        limiter = RateLimiter(20)
+        with patch('anycontest.poller.time.time', side_effect=lambda: clock[0]), \
+                patch('anycontest.poller.time.sleep', side_effect=sleep) as sleep_mock:
+            for _i in range(3):
+                limiter.wait('token')
+            limiter.wait('other_token')
+        self.assertEqual(len(sleep_mock.call_args_list), 2)
+        for call in sleep_mock.call_args_list:
+            self.assertAlmostEqual(call[0][0], 0.05)
+        self.assertAlmostEqual(clock[0], 100.1)
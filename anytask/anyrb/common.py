@@ -1,29 +1,122 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import io
 import logging
 import os
-import requests
+import threading
+from difflib import unified_diff
 
+import requests
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.utils.translation import ugettext as _
 
-from rbtools.api.client import RBClient
-from rbtools.api.errors import APIError, AuthorizationError, BadRequestError, ServerInterfaceError
 from .unpacker import unpack_files
 
 logger = logging.getLogger('django.request')
 
+REPOSITORY_KEY = 'rb:repository:{0}'
+DIFF_KEY = 'rb:diff:{0}'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class ReviewBoardError(Exception):
+    def __init__(self, response):
+        Exception.__init__(self, "Review Board answered {0} to {1} {2}: {3}".format(
+            response.status_code, response.request.method, response.url, response.content[:1024]))
+        self.status_code = response.status_code
+
+
+def get_session():
+    """
+    Returns: keep-alive session to Review Board shared by the process
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.RB_API_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.auth = (settings.RB_API_USERNAME, settings.RB_API_PASSWORD)
+            session.headers['Accept'] = 'application/json'
+            _session = session
+    return _session
+
+
+def api_request(method, path, **kwargs):
+    """
+    Calls Review Board API `path`, raises ReviewBoardError if it does not succeed
+    """
+    response = get_session().request(method, settings.RB_API_URL + '/api/' + path,
+                                     timeout=settings.RB_API_TIMEOUT, **kwargs)
+    if response.status_code >= 400:
+        raise ReviewBoardError(response)
+    return response
+
+
+def get_file_diff(f):
+    """
+    Returns: diff adding the text file, '' for other files.
+    Diffs are cached by file name and content, so files uploaded again are not sniffed and diffed.
+    """
+    with f.file as file_obj:
+        content = file_obj.read()
+    fname = f.filename()
+    key = DIFF_KEY.format(hashlib.sha1(fname.encode('utf-8') + b'\0' + content).hexdigest())
+    files_diff = cache.get(key)
+    if files_diff is not None:
+        return files_diff
+
+    import magic
+
+    files_diff = u''
+    mime_type = magic.from_buffer(content[:2048], mime=True)
+    if mime_type[:4] == 'text':
+        file_content = []
+        for line in io.BytesIO(content):
+            try:
+                file_content.append(line.decode('utf-8'))
+            except (UnicodeDecodeError, UnicodeEncodeError):
+                file_content.append(line.decode('cp1251'))
+
+        from_name = 'a/{0}'.format(fname)
+        to_name = 'b/{0}'.format(fname)
+
+        diff = [(u'diff --git {0} {1}'.format(from_name, to_name))]
+        from_name = u'/dev/null'
+
+        diff_content = unified_diff('',
+                                    file_content,
+                                    fromfile=from_name,
+                                    tofile=to_name)
+
+        for line in diff_content:
+            line = line.strip()
+            diff.append(line)
+
+        files_diff = u'\n'.join(diff)
+
+    cache.set(key, files_diff, settings.RB_DIFF_CACHE_TTL)
+    return files_diff
+
 
 class AnyRB(object):
+    """
+    Uploads files of the event to the review request of the issue: a diff upload and a draft update
+    when the review request exists, creating it (and the repository, unless cached) otherwise.
+    """
+
     def __init__(self, event):
-        self.client = RBClient(settings.RB_API_URL, username=settings.RB_API_USERNAME,
-                               password=settings.RB_API_PASSWORD)
         self.event = event
 
     def upload_review(self):
         try:
             return self.upload_review_unsafe()
-        except (APIError, AuthorizationError, BadRequestError, ServerInterfaceError) as e:
+        except (requests.RequestException, ReviewBoardError) as e:
             logger.exception("Error communicating to reviewboard", exc_info=e)
             return None
         except Exception as e:
@@ -34,197 +127,139 @@ class AnyRB(object):
         if len(self.event.file_set.all()) == 0:
             return None
 
-        files_diff = []
-        empty = True
-        import magic
-
         with unpack_files(self.event.file_set.all()) as files:
-            for f in files:
-                mime_type = magic.from_buffer(f.file.read(2048), mime=True)
-                if mime_type[:4] != 'text':
-                    continue
-
-                empty = False
-                file_content = []
-                for line in f.file:
-                    try:
-                        file_content.append(line.decode('utf-8'))
-                    except (UnicodeDecodeError, UnicodeEncodeError):
-                        file_content.append(line.decode('cp1251'))
-
-                from difflib import unified_diff
-                fname = f.filename()
-                from_name = 'a/{0}'.format(fname)
-                to_name = 'b/{0}'.format(fname)
-
-                diff = [(u'diff --git {0} {1}'.format(from_name, to_name))]
-                from_name = u'/dev/null'
-
-                diff_content = unified_diff('',
-                                            file_content,
-                                            fromfile=from_name,
-                                            tofile=to_name)
-
-                for line in diff_content:
-                    line = line.strip()
-                    diff.append(line)
+            files_diff = [x for x in map(get_file_diff, files) if x]
 
-                files_diff.append(u'\n'.join(diff))
-
-            files_diff = u'\n'.join(files_diff)
+        if not files_diff:
+            return None
+        files_diff = u'\n'.join(files_diff)
 
-            if empty:
+        logger.info("Diff to upload: >>>%s<<<", files_diff)
+        review_request_id = self.get_review_request_id()
+        if review_request_id is None or not self.upload_diff(review_request_id, files_diff):
+            review_request_id = self.create_review_request()
+            if review_request_id is None:
                 return None
-
-            self.call_symlink_creator(self.event.issue.id)
-            review_request = self.get_review_request()
-            if review_request is None:
-                review_request = self.create_review_request()
-            if review_request is None:
-                return review_request
-
-            logger.info("Diff to upload: >>>%s<<<", files_diff)
-            review_request.get_diffs().upload_diff(files_diff.encode('utf-8'))
-
-            draft = review_request.get_or_create_draft()
-            issue = self.event.issue
-            task_title = issue.task.get_title(issue.student.profile.language)
-            summary = u'[{0}][{1}] {2}'.format(issue.student.get_full_name(),
-                                               issue.task.course.get_user_group(issue.student),
-                                               task_title)
-
-            description_template = \
-                _(u'zadacha') + ': "{0}", ' + \
-                _(u'kurs') + ': [{1}]({2}{3})\n' + \
-                _(u'student') + ': [{4}]({2}{5})\n' + '[' + \
-                _(u'obsuzhdenie_zadachi') + ']({2}{6})'
-
-            description = description_template.format(
-                task_title,
-                issue.task.course,
-                Site.objects.get_current().domain,
-                issue.task.course.get_absolute_url(),
-                issue.student.get_full_name(),
-                issue.student.get_absolute_url(),
-                issue.get_absolute_url()
-            )
-
-            draft = draft.update(summary=summary,
-                                 description=description,
-                                 description_text_type='markdown',
-                                 target=settings.RB_API_USERNAME, public=True,
-                                 target_groups='teachers_{0}'.format(issue.task.course.pk),
-                                 target_people=issue.student.username
-                                 )
-            return review_request.id
-
-    # def get_or_create_review_request(self):
-    #     root = self.client.get_root()
-
-    #     review_request = None
-    #     try:
-    #         review_id = self.event.issue.get_byname('review_id')
-    #         review_request = root.get_review_request(review_request_id=review_id)
-    #     except (AttributeError, ValueError):
-    #         course_id = self.event.issue.task.course.id
-    #         repository_name = str(self.event.issue.id)
-    #         os.symlink(settings.RB_SYMLINK_DIR,os.path.join(settings.RB_SYMLINK_DIR, repository_name))
-    #         repository = root.get_repositories().create(
-    #                  name=repository_name,
-    #                  path=settings.RB_SYMLINK_DIR+repository_name+'/.git',
-    #                  tool='Git',
-    #                  public=False)
-    #         root.get_repository(repository_id=repository.id).update(grant_type='add',
-    #                                                   grant_entity='user',
-    #                                                   grant_name=self.event.author)
-    #         root.get_repository(repository_id=repository.id).update(grant_type='add',
-    #                                                   grant_entity='group',
-    #                                                   grant_name='teachers')
-    #         root.get_repository(repository_id=repository.id).update(grant_type='add',
-    #                                                   grant_entity='group',
-    #                                                   grant_name='teachers_{0}'.format(course_id))
-
-    #         review_request = root.get_review_requests().create(repository=repository.id)
-    #     self.event.issue.set_byname('review_id', review_request.id, self.event.author)
-    #     return review_request
-
-    def get_review_request(self):
-        root = self.client.get_root()
-
-        review_request = None
+            self.upload_diff(review_request_id, files_diff)
+
+        issue = self.event.issue
+        task_title = issue.task.get_title(issue.student.profile.language)
+        summary = u'[{0}][{1}] {2}'.format(issue.student.get_full_name(),
+                                           issue.task.course.get_user_group(issue.student),
+                                           task_title)
+
+        description_template = \
+            _(u'zadacha') + ': "{0}", ' + \
+            _(u'kurs') + ': [{1}]({2}{3})\n' + \
+            _(u'student') + ': [{4}]({2}{5})\n' + '[' + \
+            _(u'obsuzhdenie_zadachi') + ']({2}{6})'
+
+        description = description_template.format(
+            task_title,
+            issue.task.course,
+            Site.objects.get_current().domain,
+            issue.task.course.get_absolute_url(),
+            issue.student.get_full_name(),
+            issue.student.get_absolute_url(),
+            issue.get_absolute_url()
+        )
+
+        # the diff upload has created the draft
+        api_request('put', 'review-requests/{0}/draft/'.format(review_request_id), data={
+            'summary': summary,
+            'description': description,
+            'description_text_type': 'markdown',
+            'target': settings.RB_API_USERNAME,
+            'public': 'true',
+            'target_groups': 'teachers_{0}'.format(issue.task.course.pk),
+            'target_people': issue.student.username,
+        })
+        return review_request_id
+
+    def get_review_request_id(self):
         try:
             review_id = self.event.issue.get_byname('review_id')
         except (AttributeError, ValueError):
             logger.info("Issue '%s' has not review_id.", self.event.issue.id)
             return None
+        return int(review_id) if review_id else None
+
+    def upload_diff(self, review_request_id, files_diff):
+        """
+        Returns: False if there is no such review request
+        """
         try:
-            review_request = root.get_review_request(review_request_id=review_id)
-            return review_request
-        except Exception as e:
-            logger.info("Issue '%s' has not RB review_request. Exception: '%s'.", self.event.issue.id, e)
-            return None
+            api_request('post', 'review-requests/{0}/diffs/'.format(review_request_id),
+                        files={'path': ('diff', files_diff.encode('utf-8'))})
+        except ReviewBoardError as e:
+            if e.status_code != 404:
+                raise
+            logger.info("Issue '%s' has not RB review_request %s.", self.event.issue.id, review_request_id)
+            return False
+        return True
 
     def call_symlink_creator(self, repo_id):
         if not settings.RB_SYMLINK_SERVICE_URL:
             return
 
         url = settings.RB_SYMLINK_SERVICE_URL + "/" + str(repo_id)
-        response = requests.get(url)
+        # not the Review Board session, its credentials are not for this service
+        response = requests.get(url, timeout=settings.RB_API_TIMEOUT)
         response.raise_for_status()
 
     def create_review_request(self):
-        root = self.client.get_root()
-
-        review_request = None
-        course_id = self.event.issue.task.course.id
-        repository_name = str(self.event.issue.id)
-        repository_path = os.path.join(settings.RB_SYMLINK_DIR, repository_name)
-
         try:
-
-            repository = None
-            try:
-                repository = root.get_repositories().create(
-                    name=repository_name,
-                    path=os.path.join(repository_path, '.git'),
-                    tool='Git',
-                    public=False)
-            except Exception:
-                logger.warning("Cant create repository '%s', trying to find it", repository_name)
-                repository = self.get_repository(repository_name)
-
-            if repository is None:
-                raise Exception("Cant find repository '%s', trying to find it", repository_name)
-
-            root.get_repository(repository_id=repository.id).update(grant_type='add',
-                                                                    grant_entity='user',
-                                                                    grant_name=self.event.issue.student)
-            root.get_repository(repository_id=repository.id).update(grant_type='add',
-                                                                    grant_entity='group',
-                                                                    grant_name='teachers_{0}'.format(course_id))
-
-            review_request = root.get_review_requests().create(repository=repository.id)
-            self.event.issue.set_byname('review_id', review_request.id, self.event.author)
+            repository_id = self.get_or_create_repository()
+            review_request = api_request('post', 'review-requests/', data={'repository': repository_id}).json()
+            review_request_id = review_request['review_request']['id']
+            self.event.issue.set_byname('review_id', review_request_id, self.event.author)
         except Exception as e:
             logger.exception("Exception while creating review_request. Exception: '%s'. Issue: '%s'", e,
                              self.event.issue.id)
             return None
 
-        return review_request
+        return review_request_id
 
-    def get_repository(self, name):
-        root = self.client.get_root()
+    def get_or_create_repository(self):
+        repository_name = str(self.event.issue.id)
+        key = REPOSITORY_KEY.format(repository_name)
+        repository_id = cache.get(key)
+        if repository_id is not None:
+            return repository_id
 
-        repositories = root.get_repositories()
+        self.call_symlink_creator(self.event.issue.id)
+        repository_path = os.path.join(settings.RB_SYMLINK_DIR, repository_name)
         try:
-            while True:
-                for repo in repositories:
-                    if repo.name == name:
-                        return repo
-                repositories = repositories.get_next()
-        except StopIteration:
-            return None
+            repository = api_request('post', 'repositories/', data={
+                'name': repository_name,
+                'path': os.path.join(repository_path, '.git'),
+                'tool': 'Git',
+                'public': 'false',
+            }).json()
+            repository_id = repository['repository']['id']
+        except ReviewBoardError:
+            logger.warning("Cant create repository '%s', trying to find it", repository_name)
+            repository_id = self.get_repository_id(repository_name)
+            if repository_id is None:
+                raise Exception("Cant find repository '{0}'".format(repository_name))
 
+        course_id = self.event.issue.task.course.id
+        for grant_entity, grant_name in (('user', self.event.issue.student),
+                                         ('group', 'teachers_{0}'.format(course_id))):
+            api_request('put', 'repositories/{0}/'.format(repository_id), data={
+                'grant_type': 'add',
+                'grant_entity': grant_entity,
+                'grant_name': grant_name,
+            })
+
+        cache.set(key, repository_id, None)
+        return repository_id
+
+    def get_repository_id(self, name):
+        repositories = api_request('get', 'repositories/', params={'name': name}).json()['repositories']
+        for repo in repositories:
+            if repo['name'] == name:
+                return repo['id']
         return None
 
 
@@ -239,13 +274,13 @@ class RbReviewGroup(object):
             'invite_only': True,
             'name': self.review_group_name,
         }
-        r = requests.post(url, auth=(settings.RB_API_USERNAME, settings.RB_API_PASSWORD), data=payload)
+        r = get_session().post(url, data=payload, timeout=settings.RB_API_TIMEOUT)
         logger.info("RevewBoard create for '%s' : '%s' : '%s'", self.review_group_name, r.status_code, r.content)
         assert r.status_code in (200, 201, 223, 409)
 
     def list(self):
         url = settings.RB_API_URL + "/api/groups/{0}/users/".format(self.review_group_name)
-        r = requests.get(url, auth=(settings.RB_API_USERNAME, settings.RB_API_PASSWORD))
+        r = get_session().get(url, timeout=settings.RB_API_TIMEOUT)
         logger.info("RevewBoard list for '%s' : '%s'", self.review_group_name, r.content)
         for user in r.json()["users"]:
             yield user["username"]
@@ -255,14 +290,14 @@ class RbReviewGroup(object):
         payload = {
             'username': username,
         }
-        r = requests.post(url, auth=(settings.RB_API_USERNAME, settings.RB_API_PASSWORD), data=payload)
+        r = get_session().post(url, data=payload, timeout=settings.RB_API_TIMEOUT)
         logger.info("ReviewGroup user_add Add '%s' to '%s. Status:'%s'",
                     username, self.review_group_name, r.status_code)
         assert r.status_code in (200, 201, 204)
 
     def user_del(self, username):
         url = settings.RB_API_URL + "/api/groups/{0}/users/{1}/".format(self.review_group_name, username)
-        r = requests.delete(url, auth=(settings.RB_API_USERNAME, settings.RB_API_PASSWORD))
+        r = get_session().delete(url, timeout=settings.RB_API_TIMEOUT)
         logger.info("ReviewGroup user_del Drop '%s' from '%s'. Status:'%s'",
                     username, self.review_group_name, r.status_code)
         assert r.status_code in (200, 201, 204)
@@ -348,4 +383,4 @@ class RbReviewGroup(object):
 
 def update_status_review_request(review_id, status):
     url = settings.RB_API_URL + '/api/review-requests/' + review_id + '/'
-    requests.put(url, data={'status': status}, auth=(settings.RB_API_USERNAME, settings.RB_API_PASSWORD))
+    get_session().put(url, data={'status': status}, timeout=settings.RB_API_TIMEOUT)
@@ -1,6 +1,19 @@
 import os
 
-from django.test import TestCase
+from mock import Mock, patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from courses.models import Course
+from issues.model_issue_field import IssueField
+from issues.models import Issue, Event, File
+from tasks.models import Task
+from years.models import Year
+from anyrb.common import AnyRB
 from .unpacker import UnpackedFile, unpack_files
 
 CUR_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -60,3 +73,68 @@ class UnpackerTest(TestCase):
             self.assertTrue(all(map(lambda x: os.path.exists(x.path), unpacked_files)))
 
         self.assertFalse(any(map(lambda x: os.path.exists(x.path), unpacked_files)))  # check all files dropped
+
+
+class AnyRBTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create_user(username='student', password='password')
+        self.year = Year.objects.create(start_year=2016)
+        self.course = Course.objects.create(name='course_name', year=self.year)
+        self.task = Task.objects.create(title='task_title', course=self.course, score_max=10)
+        self.issue = Issue.objects.create(task_id=self.task.id, student_id=self.student.id)
+
+    def create_event(self, content):
+        event = Event.objects.create(issue=self.issue, author=self.student,
+                                     field=IssueField.objects.get(name='file'))
+        File.objects.create(file=SimpleUploadedFile('test_rb.py', content), event=event)
+        return event
+
+    def get_session_mock(self):
+        responses = {
+            ('post', 'repositories/'): {'repository': {'id': 3}},
+            ('post', 'review-requests/'): {'review_request': {'id': 5}},
+        }
+
+        def request(method, url, **kwargs):
+            response = Mock(status_code=200)
+            response.json.return_value = responses.get((method, url[len(settings.RB_API_URL + '/api/'):]), {})
+            return response
+
+        session = Mock()
+        session.request.side_effect = request
+        return session
+
+    def test_upload_review(self):
+        session = self.get_session_mock()
+        with patch('anyrb.common.get_session', return_value=session), \
+                patch('magic.from_buffer', return_value='text/x-python') as from_buffer_mock:
+            self.assertEqual(AnyRB(self.create_event(b'print(1)\n')).upload_review(), 5)
+            self.assertEqual(self.issue.get_byname('review_id'), '5')
+            calls = [(x[0][0], x[0][1][len(settings.RB_API_URL):]) for x in session.request.call_args_list]
+            self.assertListEqual(calls, [
+                ('post', '/api/repositories/'),
+                ('put', '/api/repositories/3/'),
+                ('put', '/api/repositories/3/'),
+                ('post', '/api/review-requests/'),
+                ('post', '/api/review-requests/5/diffs/'),
+                ('put', '/api/review-requests/5/draft/'),
+            ])
+            diff = session.request.call_args_list[4][1]['files']['path'][1]
+            self.assertEqual(diff, b'diff --git a/test_rb.py b/test_rb.py\n--- /dev/null\n+++ b/test_rb.py\n'
+                                   b'@@ -0,0 +1 @@\n+print(1)')
+
+            # the same file again: the review request is known, the diff is cached
+            session.request.reset_mock()
+            self.assertEqual(AnyRB(self.create_event(b'print(1)\n')).upload_review(), 5)
+            self.assertEqual(session.request.call_count, 2)
+            self.assertEqual(from_buffer_mock.call_count, 1)
+
+    @override_settings(RB_SYMLINK_SERVICE_URL='http://symlink')
+    def test_call_symlink_creator(self):
+        session = self.get_session_mock()
+        with patch('anyrb.common.get_session', return_value=session), \
+                patch('anyrb.common.requests.get') as get_mock:
+            AnyRB(self.create_event(b'print(1)\n')).call_symlink_creator(3)
+        get_mock.assert_called_once_with('http://symlink/3', timeout=settings.RB_API_TIMEOUT)
+        self.assertFalse(session.method_calls)
@@ -2,21 +2,22 @@
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext as _
-from issues.models import Issue
+from issues.models import IssueFieldValue
 
 
 @csrf_exempt
 def message_from_rb(request, review_id):
-    for one_issue in Issue.objects.filter(task__rb_integrated=True).order_by('-update_time'):
-        try:
-            if one_issue.get_byname('review_id') == review_id:
-                issue = one_issue
-                break
-        except:  # noqa
-            pass
+    field_value = IssueFieldValue.objects \
+        .filter(field__name='review_id', value=review_id, issue__task__rb_integrated=True) \
+        .select_related('issue') \
+        .order_by('-issue__update_time') \
+        .first()
+    if field_value is None:
+        raise Http404
+    issue = field_value.issue
 
     if request.method == 'POST':
         value = {'files': [], 'comment': ''}
@@ -1,16 +1,21 @@
 from __future__ import unicode_literals
 
 import base64
+import datetime
 import json
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from courses.models import Course
 from issues.model_issue_status import IssueStatus
-from issues.models import Issue, IssueField, File
+from issues.models import Event, Issue, IssueField, IssueFieldValue, File
 from tasks.models import Task
 from users.models import Group
 from years.models import Year
@@ -265,6 +270,124 @@ class ApiTest(TestCase):
 
         self.assertEqual(issues_list, response_data)
 
+    def test_get_issues__pages(self):
+        path = reverse(api.views.get_issues, kwargs={"course_id": self.course.id})
+
+        response = self._request(self.teacher, self.teacher_password, path=path + "?limit=1&fields=id,mark")
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(json.loads(response.content), [{'id': self.issue1.id, 'mark': 0.0}])
+
+        response = self._request(self.teacher, self.teacher_password,
+                                 path=path + "?limit=1&fields=id&after_id={}".format(self.issue1.id))
+        self.assertListEqual(json.loads(response.content), [{'id': self.issue2.id}])
+
+        response = self._request(self.teacher, self.teacher_password,
+                                 path=path + "?limit=1&fields=id&after_id={}".format(self.issue2.id))
+        self.assertListEqual(json.loads(response.content), [])
+
+        response = self._request(self.teacher, self.teacher_password, path=path + "?limit=0")
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_issues__updated_since(self):
+        path = reverse(api.views.get_issues, kwargs={"course_id": self.course.id}) + "?fields=id&updated_since="
+        Issue.objects.filter(id=self.issue1.id).update(update_time="2020-01-01T00:00:00Z")
+
+        response = self._request(self.teacher, self.teacher_password, path=path + "2021-01-01T00:00:00")
+        self.assertListEqual(json.loads(response.content), [{'id': self.issue2.id}])
+
+        response = self._request(self.teacher, self.teacher_password, path=path + "2019-12-31T23:00:00Z")
+        self.assertListEqual(json.loads(response.content), [{'id': self.issue1.id}, {'id': self.issue2.id}])
+
+        response = self._request(self.teacher, self.teacher_password, path=path + "yesterday")
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_issues__queries_do_not_depend_on_events(self):
+        path = reverse(api.views.get_issues, kwargs={"course_id": self.course.id}) + "?add_events=1"
+        self._request(self.teacher, self.teacher_password, path=path)
+
+        with CaptureQueriesContext(connection) as queries:
+            self._request(self.teacher, self.teacher_password, path=path)
+        queries_count = len(queries)
+
+        for i in range(3):
+            event = self.issue2.add_comment("Comment {}".format(i), author=self.teacher)
+            File.objects.create(file=SimpleUploadedFile('file{}.py'.format(i), b'print 1'), event=event)
+            self.issue2.followers.add(self.teacher)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._request(self.teacher, self.teacher_password, path=path)
+        self.assertEqual(len(json.loads(response.content)[1]['events']), 3)
+        self.assertEqual(len(queries), queries_count)
+
+    def test_get_issues__stream(self):
+        path = reverse(api.views.get_issues, kwargs={"course_id": self.course.id}) + "?add_events=1"
+        response = self._request(self.teacher, self.teacher_password, path=path)
+        expected = json.loads(response.content)
+
+        with self.settings(API_STREAM_CHUNK_SIZE=1):
+            response = self._request(self.teacher, self.teacher_password, path=path + "&stream=1")
+            self.assertTrue(response.streaming)
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+            response = self._request(self.teacher, self.teacher_password, path=path + "&stream=ndjson&limit=1")
+            lines = b''.join(response.streaming_content).decode('utf8').splitlines()
+            self.assertEqual([json.loads(line) for line in lines], expected[:1])
+
+    @override_settings(API_EVENTS_FEED_LAG=0)
+    def test_get_events(self):
+        path = reverse(api.views.get_events) + "?course_id={}".format(self.course.id)
+        response = self._request(self.teacher, self.teacher_password, path=path)
+        self.assertEqual(response.status_code, 200)
+
+        response_data = json.loads(response.content)
+        self.assertEqual(len(response_data), 1)
+        event = response_data[0]
+        self.assertEqual(event['field'], 'comment')
+        self.assertEqual(event['issue']['id'], self.issue1.id)
+        self.assertEqual(event['issue']['task'], {'id': self.task1.id, 'title': 'task_title1'})
+        self.assertEqual(event['issue']['student']['username'], 'student')
+        self.assertEqual(event['files'][0]['filename'], 'test_fail_rb.py')
+
+        new_event = self.issue2.add_comment("New comment", author=self.teacher)
+        self.issue2.set_byname('mark', 3, author=self.teacher)
+        response = self._request(self.teacher, self.teacher_password,
+                                 path=path + "&field=comment&since_id={}".format(event['id']))
+        self.assertEqual([x['id'] for x in json.loads(response.content)], [new_event.id])
+
+        response = self._request(self.teacher, self.teacher_password, path=path + "&limit=1&since_id=0")
+        self.assertEqual([x['id'] for x in json.loads(response.content)], [event['id']])
+
+    def test_get_events__late_commit(self):
+        path = reverse(api.views.get_events) + "?course_id={}&field=comment".format(self.course.id)
+        since_id = Event.objects.latest('id').id
+        comment_field = IssueField.objects.get(name='comment')
+
+        # the request which took since_id + 1 commits after the one which took since_id + 2
+        committed = Event.objects.create(id=since_id + 2, issue=self.issue2, field=comment_field, value='first',
+                                         author=self.teacher)
+        response = self._request(self.teacher, self.teacher_password, path=path + "&since_id={}".format(since_id))
+        self.assertListEqual(json.loads(response.content), [])
+
+        late = Event.objects.create(id=since_id + 1, issue=self.issue2, field=comment_field, value='late',
+                                    author=self.teacher)
+        Event.objects.filter(id__in=[late.id, committed.id]).update(
+            timestamp=timezone.now() - datetime.timedelta(seconds=settings.API_EVENTS_FEED_LAG + 1))
+        response = self._request(self.teacher, self.teacher_password, path=path + "&since_id={}".format(since_id))
+        self.assertEqual([x['id'] for x in json.loads(response.content)], [late.id, committed.id])
+
+    def test_get_events__no_access(self):
+        response = self._request(self.student, self.student_password,
+                                 path=reverse(api.views.get_events) + "?course_id={}".format(self.course.id))
+        self.assertEqual(response.status_code, 403)
+
+        response = self._request(self.student, self.student_password, path=reverse(api.views.get_events))
+        self.assertListEqual(json.loads(response.content), [])
+
+    def test_get_events__bad_request(self):
+        for query in ("?course_id=abc", "?since_id=abc", "?limit=0"):
+            response = self._request(self.teacher, self.teacher_password, path=reverse(api.views.get_events) + query)
+            self.assertEqual(response.status_code, 400)
+
     def test_get_issues__not_teacher(self):
         response = self._request(self.student, self.student_password,
                                  path=reverse(api.views.get_issues, kwargs={"course_id": self.course.id}))
@@ -591,6 +714,41 @@ class ApiTest(TestCase):
     def test_post_issue__status_tag(self):
         self.test_post_issue__status(self.course.issue_status_system.statuses.all().order_by("-id")[0].tag)
 
+    def test_post_issues(self):
+        other_course = Course.objects.create(name='other_course', year=self.year)
+        other_task = Task.objects.create(title='other_task', course=other_course, score_max=10)
+        other_issue = Issue.objects.create(task_id=other_task.id, student_id=self.student.id)
+
+        items = [
+            {"issue_id": self.issue1.id, "status": "accepted", "mark": 5},
+            {"issue_id": self.issue2.id, "comment": "Bulk comment", "mark": "bad"},
+            {"issue_id": self.issue2.id, "comment": "Bulk comment", "mark": {"value": 1}},
+            {"issue_id": self.issue2.id, "comment": "Bulk comment"},
+            {"issue_id": other_issue.id, "mark": 1},
+            {"issue_id": 100500, "mark": 1},
+        ]
+        response = self._request(self.teacher, self.teacher_password, path=reverse(api.views.post_issues),
+                                 method=self.client.post, data=json.dumps(items), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        response_data = json.loads(response.content)
+        self.assertEqual([x['status_code'] for x in response_data], [200, 400, 400, 200, 403, 404])
+        self.assertEqual(response_data[0]['issue']['mark'], 5)
+        self.assertEqual(response_data[0]['issue']['status']['tag'], 'accepted')
+
+        issue1 = Issue.objects.get(id=self.issue1.id)
+        self.assertEqual(issue1.mark, 5)
+        self.assertEqual(issue1.status_field.tag, 'accepted')
+        self.assertEqual(IssueFieldValue.objects.get(issue=issue1, field__name='mark').value, '5')
+        self.assertEqual(Issue.objects.get(id=self.issue2.id).get_byname('comment'),
+                         '<div class="contest-response-comment not-sanitize">Bulk comment</div>')
+        self.assertEqual(Issue.objects.get(id=other_issue.id).mark, 0)
+
+    def test_post_issues__bad_request(self):
+        response = self._request(self.teacher, self.teacher_password, path=reverse(api.views.post_issues),
+                                 method=self.client.post, data='{"issue_id": 1}', content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
     def test_post_issue__no_access(self):
         response = self._request(self.anytask, self.anytask_password,
                                  path=reverse(api.views.get_or_post_issue, kwargs={"issue_id": self.issue1.id}),
@@ -6,10 +6,14 @@ urlpatterns = [
         name="api.views.get_issue_statuses"),
     url(r'^v1/course/(?P<course_id>\d+)/issues$', api.views.get_issues,
         name="api.views.get_issues"),
+    url(r'^v1/issues$', api.views.post_issues,
+        name="api.views.post_issues"),
     url(r'^v1/issue/(?P<issue_id>\d+)/add_comment$', api.views.add_comment,
         name="api.views.add_comment"),
     url(r'^v1/issue/(?P<issue_id>\d+)$', api.views.get_or_post_issue,
         name="api.views.get_or_post_issue"),
+    url(r'^v1/events$', api.views.get_events,
+        name="api.views.get_events"),
     url(r'^v1/check_user$', api.views.check_user,
         name="api.views.check_user"),
 ]
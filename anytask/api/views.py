@@ -1,19 +1,34 @@
 from __future__ import unicode_literals
 
 import base64
+import datetime
 import json
 
 from django.conf import settings
 from django.contrib.auth import authenticate
-from django.http import HttpResponse, HttpResponseForbidden, HttpResponseBadRequest, HttpResponseNotFound
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseBadRequest, HttpResponseNotFound, \
+    StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
 from courses.models import Course
-from issues.models import Issue
+from issues.models import Issue, Event
+from issues.model_issue_field import IssueField
+from issues.model_issue_status import IssueStatus
 from users.models import UserProfile
 
+STREAM_FORMATS = ('1', 'json', 'ndjson')
+
+EVENTS_LIMIT = 1000
+
+BULK_UPDATE_LIMIT = 1000
+
 ISSUE_FILTER = {
     'student': 'student__username',
     'responsible': 'responsible__username'
@@ -67,27 +82,56 @@ def unpack_task(task, lang=settings.API_LANGUAGE_CODE):
     }
 
 
-def unpack_issue(issue, add_events=False, request=None, lang=settings.API_LANGUAGE_CODE):
+def unpack_issue(issue, add_events=False, request=None, lang=settings.API_LANGUAGE_CODE, fields=None):
+    """
+    fields limits the result to given keys, other values are not computed at all
+    """
     task = issue.task
-    ret = {
-        "id": issue.id,
-        "mark": issue.mark,
-        "create_time": issue.create_time.isoformat(),
-        "update_time": issue.update_time.isoformat(),
-        "responsible": None,
-        "followers": list(map(lambda x: unpack_user(x), issue.followers.all())),
-        "status": unpack_status(issue.status_field, lang),
-        "student": unpack_user(issue.student),
-        "task": unpack_task(task)
+    unpackers = {
+        "id": lambda: issue.id,
+        "mark": lambda: issue.mark,
+        "create_time": lambda: issue.create_time.isoformat(),
+        "update_time": lambda: issue.update_time.isoformat(),
+        "responsible": lambda: unpack_user(issue.responsible) if issue.responsible else None,
+        "followers": lambda: list(map(lambda x: unpack_user(x), issue.followers.all())),
+        "status": lambda: unpack_status(IssueStatus.registry.get(id=issue.status_field_id), lang),
+        "student": lambda: unpack_user(issue.student),
+        "task": lambda: unpack_task(task),
     }
 
-    if issue.responsible:
-        ret["responsible"] = unpack_user(issue.responsible)
-
     if add_events and request:
-        ret["events"] = list(map(lambda x: unpack_event(request, x), issue.get_history()))
+        unpackers["events"] = lambda: list(map(lambda x: unpack_event(request, x), get_issue_events(issue)))
 
-    return ret
+    return dict((name, unpack()) for name, unpack in unpackers.items() if fields is None or name in fields)
+
+
+def get_issue_events(issue):
+    if hasattr(issue, 'api_events'):
+        return issue.api_events
+    return issue.get_history()
+
+
+def prefetch_issues(issues, add_events=False, fields=None):
+    """
+    Loads everything unpack_issue needs for a page of issues with a fixed number of queries
+    """
+    def need(name):
+        return fields is None or name in fields
+
+    issues = issues.select_related("task")
+    if need("student"):
+        issues = issues.select_related("student", "student__profile")
+    if need("responsible"):
+        issues = issues.select_related("responsible", "responsible__profile")
+    if need("followers"):
+        issues = issues.prefetch_related(
+            Prefetch("followers", queryset=User.objects.select_related("profile"))
+        )
+    if add_events and need("events"):
+        issues = issues.prefetch_related(
+            Prefetch("event_set", queryset=Issue.get_history_events(), to_attr="api_events")
+        )
+    return issues
 
 
 def unpack_file(request, f):
@@ -121,12 +165,18 @@ def unpack_event(request, event):
         "author": unpack_user(event.author),
         "message": event.get_message(),
         # "files": list(event.file_set.all())
-        "files": list(map(lambda x: unpack_file(request, x), event.file_set.filter(deleted=False))),
+        "files": list(map(lambda x: unpack_file(request, x), get_event_files(event))),
     }
 
     return ret
 
 
+def get_event_files(event):
+    if hasattr(event, 'files'):
+        return event.files
+    return event.file_set.filter(deleted=False)
+
+
 def unpack_status(status, lang=settings.API_LANGUAGE_CODE):
     return {
         "id": status.id,
@@ -159,9 +209,77 @@ def get_issue_filter(data):
     return filter_args
 
 
+def iter_by_id_chunks(objects, limit=None, chunk_size=None):
+    """
+    Iterates queryset ordered by id loading API_STREAM_CHUNK_SIZE rows at a time.
+    Unlike QuerySet.iterator() keeps prefetch_related working for every chunk.
+    """
+    if chunk_size is None:
+        chunk_size = settings.API_STREAM_CHUNK_SIZE
+
+    count = 0
+    last_id = None
+    while limit is None or count < limit:
+        chunk_objects = objects if last_id is None else objects.filter(id__gt=last_id)
+        size = chunk_size if limit is None else min(chunk_size, limit - count)
+        chunk = list(chunk_objects[:size])
+        for obj in chunk:
+            yield obj
+        if len(chunk) < size:
+            return
+        count += len(chunk)
+        last_id = chunk[-1].id
+
+
+def make_streaming_response(items, ndjson=False):
+    """
+    Streams items as JSON array or, for ndjson, as one JSON document per line
+    """
+    def iter_json():
+        yield "["
+        for i, item in enumerate(items):
+            yield (", " if i else "") + json.dumps(item)
+        yield "]"
+
+    def iter_ndjson():
+        for item in items:
+            yield json.dumps(item) + "\n"
+
+    if ndjson:
+        return StreamingHttpResponse(iter_ndjson(), content_type="application/x-ndjson")
+    return StreamingHttpResponse(iter_json(), content_type="application/json")
+
+
+def get_issues_page_args(data):
+    """
+    :returns after_id, limit, updated_since from request data, raises ValueError on bad values
+    """
+    after_id = int(data['after_id']) if 'after_id' in data else None
+    limit = int(data['limit']) if 'limit' in data else None
+    if limit is not None and limit <= 0:
+        raise ValueError("limit must be positive")
+
+    updated_since = None
+    if 'updated_since' in data:
+        updated_since = parse_datetime(data['updated_since'])
+        if updated_since is None:
+            raise ValueError("updated_since is not a datetime")
+        if timezone.is_naive(updated_since):
+            updated_since = timezone.make_aware(updated_since)
+
+    return after_id, limit, updated_since
+
+
 @login_required_basic_auth
 @require_http_methods(['GET'])
 def get_issues(request, course_id):
+    """
+    Issues of the course ordered by id. Optional arguments:
+        after_id, limit - page of issues with id > after_id; id of the last one is a cursor to the next page
+        updated_since - only issues changed since this ISO datetime
+        fields - comma separated keys of issue to return
+        stream - send response while reading issues in chunks, as JSON array (stream=1) or ndjson (stream=ndjson)
+    """
     course = get_object_or_404(Course, id=course_id)
     user = request.user
     if not course.user_is_teacher(user):
@@ -169,15 +287,93 @@ def get_issues(request, course_id):
 
     add_events = bool(request.GET.get("add_events", False))
     filter_args = get_issue_filter(request.GET)
+    fields = set(request.GET['fields'].split(',')) if request.GET.get('fields') else None
+    try:
+        after_id, limit, updated_since = get_issues_page_args(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    issues = Issue.objects.filter(task__course=course, **filter_args)
+    if after_id is not None:
+        issues = issues.filter(id__gt=after_id)
+    if updated_since is not None:
+        issues = issues.filter(update_time__gte=updated_since)
+    issues = prefetch_issues(issues.order_by("id"), add_events=add_events, fields=fields)
 
-    ret = []
-    issues = Issue.objects \
-        .filter(task__course=course, **filter_args) \
-        .select_related("task") \
-        .prefetch_related("followers")
     lang = request.GET.get('lang', settings.API_LANGUAGE_CODE)
-    for issue in issues:
-        ret.append(unpack_issue(issue, add_events=add_events, request=request, lang=lang))
+    stream = request.GET.get('stream')
+    if stream not in STREAM_FORMATS:
+        stream = None
+    if stream:
+        issues = iter_by_id_chunks(issues, limit=limit)
+    elif limit is not None:
+        issues = issues[:limit]
+
+    ret = map(lambda x: unpack_issue(x, add_events=add_events, request=request, lang=lang, fields=fields), issues)
+    if stream:
+        return make_streaming_response(ret, ndjson=stream == 'ndjson')
+
+    return HttpResponse(json.dumps(list(ret)),
+                        content_type="application/json")
+
+
+def unpack_feed_event(request, event, lang=settings.API_LANGUAGE_CODE):
+    issue = event.issue
+    ret = unpack_event(request, event)
+    ret["field"] = event.get_field().name
+    ret["issue"] = {
+        "id": issue.id,
+        "student": unpack_user(issue.student),
+        "task": unpack_task(issue.task, lang),
+    }
+    return ret
+
+
+@login_required_basic_auth
+@require_http_methods(['GET'])
+def get_events(request):
+    """
+    Feed of issue events ordered by id. Arguments:
+        since_id - only events with id > since_id; id of the last one is the next since_id.
+                   Events younger than API_EVENTS_FEED_LAG seconds are left for the next request:
+                   their ids are taken at insert, but a slow request may commit after an event with a bigger id.
+        course_id - events of one course, otherwise of all courses the user teaches
+        field - only events of the issue field with this name, e.g. comment
+        limit - at most EVENTS_LIMIT events
+    """
+    user = request.user
+    try:
+        since_id = int(request.GET.get('since_id', 0))
+        limit = min(int(request.GET.get('limit', EVENTS_LIMIT)), EVENTS_LIMIT)
+        course_id = int(request.GET['course_id']) if 'course_id' in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest()
+    if limit <= 0:
+        return HttpResponseBadRequest()
+
+    settled_time = timezone.now() - datetime.timedelta(seconds=settings.API_EVENTS_FEED_LAG)
+    events = Issue.get_history_events().filter(id__gt=since_id, timestamp__lt=settled_time)
+
+    if course_id is not None:
+        course = get_object_or_404(Course, id=course_id)
+        if not course.user_is_teacher(user):
+            return HttpResponseForbidden()
+        events = events.filter(issue__task__course=course)
+    elif not (user.is_superuser or user.is_staff):
+        events = events.filter(issue__task__course__in=user.course_teachers_set.all())
+
+    if 'field' in request.GET:
+        fields = IssueField.registry.filter(name=request.GET['field'])
+        if not fields:
+            return HttpResponseBadRequest()
+        events = events.filter(field_id__in=[field.id for field in fields])
+
+    events = events \
+        .select_related("issue", "issue__task", "issue__student", "issue__student__profile") \
+        .order_by("id")[:limit]
+
+    lang = request.GET.get('lang', settings.API_LANGUAGE_CODE)
+    ret = [unpack_feed_event(request, event, lang) for event in events]
 
     return HttpResponse(json.dumps(ret),
                         content_type="application/json")
@@ -185,36 +381,50 @@ def get_issues(request, course_id):
 
 def get_issue(request, issue):
     lang = request.GET.get('lang', settings.API_LANGUAGE_CODE)
+    issue.api_events = issue.load_history()
     ret = unpack_issue(issue, add_events=True, request=request, lang=lang)
 
     return HttpResponse(json.dumps(ret),
                         content_type="application/json")
 
 
-def post_issue(request, issue):
-    user = request.user
+def update_issue(issue, data, user, is_teacher):
+    """
+    Applies status, mark and comment from data, raises ValueError or TypeError on bad mark
+    """
+    if is_teacher:
+        mark = data.get('mark')
+        if mark:
+            mark = float(mark)
 
-    if issue.task.course.user_is_teacher(user):
-        status = request.POST.get('status')
+        status = data.get('status')
         if status:
+            status = str(status)
             if status.isdigit():
                 issue.set_status_by_id(status, user)
             else:
                 issue.set_status_by_tag(status, user)
 
-        mark = request.POST.get('mark')
         if mark:
-            try:
-                issue.set_byname('mark', float(mark))
-            except ValueError:
-                return HttpResponseBadRequest()
+            issue.set_byname('mark', mark)
 
-    comment = request.POST.get('comment')
+    comment = data.get('comment')
     if comment:
         issue.add_comment(comment, author=user)
 
+
+def post_issue(request, issue):
+    user = request.user
+
+    try:
+        update_issue(issue, request.POST, user, issue.task.course.user_is_teacher(user))
+    except ValueError:
+        return HttpResponseBadRequest()
+
     lang = request.POST.get('lang', settings.API_LANGUAGE_CODE)
-    ret = unpack_issue(get_object_or_404(Issue, id=issue.id), add_events=True, request=request, lang=lang)
+    issue = get_object_or_404(Issue, id=issue.id)
+    issue.api_events = issue.load_history()
+    ret = unpack_issue(issue, add_events=True, request=request, lang=lang)
 
     return HttpResponse(json.dumps(ret),
                         content_type="application/json")
@@ -234,6 +444,74 @@ def get_or_post_issue(request, issue_id):
     return get_issue(request, issue)
 
 
+@csrf_exempt
+@login_required_basic_auth
+@require_http_methods(['POST'])
+def post_issues(request):
+    """
+    Applies a JSON list of {"issue_id", "status", "mark", "comment"} in one transaction,
+    new events are inserted in bulk. Returns a list of {"issue_id", "status_code"} in the same order,
+    with "issue" {"id", "mark", "status"} for applied items.
+    """
+    try:
+        items = json.loads(request.body.decode('utf8'))
+        if not isinstance(items, list) or len(items) > BULK_UPDATE_LIMIT:
+            raise ValueError("expected a list of at most {0} items".format(BULK_UPDATE_LIMIT))
+        issue_ids = [int(item['issue_id']) for item in items]
+    except (ValueError, TypeError, KeyError):
+        return HttpResponseBadRequest()
+
+    user = request.user
+    issues = Issue.objects \
+        .select_related("task", "task__course", "task__parent_task", "status_field") \
+        .prefetch_related("followers") \
+        .in_bulk(issue_ids)
+    course_x_is_teacher = {}
+
+    ret = []
+    events = []
+    lang = request.GET.get('lang', settings.API_LANGUAGE_CODE)
+    with transaction.atomic():
+        for issue_id, item in zip(issue_ids, items):
+            issue = issues.get(issue_id)
+            if issue is None:
+                ret.append({"issue_id": issue_id, "status_code": 404})
+                continue
+
+            course = issue.task.course
+            if course.id not in course_x_is_teacher:
+                course_x_is_teacher[course.id] = course.user_is_teacher(user)
+            is_teacher = course_x_is_teacher[course.id]
+            if not (is_teacher or user.id in (issue.student_id, issue.responsible_id)
+                    or user in issue.followers.all()):
+                ret.append({"issue_id": issue_id, "status_code": 403})
+                continue
+
+            issue.defer_events(events)
+            try:
+                update_issue(issue, item, user, is_teacher)
+            except (TypeError, ValueError):
+                ret.append({"issue_id": issue_id, "status_code": 400})
+                continue
+            finally:
+                issue.defer_events(None)
+
+            ret.append({
+                "issue_id": issue_id,
+                "status_code": 200,
+                "issue": {
+                    "id": issue.id,
+                    "mark": issue.mark,
+                    "status": unpack_status(IssueStatus.registry.get(id=issue.status_field_id), lang),
+                },
+            })
+
+        Event.bulk_save(events)
+
+    return HttpResponse(json.dumps(ret),
+                        content_type="application/json")
+
+
 @csrf_exempt
 @login_required_basic_auth
 @require_http_methods(['POST'])
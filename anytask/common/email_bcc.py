@@ -8,4 +8,4 @@ class BCCEmailBackend(EmailBackend):
         if bcc_email and not email_message.bcc:
             email_message.bcc = [bcc_email]
 
-        super(BCCEmailBackend, self)._send(email_message)
+        return super(BCCEmailBackend, self)._send(email_message)
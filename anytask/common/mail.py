@@ -1,17 +1,72 @@
 import logging
-from django.core.mail import send_mail
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
 
 logger = logging.getLogger(__name__)
 
 
+class TokenBucket(object):
+    """
+    Lets `rate` calls per second through on average and up to `capacity` calls at once
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.last_time = time.time()
+
+    def wait(self):
+        if not self.rate:
+            return
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) / self.rate)
+            self.tokens = 1
+            self.last_time = time.time()
+        self.tokens -= 1
+
+
+class MassMailSender(object):
+    """
+    Sends messages through one connection, kept open between messages and reopened after a failure,
+    at most EMAIL_RATE_LIMIT messages per second with bursts of EMAIL_RATE_BURST.
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection or get_connection()
+        self.bucket = TokenBucket(getattr(settings, 'EMAIL_RATE_LIMIT', None),
+                                  getattr(settings, 'EMAIL_RATE_BURST', 1))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.close()
+
+    def send(self, messages):
+        num_sent = 0
+        for message in messages:
+            subject, plain_text, html, from_email, emails = message
+            email = EmailMultiAlternatives(subject, plain_text, from_email, emails, connection=self.connection)
+            if html:
+                email.attach_alternative(html, 'text/html')
+            self.bucket.wait()
+            try:
+                # Opened here, the backend does not close the connection after sending
+                self.connection.open()
+                num_sent += email.send()
+            except Exception:
+                logger.exception("Exception while sending mail to '%s' : ", emails)
+                self.connection.close()
+
+        return num_sent
+
+
 def send_mass_mail_html(messages):
-    num_sent = 0
-    for message in messages:
-        subject, plain_text, html, from_email, emails = message
-        try:
-            num_sent += send_mail(subject=subject, message=plain_text, from_email=from_email, recipient_list=emails,
-                                  html_message=html)
-        except Exception:
-            logging.exception("Exception while sending mail to '%s' : ", emails)
-
-    return num_sent
+    with MassMailSender() as sender:
+        return sender.send(messages)
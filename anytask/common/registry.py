@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import signals
+
+
+class ModelRegistry(object):
+    """
+    In-process copy of a small, rarely changed table (issue fields, issue statuses).
+
+    Rows are loaded with one query on first access and indexed by the given
+    attributes. Any save or delete of the model drops the copy, so the next access
+    reloads it. Other processes pick up changes after REGISTRY_TTL seconds.
+    Returned objects are shared between requests and must not be modified.
+    """
+
+    def __init__(self, model, *keys):
+        self.model = model
+        self.keys = keys
+        self._index = None
+        self._loaded_at = 0
+        signals.post_save.connect(self._on_change, sender=model, weak=False)
+        signals.post_delete.connect(self._on_change, sender=model, weak=False)
+
+    def _on_change(self, *args, **kwargs):
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+    def invalidate(self):
+        self._index = None
+
+    def _get_index(self):
+        index = self._index
+        ttl = getattr(settings, 'REGISTRY_TTL', None)
+        if index is None or (ttl is not None and time.time() - self._loaded_at > ttl):
+            index = dict((key, {}) for key in self.keys)
+            for obj in self.model.objects.order_by('id'):
+                for key in self.keys:
+                    index[key].setdefault(getattr(obj, key), []).append(obj)
+            self._index = index
+            self._loaded_at = time.time()
+        return index
+
+    def filter(self, **kwargs):
+        (key, value), = kwargs.items()
+        return list(self._get_index()[key].get(value, []))
+
+    def get(self, **kwargs):
+        objs = self.filter(**kwargs)
+        if not objs:
+            raise self.model.DoesNotExist(
+                "{0} matching {1} does not exist.".format(self.model._meta.object_name, kwargs)
+            )
+        return objs[0]
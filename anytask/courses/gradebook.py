@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict, OrderedDict
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+
+from courses import gradebook_cache
+from courses.models import DefaultTeacher, StudentCourseMark
+from groups.models import Group
+from issues.models import Issue
+from tasks.models import Task, TaskGroupRelations
+
+ACADEM_STATUS_TAGS = ('not_active', 'academic')
+
+
+class Gradebook(object):
+    """
+    Course results matrix (groups x students x tasks) built with a constant number of queries.
+    Nothing here depends on the user who looks at the gradebook.
+    """
+
+    def __init__(self, course, groups, seminar=None, show_hidden_tasks=False, show_academ_users=True):
+        self.course = course
+        self.groups = list(groups)
+        self.seminar = seminar
+        self.show_hidden_tasks = show_hidden_tasks
+        self.show_academ_users = show_academ_users
+
+        self.group_x_task_list = OrderedDict()
+        self.group_x_max_score = {}
+        self.group_x_students = OrderedDict()
+        self.group_x_student_information = OrderedDict()
+        self.default_teacher = {}
+        self.academ_students = []
+        self.course_mark_system_vals = None
+
+        self._student_x_issues = defaultdict(list)
+        self._student_x_course_mark = {}
+
+    def build(self):
+        self._load_tasks()
+        self._load_students()
+        self._load_issues()
+        self._load_default_teachers()
+        self._load_course_marks()
+
+        for group, students in self.group_x_students.items():
+            task_ids = set(task.id for task in self.group_x_task_list[group])
+            student_information = []
+            for student in sorted(students, key=lambda x: u"{0} {1}".format(x.last_name, x.first_name)):
+                task_x_task_taken, student_summ_scores = self._get_student_scores(student, task_ids)
+                student_information.append((student, task_x_task_taken, student_summ_scores)
+                                           + self.get_course_mark(student))
+            self.group_x_student_information[group] = student_information
+
+        return self
+
+    @classmethod
+    def get_cached(cls, course, groups, seminar=None, show_hidden_tasks=False, show_academ_users=True):
+        """
+        Same as build(), but served from the course snapshot cache while nothing
+        the gradebook depends on has changed (see courses.gradebook_cache).
+        """
+        groups = list(groups)
+        params = (tuple(group.id for group in groups), seminar.id if seminar else None,
+                  bool(show_hidden_tasks), bool(show_academ_users))
+        return gradebook_cache.get_or_build(
+            course.id, params,
+            lambda: cls(course, groups, seminar, show_hidden_tasks, show_academ_users).build()
+        )
+
+    def _load_tasks(self):
+        relations = TaskGroupRelations.objects \
+            .filter(task__course=self.course, group__in=self.groups, deleted=False, task__parent_task=self.seminar) \
+            .exclude(task__type=Task.TYPE_MATERIAL) \
+            .distinct() \
+            .order_by('position') \
+            .select_related('task') \
+            .prefetch_related('task__groups', 'task__children')
+
+        tasks = {}
+        group_x_tasks = defaultdict(list)
+        for relation in relations:
+            task = tasks.setdefault(relation.task_id, relation.task)
+            if task.task_text is None:
+                task.task_text = ''
+            group_x_tasks[relation.group_id].append(task)
+
+        for group in self.groups:
+            if self.show_hidden_tasks:
+                task_list = group_x_tasks[group.id]
+            else:
+                task_list = [task for task in group_x_tasks[group.id] if not task.is_hidden]
+
+            max_score = 0
+            for task in task_list:
+                if task.is_hidden:
+                    continue
+                if task.type == Task.TYPE_SEMINAR:
+                    max_score += sum([x.score_max for x in task.children.all()])
+                else:
+                    max_score += task.score_max
+
+            self.group_x_task_list[group] = task_list
+            self.group_x_max_score[group] = max_score
+
+    def _load_students(self):
+        memberships = Group.students.through.objects \
+            .filter(group__in=self.groups, user__is_active=True) \
+            .select_related('user', 'user__profile') \
+            .prefetch_related('user__profile__user_status')
+        group_x_students = defaultdict(list)
+        for membership in memberships:
+            group_x_students[membership.group_id].append(membership.user)
+
+        for group in self.groups:
+            students = group_x_students[group.id]
+            self.academ_students += [x for x in students if self._is_academ(x)]
+            if not self.show_academ_users:
+                students = list(set(students) - set(self.academ_students))
+            self.group_x_students[group] = students
+
+    def _load_issues(self):
+        task_ids = set(task.id for tasks in self.group_x_task_list.values() for task in tasks)
+        issues = Issue.objects \
+            .filter(task_id__in=task_ids,
+                    student__in=User.objects.filter(group__in=self.groups, is_active=True)) \
+            .select_related('task', 'status_field')
+        for issue in issues:
+            self._student_x_issues[issue.student_id].append(issue)
+
+    def _load_default_teachers(self):
+        default_teachers = DefaultTeacher.objects \
+            .filter(course=self.course, group__in=self.groups) \
+            .select_related('teacher')
+        group_x_teacher = dict((x.group_id, x.teacher) for x in default_teachers)
+        for group in self.groups:
+            self.default_teacher[group] = group_x_teacher.get(group.id)
+
+    def _load_course_marks(self):
+        if not self.course.mark_system:
+            return
+
+        self.course_mark_system_vals = list(self.course.mark_system.marks.all())
+        student_course_marks = StudentCourseMark.objects \
+            .filter(course=self.course, student__in=User.objects.filter(group__in=self.groups)) \
+            .select_related('mark')
+        for student_course_mark in student_course_marks:
+            self._student_x_course_mark[student_course_mark.student_id] = student_course_mark
+
+    def _get_student_scores(self, student, task_ids):
+        task_x_task_taken = {}
+        student_summ_scores = 0
+        for task_taken in self._student_x_issues[student.id]:
+            if task_taken.task_id not in task_ids:
+                continue
+            task_x_task_taken[task_taken.task_id] = task_taken
+            if not task_taken.task.is_hidden:
+                if task_taken.task.type == Task.TYPE_SEMINAR or \
+                        task_taken.task.score_after_deadline or \
+                        not (not task_taken.task.score_after_deadline
+                             and task_taken.is_status_accepted_after_deadline()):
+                    student_summ_scores += task_taken.mark
+        return task_x_task_taken, student_summ_scores
+
+    def get_course_mark(self, student):
+        mark_id = -1
+        course_mark = '--'
+        course_mark_int = -1
+
+        if self.course_mark_system_vals is not None:
+            if self.course_mark_system_vals and self.course_mark_system_vals[0].name_int != -1:
+                course_mark_int = -10
+            student_course_mark = self._student_x_course_mark.get(student.id)
+            if student_course_mark and student_course_mark.mark:
+                mark_id = student_course_mark.mark.id
+                course_mark = str(student_course_mark)
+                course_mark_int = student_course_mark.mark.name_int
+
+        return mark_id, course_mark, course_mark_int
+
+    @staticmethod
+    def _is_academ(student):
+        try:
+            profile = student.profile
+        except ObjectDoesNotExist:
+            return False
+        return any(status.tag in ACADEM_STATUS_TAGS for status in profile.user_status.all())
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import transaction
+
+VERSION_KEY = 'gradebook:version:{0}'
+SNAPSHOT_KEY = 'gradebook:snapshot:{0}:{1}:{2}'
+HITS_KEY = 'gradebook:hits'
+MISSES_KEY = 'gradebook:misses'
+
+# Backends keeping entries inside one process, versions bumped there would not reach other processes
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_enabled():
+    """
+    Snapshots are kept only when the default cache is shared by all processes (workers, commands),
+    otherwise gradebooks are built on every request
+    """
+    return settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def get_version(course_id):
+    key = VERSION_KEY.format(course_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(*course_ids):
+    """
+    Drops gradebook snapshots of the courses. Also repeated after commit, so a snapshot
+    built from not yet committed data by a concurrent request does not survive.
+    """
+    def bump():
+        cache.set_many(dict((VERSION_KEY.format(course_id), uuid.uuid4().hex) for course_id in course_ids), None)
+
+    if course_ids:
+        bump()
+        transaction.on_commit(bump)
+
+
+def get_or_build(course_id, params, build):
+    """
+    Returns gradebook snapshot for the course and params (tuple of ids and flags describing the page),
+    calling build() on miss.
+    """
+    if not is_enabled():
+        return build()
+
+    key = SNAPSHOT_KEY.format(course_id, get_version(course_id),
+                              hashlib.md5(repr(params).encode('utf-8')).hexdigest())
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        _incr(HITS_KEY)
+        return snapshot
+
+    _incr(MISSES_KEY)
+    snapshot = build()
+    cache.set(key, snapshot, getattr(settings, 'GRADEBOOK_CACHE_TIMEOUT', None))
+    return snapshot
+
+
+def get_stats():
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': float(hits) / total if total else 0.,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def _incr(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
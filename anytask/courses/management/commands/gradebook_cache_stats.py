@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from courses import gradebook_cache
+
+
+class Command(BaseCommand):
+    help = "Show gradebook snapshot cache hit/miss rate"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', dest='reset', help='Reset counters', action='store_true', default=False)
+
+    def handle(self, **options):
+        if not gradebook_cache.is_enabled():
+            print("Gradebook cache is off: the default cache backend is not shared by all processes")
+            return
+
+        stats = gradebook_cache.get_stats()
+        print("Gradebook cache: {hits} hits, {misses} misses, hit rate {hit_rate:.1%}".format(**stats))
+
+        if options['reset']:
+            gradebook_cache.reset_stats()
@@ -6,7 +6,9 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 from django.db.models.signals import m2m_changed
 from django.db.models.signals import post_save
+from django.db.models.signals import post_delete
 
+from courses import gradebook_cache
 from groups.models import Group
 from issues.model_issue_status import IssueStatusSystem
 from issues.model_issue_field import IssueField
@@ -219,10 +221,12 @@ class Course(models.Model):
 
         return False
 
-    def user_can_see_transcript(self, user, student):
+    def user_can_see_transcript(self, user, student, user_is_teacher=None):
         if user.is_anonymous:
             return not self.private and self.full_transcript
-        if self.user_is_teacher(user):
+        if user_is_teacher is None:
+            user_is_teacher = self.user_is_teacher(user)
+        if user_is_teacher:
             return True
         if self.full_transcript:
             return True
@@ -387,5 +391,72 @@ def update_rb_review_group(sender, instance, created, **kwargs):
             rg.user_add(teacher)
 
 
+def invalidate_gradebook(sender, instance, **kwargs):
+    gradebook_cache.invalidate(instance.course_id if sender is not Course else instance.id)
+
+
+def invalidate_gradebook_on_course_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        gradebook_cache.invalidate(instance.id)
+    elif action == "pre_clear":
+        gradebook_cache.invalidate(*instance.course_set.values_list('id', flat=True))
+    else:
+        gradebook_cache.invalidate(*pk_set)
+
+
+def invalidate_gradebook_on_students_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        group_ids = [instance.id]
+    elif action == "pre_clear":
+        group_ids = list(instance.group_set.values_list('id', flat=True))
+    else:
+        group_ids = pk_set
+    gradebook_cache.invalidate(*set(Course.objects.filter(groups__in=group_ids).values_list('id', flat=True)))
+
+
+def invalidate_gradebook_of_students(user_ids):
+    gradebook_cache.invalidate(*set(Course.objects
+                                    .filter(groups__students__in=user_ids)
+                                    .values_list('id', flat=True)))
+
+
+def invalidate_gradebook_on_student_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Names and is_active of students are shown in the gradebook
+    """
+    if update_fields is not None and not set(update_fields) - {'last_login', 'password'}:
+        return
+    invalidate_gradebook_of_students([instance.id])
+
+
+def invalidate_gradebook_on_user_status_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Students on academic leave or not active are marked and can be hidden in the gradebook
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        user_ids = [instance.user_id]
+    elif action == "pre_clear":
+        user_ids = instance.users_by_status.values('user_id')
+    else:
+        user_ids = sender.objects.filter(userprofile_id__in=pk_set).values('userprofile__user_id')
+    invalidate_gradebook_of_students(user_ids)
+
+
 m2m_changed.connect(add_default_issue_fields, sender=Course.issue_fields.through)
 post_save.connect(update_rb_review_group, sender=Course)
+
+post_save.connect(invalidate_gradebook, sender=Course)
+post_save.connect(invalidate_gradebook, sender=DefaultTeacher)
+post_delete.connect(invalidate_gradebook, sender=DefaultTeacher)
+post_save.connect(invalidate_gradebook, sender=StudentCourseMark)
+post_delete.connect(invalidate_gradebook, sender=StudentCourseMark)
+m2m_changed.connect(invalidate_gradebook_on_course_groups_change, sender=Course.groups.through)
+m2m_changed.connect(invalidate_gradebook_on_students_change, sender=Group.students.through)
+post_save.connect(invalidate_gradebook_on_student_change, sender=User)
+m2m_changed.connect(invalidate_gradebook_on_user_status_change, sender='users.UserProfile_user_status')
@@ -67,7 +67,8 @@ class PythonTaskStat(object):
             tasks = TaskTaken.objects.filter(Q(Q(user=student) | Q(issue__costudents=student))) \
                 .filter(task__in=self.tasks) \
                 .filter(Q(Q(status=TaskTaken.STATUS_TAKEN) | Q(status=TaskTaken.STATUS_SCORED))) \
-                .distinct()
+                .distinct() \
+                .select_related('task', 'issue')
             if tasks.count() > 0:
                 stat['active_students'] += 1
 
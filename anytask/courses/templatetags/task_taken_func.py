@@ -1,8 +1,6 @@
 from django import template
-from django.utils import timezone
 from issues.models import Issue
 from issues.model_issue_status import IssueStatus
-from lessons.models import Lesson
 from tasks.models import Task
 
 register = template.Library()
@@ -82,12 +80,3 @@ def task_group_info(task):
                     ', '.join(data_task_disabled_groups),
                     ', '.join(data_task_empty_children_groups))
     return ''
-
-
-@register.filter(name='lssn_can_be_deleted')
-def lesson_can_be_deleted(lesson):
-    if isinstance(lesson, Lesson):
-        if lesson.date_starttime > timezone.now():
-            return 0
-        else:
-            return lesson.group.students.count() - lesson.not_visited_students.count()
@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import json
+import shutil
+import tempfile
 
 from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from schools.models import School
 from courses.models import Course, IssueField, FilenameExtension, CourseMarkSystem, MarkField, IssueStatusSystem, \
-    DefaultTeacher
+    DefaultTeacher, StudentCourseMark
+from courses import gradebook_cache
+from courses.gradebook import Gradebook
 from issues.models import Issue, IssueStatus
 from groups.models import Group
 from years.models import Year
 from tasks.models import Task, TaskTaken
+from lessons.models import Lesson
+from users.model_user_status import UserStatus
 from tasks.management.commands.check_task_taken_expires import Command as CheckTastTakenExpiresCommand
 
 from bs4 import BeautifulSoup
@@ -274,6 +284,39 @@ class ViewsTest(TestCase):
         self.assertEqual(table_body_rows_cells[2].string.strip('\n'), u'\xa0')
         self.assertEqual(table_body_rows_cells[3].span.string.strip().strip('\n'), u'0')
 
+    def test_ajax_get_queue_pagination(self):
+        task = Task.objects.create(title='task', course=self.course, score_max=10)
+        self.assertTrue(self.client.login(username=self.teacher.username, password=self.teacher_password))
+
+        def get_queue(start, length):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse(courses.views.ajax_get_queue), {
+                    'draw': 1, 'course_id': self.course.id, 'filter': '', 'start': start, 'length': length,
+                })
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.content), len(queries)
+
+        for i in range(3):
+            student = User.objects.create_user(username='queue_student{0}'.format(i), password='password')
+            self.group.students.add(student)
+            Issue.objects.create(task=task, student=student, mark=i)
+
+        response, _ = get_queue(0, 2)
+        self.assertEqual(response['recordsTotal'], 3)
+        self.assertEqual([row['mark'] for row in response['data']], [0, 1])
+        response, queries_count = get_queue(2, 2)
+        self.assertEqual([row['mark'] for row in response['data']], [2])
+
+        for i in range(3, 10):
+            student = User.objects.create_user(username='queue_student{0}'.format(i), password='password')
+            self.group.students.add(student)
+            Issue.objects.create(task=task, student=student, mark=i)
+
+        response, queries_count_more = get_queue(0, 5)
+        self.assertEqual(response['recordsTotal'], 10)
+        self.assertEqual(len(response['data']), 5)
+        self.assertEqual(queries_count, queries_count_more)
+
     def test_queue_page_with_teacher(self):
         client = self.client
 
@@ -963,6 +1006,227 @@ class ViewsTest(TestCase):
         self.assertEqual(table_body_sum.span.string.strip().strip('\n'), '3.0')
 
 
+class GradebookTest(TestCase):
+    def setUp(self):
+        self.year = Year.objects.create(start_year=2016)
+        self.course = Course.objects.create(name='course_name', year=self.year)
+        self.groups = [Group.objects.create(name='group_{0}'.format(i), year=self.year) for i in range(2)]
+        self.course.groups.set(self.groups)
+
+        self.task = Task.objects.create(title='task', course=self.course, score_max=10)
+        self.task.groups.set(self.groups)
+        self.task.set_position_in_new_group(self.groups)
+        self.seminar = Task.objects.create(title='seminar', course=self.course, type=Task.TYPE_SEMINAR)
+        self.seminar.groups.set(self.groups[:1])
+        self.seminar.set_position_in_new_group(self.groups[:1])
+        Task.objects.create(title='subtask', course=self.course, parent_task=self.seminar, score_max=5)
+
+        mark_system = CourseMarkSystem.objects.create(name='mark_system')
+        self.mark = MarkField.objects.create(name='5', name_int=5)
+        mark_system.marks.set([self.mark])
+        self.course.mark_system = mark_system
+        self.course.save()
+
+    def add_student(self, group, username, mark=0):
+        student = User.objects.create_user(username=username, password='password')
+        group.students.add(student)
+        Issue.objects.create(task=self.task, student=student, mark=mark)
+        return student
+
+    def use_shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared_cache = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+
+    def test_scores_and_marks(self):
+        student = self.add_student(self.groups[0], 'student1', mark=7)
+        self.add_student(self.groups[1], 'student2', mark=3)
+        StudentCourseMark.objects.create(course=self.course, student=student, mark=self.mark)
+
+        gradebook = Gradebook(self.course, self.groups).build()
+
+        self.assertEqual(gradebook.group_x_max_score[self.groups[0]], 15)
+        self.assertEqual(gradebook.group_x_max_score[self.groups[1]], 10)
+        self.assertEqual(gradebook.group_x_task_list[self.groups[0]], [self.task, self.seminar])
+
+        student_info = gradebook.group_x_student_information[self.groups[0]][0]
+        self.assertEqual(student_info[0], student)
+        self.assertEqual(student_info[1][self.task.id].mark, 7)
+        self.assertEqual(student_info[2:], (7, self.mark.id, '5', 5))
+
+        student_info = gradebook.group_x_student_information[self.groups[1]][0]
+        self.assertEqual(student_info[2:], (3, -1, '--', -10))
+
+    def test_queries_do_not_depend_on_students(self):
+        self.add_student(self.groups[0], 'student1')
+        with self.assertNumQueries(9):
+            Gradebook(self.course, self.groups).build()
+
+        for i in range(5):
+            self.add_student(self.groups[i % 2], 'student_{0}'.format(i))
+        with self.assertNumQueries(9):
+            Gradebook(self.course, self.groups).build()
+
+    def test_cache_off_with_local_backend(self):
+        self.add_student(self.groups[0], 'student1')
+        gradebook_cache.reset_stats()
+        for i in range(2):
+            with self.assertNumQueries(9):
+                Gradebook.get_cached(self.course, self.groups)
+        self.assertEqual(gradebook_cache.get_stats()['misses'], 0)
+
+    def test_cached_snapshot_invalidation(self):
+        self.use_shared_cache()
+        student = self.add_student(self.groups[0], 'student1', mark=7)
+        gradebook_cache.reset_stats()
+
+        def get_summ():
+            gradebook = Gradebook.get_cached(self.course, self.groups)
+            return gradebook.group_x_student_information[self.groups[0]][0][2]
+
+        self.assertEqual(get_summ(), 7)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_summ(), 7)
+
+        issue = Issue.objects.get(student=student, task=self.task)
+        issue.update_time = timezone.now()
+        issue.save()
+        with self.assertNumQueries(0):
+            get_summ()
+
+        issue.mark = 9
+        issue.save()
+        self.assertEqual(get_summ(), 9)
+
+        StudentCourseMark.objects.create(course=self.course, student=student, mark=self.mark)
+        gradebook = Gradebook.get_cached(self.course, self.groups)
+        self.assertEqual(gradebook.group_x_student_information[self.groups[0]][0][3], self.mark.id)
+
+        self.groups[0].students.add(User.objects.create_user(username='student2', password='password'))
+        gradebook = Gradebook.get_cached(self.course, self.groups)
+        self.assertEqual(len(gradebook.group_x_student_information[self.groups[0]]), 2)
+
+        self.assertEqual(gradebook_cache.get_stats()['hits'], 2)
+        self.assertEqual(gradebook_cache.get_stats()['misses'], 4)
+
+    def test_cached_snapshot_student_changes(self):
+        self.use_shared_cache()
+        student = self.add_student(self.groups[0], 'student1')
+        academic = UserStatus.objects.create(name='academic', tag=UserStatus.STATUS_ACADEMIC)
+
+        def get_students():
+            gradebook = Gradebook.get_cached(self.course, self.groups)
+            return [(x[0].last_name, x[0] in gradebook.academ_students)
+                    for x in gradebook.group_x_student_information[self.groups[0]]]
+
+        self.assertEqual(get_students(), [('', False)])
+        student.profile.user_status.add(academic)
+        self.assertEqual(get_students(), [('', True)])
+        academic.users_by_status.clear()
+        self.assertEqual(get_students(), [('', False)])
+
+        student.last_name = 'Ivanov'
+        student.save()
+        self.assertEqual(get_students(), [('Ivanov', False)])
+        student.is_active = False
+        student.save()
+        self.assertEqual(get_students(), [])
+
+
+class AttendanceTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='password')
+        year = Year.objects.create(start_year=2016)
+        self.course = Course.objects.create(name='course_name', year=year, has_attendance_log=True)
+        self.course.teachers.set([self.teacher])
+        self.groups = [Group.objects.create(name='group_{0}'.format(i), year=year) for i in range(2)]
+        self.course.groups.set(self.groups)
+        self.students = []
+        for i in range(4):
+            self.add_student(self.groups[i % 2], 'student_{0}'.format(i))
+        for group in self.groups:
+            for days in (-2, -1, 1):
+                self.add_lesson(group, days)
+        self.client.login(username='teacher', password='password')
+
+    def add_student(self, group, username):
+        student = User.objects.create_user(username=username, password='password', last_name=username)
+        group.students.add(student)
+        self.students.append(student)
+        return student
+
+    def add_lesson(self, group, days):
+        lesson = Lesson.objects.create(course=self.course, group=group,
+                                       date_starttime=timezone.now() + datetime.timedelta(days=days))
+        lesson.set_position()
+        return lesson
+
+    def get_attendance(self):
+        response = self.client.get(reverse('courses.views.attendance_page', kwargs={'course_id': self.course.id}))
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_attendance(self):
+        past_lesson = Lesson.objects.filter(group=self.groups[0]).order_by('position')[0]
+        past_lesson.not_visited_students.add(self.students[0])
+
+        context = self.get_attendance()
+        student_information = context['group_information'][self.groups[0]]
+        self.assertEqual([(student, not_visited, visited) for student, not_visited, visited in student_information],
+                         [(self.students[0], [past_lesson], 1), (self.students[2], [], 2)])
+        self.assertEqual(len(context['group_lessons'][self.groups[0]]), 3)
+        self.assertEqual(len(context['group_inactive_lessons'][self.groups[0]]), 1)
+        self.assertEqual(context['group_lessons'][self.groups[0]][0].can_be_deleted, 1)
+        self.assertEqual(context['group_lessons'][self.groups[0]][2].can_be_deleted, 0)
+
+    def test_queries_do_not_depend_on_lessons_and_students(self):
+        self.get_attendance()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_attendance()
+        num_queries = len(queries)
+
+        for i in range(4, 10):
+            student = self.add_student(self.groups[i % 2], 'student_{0}'.format(i))
+            lesson = self.add_lesson(self.groups[i % 2], -i)
+            lesson.not_visited_students.add(student)
+        with self.assertNumQueries(num_queries):
+            self.get_attendance()
+
+
+class AttendancePageTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='password')
+        year = Year.objects.create(start_year=2016)
+        self.course = Course.objects.create(name='course_name', year=year, has_attendance_log=True)
+        self.course.teachers.set([self.teacher])
+        self.group = Group.objects.create(name='group', year=year)
+        self.course.groups.set([self.group])
+        self.student = User.objects.create_user(username='student', password='password')
+        self.academ_student = User.objects.create_user(username='academ_student', password='password')
+        self.group.students.set([self.student, self.academ_student])
+        academic = UserStatus.objects.create(name='academic', tag=UserStatus.STATUS_ACADEMIC)
+        self.academ_student.profile.user_status.set([academic])
+
+        lesson = Lesson.objects.create(course=self.course, group=self.group,
+                                       date_starttime=timezone.now() - datetime.timedelta(days=1))
+        lesson.set_position()
+        lesson.not_visited_students.add(self.student)
+        self.client.login(username='teacher', password='password')
+
+    def test_attendance_page(self):
+        response = self.client.get(reverse('courses.views.attendance_page', kwargs={'course_id': self.course.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['visible_hide_button_users'], 1)
+        student_information = dict((student, visited) for student, _, visited
+                                   in response.context['group_information'][self.group])
+        self.assertEqual(student_information, {self.student: 0, self.academ_student: 1})
+
+
 class PythonTaskTest(TestCase):
     def setUp(self):
         User.objects.create_user(username="anytask")
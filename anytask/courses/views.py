@@ -12,10 +12,9 @@ from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.views.decorators.http import require_http_methods
 
-from collections import defaultdict, Counter, OrderedDict
+from collections import Counter, OrderedDict, defaultdict
 import datetime
 import logging
-import requests
 from reversion import revisions as reversion
 
 from courses.models import Course, DefaultTeacher, StudentCourseMark, MarkField, FilenameExtension
@@ -23,14 +22,15 @@ from groups.models import Group
 from tasks.models import Task, TaskGroupRelations
 from years.models import Year
 from years.common import get_current_year
-from anycontest.common import get_contest_info, FakeResponse
+from anycontest import contest_cache
+from anycontest.common import get_contest_info
 from issues.models import Issue
 from issues.issueFilter import IssueFilter
 from issues.model_issue_status import IssueStatus
 from issues.views import contest_rejudge
 from users.forms import InviteActivationForm
-from users.models import UserProfile
 from courses import pythontask
+from courses.gradebook import ACADEM_STATUS_TAGS, Gradebook
 from lessons.models import Lesson
 
 from common.timezone import convert_datetime
@@ -119,20 +119,23 @@ def ajax_get_queue(request):
     if not course.user_can_see_queue(user):
         raise PermissionDenied
 
+    # Students are matched in a subquery, so issues are not multiplied by joins and need no DISTINCT
+    students = User.objects.filter(
+        (Q(profile__user_status__tag='active') | Q(profile__user_status__tag=None))
+        & Q(group__course=course)
+    )
     issues = Issue.objects.filter(
-        Q(task__course=course)
-        & (Q(student__profile__user_status__tag='active') | Q(student__profile__user_status__tag=None))
-        & Q(student__group__course=course)
-    ).exclude(
-        task__type=Task.TYPE_SEMINAR,
+        task__course=course,
+        student__in=students,
     ).exclude(
-        task__type=Task.TYPE_MATERIAL,
-    ).distinct().select_related('student', 'task', 'responsible', 'status_field')
+        task__type__in=[Task.TYPE_SEMINAR, Task.TYPE_MATERIAL],
+    )
 
     order = []
     for order_info in json.loads(request.POST.get("order", "[]")):
         order.extend(set_order_direction(QUEUE_COLUMN_ORDER.get(str(order_info.get("column"))), order_info.get("dir")))
-    issues = issues.order_by(*order)
+    # id makes pages stable when sort values are equal
+    issues = issues.order_by(*(order + ['id']))
 
     f = IssueFilter(QueryDict(request.POST["filter"]), issues)
     f.set_course(course, user)
@@ -347,129 +350,43 @@ def tasklist_shad_cpp(request, course, seminar=None, group=None):
     if group:
         groups = [group]
 
-    group_x_student_x_task_takens = OrderedDict()
-    group_x_task_list = {}
-    group_x_max_score = {}
-    default_teacher = {}
     show_hidden_tasks = request.session.get(str(request.user.id) + '_' + str(course.id) + '_show_hidden_tasks', False)
     show_academ_users = request.session.get(str(request.user.id) + '_' + str(course.id) + '_show_academ_users', True)
 
-    academ_students = []
-
-    for group in groups:
-        student_x_task_x_task_takens = {}
-
-        tasks_for_groups = TaskGroupRelations.objects \
-            .filter(task__course=course, group=group, deleted=False, task__parent_task=seminar) \
-            .exclude(task__type=Task.TYPE_MATERIAL) \
-            .distinct() \
-            .order_by('position') \
-            .prefetch_related('task__groups') \
-            .select_related('task')
-
-        if show_hidden_tasks:
-            group_x_task_list[group] = [x.task for x in tasks_for_groups]
-        else:
-            group_x_task_list[group] = [x.task for x in tasks_for_groups if not x.task.is_hidden]
-
-        group_x_max_score.setdefault(group, 0)
-
-        for task in group_x_task_list[group]:
-
-            if not task.is_hidden:
-                if task.type == task.TYPE_SEMINAR:
-                    group_x_max_score[group] += sum([x.score_max for x in task.children.all()])
-                else:
-                    group_x_max_score[group] += task.score_max
-            if task.task_text is None:
-                task.task_text = ''
-
-        issues_students_in_group = Issue.objects \
-            .filter(task__in=group_x_task_list[group], student__group__in=[group]) \
-            .order_by('student') \
-            .select_related("task") \
-            .prefetch_related('task__groups', 'task')
-
-        issues_x_student = defaultdict(list)
-        for issue in issues_students_in_group.all():
-            student_id = issue.student.id
-            issues_x_student[student_id].append(issue)
-
-        students = group.students.filter(is_active=True)
-        not_active_students = UserProfile.objects.filter(
-            Q(user__in=group.students.filter(is_active=True))
-            & (Q(user_status__tag='not_active') | Q(user_status__tag='academic'))
-        )
-        academ_students += [x.user for x in not_active_students]
-        if not show_academ_users:
-            students = set(students) - set(academ_students)
-
-        for student in students:
-            if user == student:
-                user_is_attended = True
-                user_is_attended_special_course = True
-
-            student_task_takens = issues_x_student[student.id]
-
-            task_x_task_taken = {}
-            student_summ_scores = 0
-            for task_taken in student_task_takens:
-                task_x_task_taken[task_taken.task.id] = task_taken
-                if not task_taken.task.is_hidden:
-                    if task_taken.task.type == Task.TYPE_SEMINAR or \
-                            task_taken.task.score_after_deadline or \
-                            not (not task_taken.task.score_after_deadline
-                                 and task_taken.is_status_accepted_after_deadline()):
-                        student_summ_scores += task_taken.mark
-
-            student_x_task_x_task_takens[student] = (task_x_task_taken, student_summ_scores)
-
-        group_x_student_x_task_takens[group] = student_x_task_x_task_takens
-
-        try:
-            default_teacher[group] = DefaultTeacher.objects.get(course=course, group=group).teacher
-        except DefaultTeacher.DoesNotExist:
-            default_teacher[group] = None
+    gradebook = Gradebook.get_cached(course, groups, seminar, show_hidden_tasks, show_academ_users)
 
+    user_is_teacher = course.user_is_teacher(user)
     group_x_student_information = OrderedDict()
-    for group, student_x_task_x_task_takens in group_x_student_x_task_takens.items():
-        group_x_student_information.setdefault(group, [])
-
-        for student in sorted(student_x_task_x_task_takens.keys(),
-                              key=lambda x: u"{0} {1}".format(x.last_name, x.first_name)):
+    for group, student_information in gradebook.group_x_student_information.items():
+        group_x_student_information[group] = []
+        for student_info in student_information:
+            student = student_info[0]
             if user == student:
                 user_is_attended = True
-            elif not course.user_can_see_transcript(user, student):
+                user_is_attended_special_course = True
+            elif not course.user_can_see_transcript(user, student, user_is_teacher):
                 continue
-
-            mark_id, course_mark, course_mark_int = get_course_mark(course, student)
-
-            group_x_student_information[group].append((student,
-                                                       student_x_task_x_task_takens[student][0],
-                                                       student_x_task_x_task_takens[student][1],
-                                                       mark_id,
-                                                       course_mark,
-                                                       course_mark_int))
+            group_x_student_information[group].append(student_info)
 
     context = {
         'course': course,
-        'course_mark_system_vals': course.mark_system.marks.all() if course.mark_system else None,
+        'course_mark_system_vals': gradebook.course_mark_system_vals,
         'group_information': group_x_student_information,
-        'group_tasks': group_x_task_list,
-        'group_x_max_score': group_x_max_score,
-        'default_teacher': default_teacher,
+        'group_tasks': gradebook.group_x_task_list,
+        'group_x_max_score': gradebook.group_x_max_score,
+        'default_teacher': gradebook.default_teacher,
 
         'user': user,
         'user_is_attended': user_is_attended,
         'user_is_attended_special_course': user_is_attended_special_course,
-        'user_is_teacher': course.user_is_teacher(user),
+        'user_is_teacher': user_is_teacher,
 
         'seminar': seminar,
         'visible_queue': course.user_can_see_queue(user),
         'visible_attendance_log': course.user_can_see_attendance_log(request.user),
         'visible_hide_button': Task.objects.filter(Q(course=course) & Q(is_hidden=True)).exists(),
         'show_hidden_tasks': show_hidden_tasks,
-        'visible_hide_button_users': len(academ_students),
+        'visible_hide_button_users': len(gradebook.academ_students),
         'show_academ_users': show_academ_users
 
     }
@@ -481,27 +398,6 @@ def get_tasklist_context(request, course):
     return tasklist_shad_cpp(request, course)
 
 
-def get_course_mark(course, student):
-    mark_id = -1
-    course_mark = '--'
-    course_mark_int = -1
-    course_marks = course.mark_system
-
-    if course_marks and course_marks.marks:
-        if course_marks.marks.all()[0].name_int != -1:
-            course_mark_int = -10
-        try:
-            student_course_mark = StudentCourseMark.objects.get(course=course, student=student)
-            if student_course_mark.mark:
-                mark_id = student_course_mark.mark.id
-                course_mark = str(student_course_mark)
-                course_mark_int = student_course_mark.mark.name_int
-        except StudentCourseMark.DoesNotExist:
-            pass
-
-    return mark_id, course_mark, course_mark_int
-
-
 def courses_list(request, year=None):
     if year is None:
         year_object = get_current_year()
@@ -818,11 +714,11 @@ def ajax_update_contest_tasks(request):
                 'error': '',
                 'tasks_title': {}}
 
+    # Explicit update from Contest, so cached metadata is not used
+    contest_cache.invalidate(contest_id)
     got_info, contest_info = get_contest_info(contest_id)
     if got_info:
-        problem_req = FakeResponse()
-        problem_req = requests.get(settings.CONTEST_API_URL + 'problems?contestId=' + str(contest_id),
-                                   headers={'Authorization': 'OAuth ' + settings.CONTEST_OAUTH})
+        problem_req = contest_cache.get_problems(contest_id)
         problems = []
         if 'error' in problem_req:
             response['is_error'] = True
@@ -830,8 +726,8 @@ def ajax_update_contest_tasks(request):
                 response['error'] = _(u'kontesta_ne_sushestvuet')
             else:
                 response['error'] = _(u'oshibka_kontesta') + ' ' + problem_req['error']['message']
-        if 'result' in problem_req.json():
-            problems = problem_req.json()['result']['problems']
+        if 'result' in problem_req:
+            problems = problem_req['result']['problems']
 
         contest_responses = [contest_info, problems]
     else:
@@ -905,7 +801,7 @@ def attendance_list(request, course, group=None):
     if group:
         groups = [group]
     else:
-        groups = course.groups.all().order_by('name')
+        groups = list(course.groups.all().order_by('name'))
 
     group_x_student_x_lessons = OrderedDict()
     group_x_lesson_list = {}
@@ -914,19 +810,50 @@ def attendance_list(request, course, group=None):
 
     academ_students = []
 
+    lessons = Lesson.objects.filter(course=course, group__in=groups).order_by('position')
+    group_x_lessons = defaultdict(list)
+    for lssn in lessons:
+        group_x_lessons[lssn.group_id].append(lssn)
+
+    student_x_not_visited = defaultdict(set)
+    lesson_x_not_visited_count = Counter()
+    for lssn_id, student_id in Lesson.not_visited_students.through.objects \
+            .filter(lesson__in=lessons) \
+            .values_list('lesson_id', 'user_id'):
+        student_x_not_visited[student_id].add(lssn_id)
+        lesson_x_not_visited_count[lssn_id] += 1
+    group_x_students_count = Counter(Group.students.through.objects
+                                     .filter(group__in=groups)
+                                     .values_list('group_id', flat=True))
+
+    memberships = Group.students.through.objects \
+        .filter(group__in=groups, user__is_active=True) \
+        .select_related('user', 'user__profile') \
+        .prefetch_related('user__profile__user_status')
+    group_x_students = defaultdict(list)
+    for membership in memberships:
+        group_x_students[membership.group_id].append(membership.user)
+
+    current_time = now()
+    group_x_teacher = dict((x.group_id, x.teacher) for x in DefaultTeacher.objects
+                           .filter(course=course, group__in=groups)
+                           .select_related('teacher'))
+
     for group in groups:
-        group_x_lesson_list[group] = Lesson.objects.filter(course=course, group=group).order_by('position')
-        group_inactive_lessons[group] = Lesson.objects.filter(course=course,
-                                                              group=group,
-                                                              date_starttime__gt=msk_time
-                                                              ).order_by('position')
+        group_x_lesson_list[group] = group_x_lessons[group.id]
+        group_inactive_lessons[group] = [lssn for lssn in group_x_lesson_list[group]
+                                         if lssn.date_starttime and lssn.date_starttime > msk_time]
         active_lessons_count = len(group_x_lesson_list[group]) - len(group_inactive_lessons[group])
+        active_lessons = group_x_lesson_list[group][:active_lessons_count]
+        for lssn in group_x_lesson_list[group]:
+            if lssn.date_starttime > current_time:
+                lssn.can_be_deleted = 0
+            else:
+                lssn.can_be_deleted = group_x_students_count[group.id] - lesson_x_not_visited_count[lssn.id]
 
-        students = group.students.filter(is_active=True)
-        not_active_students = UserProfile.objects.filter(Q(user__in=group.students.filter(is_active=True))
-                                                         & (Q(user_status__tag='not_active')
-                                                            | Q(user_status__tag='academic')))
-        academ_students += [x.user for x in not_active_students]
+        students = group_x_students[group.id]
+        academ_students += [x for x in students
+                            if any(status.tag in ACADEM_STATUS_TAGS for status in x.profile.user_status.all())]
         if not show_academ_users:
             students = set(students) - set(academ_students)
 
@@ -937,18 +864,13 @@ def attendance_list(request, course, group=None):
                 user_is_attended = True
                 user_is_attended_special_course = True
 
-            not_visited_lessons = []
-            for lssn in group_x_lesson_list[group][:active_lessons_count]:
-                if student in lssn.not_visited_students.all():
-                    not_visited_lessons.append(lssn)
+            not_visited_ids = student_x_not_visited[student.id]
+            not_visited_lessons = [lssn for lssn in active_lessons if lssn.id in not_visited_ids]
             students_x_lessons[student] = not_visited_lessons, active_lessons_count - len(not_visited_lessons)
 
         group_x_student_x_lessons[group] = students_x_lessons
-
-        try:
-            default_teacher[group] = DefaultTeacher.objects.get(course=course, group=group).teacher
-        except DefaultTeacher.DoesNotExist:
-            default_teacher[group] = None
+        default_teacher[group] = group_x_teacher.get(group.id)
+    user_is_teacher = course.user_is_teacher(user)
     group_x_student_information = OrderedDict()
     for group, students_x_lessons in group_x_student_x_lessons.items():
         group_x_student_information.setdefault(group, [])
@@ -957,7 +879,7 @@ def attendance_list(request, course, group=None):
                               key=lambda x: u"{0} {1}".format(x.last_name, x.first_name)):
             if user == student:
                 user_is_attended = True
-            elif not course.user_can_see_transcript(user, student):
+            elif not course.user_can_see_transcript(user, student, user_is_teacher):
                 continue
 
             group_x_student_information[group].append((student,
@@ -971,7 +893,7 @@ def attendance_list(request, course, group=None):
         'user': user,
         'user_is_attended': user_is_attended,
         'user_is_attended_special_course': user_is_attended_special_course,
-        'user_is_teacher': course.user_is_teacher(user),
+        'user_is_teacher': user_is_teacher,
         'visible_hide_button_users': len(academ_students),
         'show_academ_students': show_academ_users
     }
@@ -2,7 +2,7 @@
 
 from issues.model_issue_field import IssueField
 from issues.model_issue_status import IssueStatus, IssueStatusSystem
-from issues.models import Issue, Event
+from issues.models import Issue, Event, IssueJob
 from django.contrib import admin
 from django.utils.translation import ugettext as _
 
@@ -58,8 +58,17 @@ class EventAdmin(admin.ModelAdmin):
     readonly_fields = ('timestamp',)
 
 
+class IssueJobAdmin(admin.ModelAdmin):
+    list_display = ('event', 'integration', 'status', 'attempts', 'run_after', 'update_time')
+    list_filter = ('integration', 'status')
+    raw_id_fields = ['issue', 'event']
+    search_fields = ('issue__id', )
+    readonly_fields = ('create_time', 'update_time')
+
+
 admin.site.register(Issue)
 admin.site.register(Event, EventAdmin)
+admin.site.register(IssueJob, IssueJobAdmin)
 admin.site.register(IssueField)
 admin.site.register(IssueStatus, IssueStatusAdmin)
 admin.site.register(IssueStatusSystem, IssueStatusSystemAdmin)
@@ -89,7 +89,7 @@ def get_status_choice(issue, lang):
 
 
 def status_id2status(status_id):
-    return IssueStatus.objects.get(id=status_id)
+    return IssueStatus.registry.get(id=int(status_id))
 
 
 def get_status_form(field_name, request, issue, data=None, *args, **kwargs):
@@ -12,15 +12,30 @@ from issues.models import Issue
 
 
 class IssueFilter(django_filters.FilterSet):
-    status_field = django_filters.MultipleChoiceFilter(label=_('status'), widget=forms.SelectMultiple)
+    # Only followers is a to-many relation, so other filters do not need DISTINCT
+    status_field = django_filters.MultipleChoiceFilter(
+        label=_('status'), widget=forms.SelectMultiple, distinct=False
+    )
     update_time = django_filters.DateRangeFilter(label=_('data_poslednego_izmenenija'))
-    responsible = django_filters.MultipleChoiceFilter(label=_('proverjaushij'), widget=forms.SelectMultiple)
+    responsible = django_filters.MultipleChoiceFilter(
+        label=_('proverjaushij'), widget=forms.SelectMultiple, distinct=False
+    )
     followers = django_filters.MultipleChoiceFilter(label=_('nabludateli'), widget=forms.SelectMultiple)
-    students = django_filters.MultipleChoiceFilter(name="student", label=_('studenty'), widget=forms.SelectMultiple)
+    students = django_filters.MultipleChoiceFilter(
+        name="student", label=_('studenty'), widget=forms.SelectMultiple, distinct=False
+    )
     seminars = django_filters.MultipleChoiceFilter(
-        name="task__parent_task", label=_('uroki'), widget=forms.SelectMultiple
+        name="task__parent_task", label=_('uroki'), widget=forms.SelectMultiple, distinct=False
+    )
+    task = django_filters.MultipleChoiceFilter(label=_('zadacha'), widget=forms.SelectMultiple, distinct=False)
+
+    # Columns needed to render a queue row
+    QUEUE_ROW_FIELDS = (
+        'id', 'mark', 'update_time', 'status_field',
+        'student', 'student__username', 'student__first_name', 'student__last_name',
+        'task', 'task__title', 'task__type',
+        'responsible', 'responsible__username', 'responsible__first_name', 'responsible__last_name',
     )
-    task = django_filters.MultipleChoiceFilter(label=_('zadacha'), widget=forms.SelectMultiple)
 
     def set_course(self, course, user):
         default_choices = {}
@@ -59,7 +74,7 @@ class IssueFilter(django_filters.FilterSet):
             if status.tag == Issue.STATUS_VERIFICATION and default_choices:
                 default_choices['status_field'] = [str(status.id)]
         for status_id in sorted(IssueStatus.HIDDEN_STATUSES.values(), reverse=True):
-            status_field = IssueStatus.objects.get(pk=status_id)
+            status_field = IssueStatus.registry.get(id=status_id)
             status_choices.insert(0, (status_field.id, status_field.get_name(lang)))
         self.filters['status_field'].field.choices = tuple(status_choices)
 
@@ -71,16 +86,17 @@ class IssueFilter(django_filters.FilterSet):
     @property
     def qs(self):
         issues = super(IssueFilter, self).qs
-        issues_count = len(issues)
+        issues_count = issues.count()
         lang = self.data_full.get('lang', settings.LANGUAGE_CODE)
         timezone = self.data_full.get('timezone', settings.TIME_ZONE)
         start = int(self.data_full.get('start', 0))
         end = start + int(self.data_full.get('length', 50))
         data = []
-        issues = issues[start:end]
+        issues = issues.select_related('student', 'task', 'responsible').only(*self.QUEUE_ROW_FIELDS)[start:end]
         for issue in issues:
             student = issue.student
             responsible = issue.responsible
+            status = IssueStatus.registry.get(id=issue.status_field_id)
             data.append({
                 "start": start,
                 "has_issue_access": issue.task.has_issue_access(),
@@ -90,8 +106,8 @@ class IssueFilter(django_filters.FilterSet):
                 "task_title": issue.task.get_title(lang),
                 "update_time": issue.update_time.astimezone(timezone_pytz(timezone)).strftime('%d-%m-%Y %H:%M'),
                 "mark": float(issue.score()),
-                "status_name": issue.status_field.get_name(lang),
-                "status_color": issue.status_field.color,
+                "status_name": status.get_name(lang),
+                "status_color": status.color,
                 "responsible_url": responsible.get_absolute_url() if responsible else "",
                 "responsible_name": u'%s %s' % (responsible.last_name, responsible.first_name) if responsible else "",
                 "DT_RowId": "row_issue_" + str(issue.id),
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from issues.models import Issue, IssueFieldValue
+
+
+class Command(BaseCommand):
+    help = "Fill latest issue field values from events history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course_id', dest='course_id', help='Course id', type=int)
+        parser.add_argument('--batch_size', dest='batch_size', help='Issues per transaction', type=int, default=500)
+
+    def handle(self, **options):
+        start_time = time.time()
+        batch_size = options['batch_size']
+
+        issues = Issue.objects.all()
+        if options['course_id']:
+            issues = issues.filter(task__course_id=options['course_id'])
+        issue_ids = list(issues.order_by('id').values_list('id', flat=True))
+
+        values_count = 0
+        for i in range(0, len(issue_ids), batch_size):
+            values_count += self.backfill(issue_ids[i:i + batch_size])
+
+        # logging to cron log
+        print("Command backfill_issue_field_values filled {0} values for {1} issues and took {2} seconds"
+              .format(values_count, len(issue_ids), time.time() - start_time))
+
+    @staticmethod
+    @transaction.atomic
+    def backfill(issue_ids):
+        return IssueFieldValue.rebuild_issues(issue_ids)
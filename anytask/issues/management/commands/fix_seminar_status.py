@@ -19,7 +19,8 @@ def get_mark(task_id, student_id):
     return (Issue.objects
             .filter(task__parent_task_id=task_id, student_id=student_id)
             .exclude(task__is_hidden=True)
-            .exclude(task__score_after_deadline=False, status_field__tag=IssueStatus.STATUS_ACCEPTED_AFTER_DEADLINE)
+            .exclude(task__score_after_deadline=False,
+                     status_field__in=IssueStatus.registry.filter(tag=IssueStatus.STATUS_ACCEPTED_AFTER_DEADLINE))
             .aggregate(Sum('mark'))['mark__sum'] or 0)
 
 
@@ -53,7 +54,7 @@ class Command(BaseCommand):
         if not options['fix_all']:
             issues = Issue.objects \
                 .filter(task__type=Task.TYPE_SEMINAR) \
-                .exclude(status_field__tag=IssueStatus.STATUS_SEMINAR)
+                .exclude(status_field__in=IssueStatus.registry.filter(tag=IssueStatus.STATUS_SEMINAR))
 
             for issue in issues:
                 issue.set_status_seminar()
@@ -0,0 +1,47 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from issues.models import IssueJob
+
+logger = logging.getLogger('django.request')
+
+
+class Command(BaseCommand):
+    help = "Run queued calls of Contest, Review Board and easyCI"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', dest='loop', action='store_true', default=False,
+                            help='Keep waiting for new jobs')
+
+    def handle(self, **options):
+        start_time = time.time()
+        jobs_count = 0
+        failed_count = 0
+        while True:
+            IssueJob.release_stale()
+            jobs = list(IssueJob.get_due(settings.ISSUE_JOBS_BATCH_SIZE))
+            for job in jobs:
+                if not job.claim():
+                    continue
+                try:
+                    job.run()
+                except Exception as e:
+                    # One broken job must not stop the batch or come back with release_stale
+                    logger.exception("Issue job %s (%s) crashed: %s", job.id, job.integration, e)
+                    job.status = IssueJob.STATUS_FAILED
+                    IssueJob.objects.filter(id=job.id).update(status=job.status, error=str(e))
+                jobs_count += 1
+                failed_count += int(job.status != IssueJob.STATUS_DONE)
+
+            if jobs:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(settings.ISSUE_JOBS_POLL_INTERVAL)
+
+        # logging to cron log
+        print("Command run_issue_jobs run {} jobs ({} failed) took {} seconds"
+              .format(jobs_count, failed_count, time.time() - start_time))
@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 
+from collections import defaultdict
+
 from django.core.management.base import BaseCommand
 from django.contrib.sites.models import Site
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Max, Q
 from django.utils import translation, timezone
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_noop as _noop
 from django.template.loader import render_to_string
 
-from common.mail import send_mass_mail_html
+from common.mail import MassMailSender
 
+from issues.model_issue_field import IssueField
 from issues.models import Issue, Event
 import time
 
@@ -21,66 +24,80 @@ class Command(BaseCommand):
     def handle(self, **options):
         start_time = time.time()
         num_sent = 0
-        sleep_time = 0
+        review_id_field = IssueField.registry.get(name='review_id')
         all_events = Event.objects \
             .filter(sended_notify=False) \
-            .exclude(Q(author__isnull=True) | Q(author__username="anytask") | Q(field__name='review_id')) \
-            .distinct() \
-            .select_related("issue", "author") \
-            .prefetch_related("file_set") \
-            .order_by("issue")
+            .exclude(Q(author__isnull=True) | Q(author__username="anytask") | Q(field_id=review_id_field.id))
+        # Events added while sending are left for the next run
+        last_event_id = all_events.aggregate(Max('id'))['id__max']
+        issue_ids = []
+        if last_event_id is not None:
+            all_events = all_events.filter(id__lte=last_event_id)
+            issue_ids = list(all_events.order_by('issue_id').values_list('issue_id', flat=True).distinct())
+
         domain = Site.objects.get_current().domain
         from_email = settings.DEFAULT_FROM_EMAIL
-        for issue in Issue.objects\
-                .filter(event__in=all_events) \
-                .distinct() \
-                .select_related("student", "responsible", "task", "task__course") \
-                .prefetch_related("followers"):
-            events = all_events.filter(issue=issue)
-            if not events:
-                continue
-            notify_messages = []
-            excluded_ids = []
-            if issue.student.email:
-                message = get_message(issue.student, _noop(u'studentom'), issue, events, from_email, domain)
+        with MassMailSender() as sender:
+            for i in range(0, len(issue_ids), settings.NOTIFICATIONS_BATCH_SIZE):
+                batch_events = all_events.filter(issue_id__in=issue_ids[i:i + settings.NOTIFICATIONS_BATCH_SIZE])
+                num_sent += sender.send(get_messages(batch_events, from_email, domain))
+                batch_events.update(sended_notify=True)
+
+        # logging to cron log
+        print("Command send_issue_notifications send {0} email(s) for {1} issue(s) and took {2} seconds"
+              .format(num_sent, len(issue_ids), time.time() - start_time))
+
+
+def get_messages(events, from_email, domain):
+    """
+    :returns messages to all recipients of the issues of the events, loading the events once
+    """
+    issue_x_events = defaultdict(list)
+    events = events \
+        .select_related('author', 'author__profile', 'field') \
+        .prefetch_related('file_set') \
+        .order_by('issue_id', 'timestamp', 'id')
+    for event in events:
+        issue_x_events[event.issue_id].append(event)
+
+    notify_messages = []
+    for issue in Issue.objects \
+            .filter(id__in=issue_x_events.keys()) \
+            .select_related('student', 'student__profile', 'responsible', 'responsible__profile',
+                            'task', 'task__course') \
+            .prefetch_related('followers', 'followers__profile') \
+            .order_by('id'):
+        events = issue_x_events[issue.id]
+        excluded_ids = []
+        if issue.student.email:
+            message = get_message(issue.student, _noop(u'studentom'), issue, events, from_email, domain)
+            if message:
+                notify_messages.append(message)
+            excluded_ids.append(issue.student.id)
+
+        if issue.responsible and issue.responsible.id not in excluded_ids:
+            excluded_ids.append(issue.student.id)
+            if issue.responsible.email:
+                message = get_message(
+                    issue.responsible, _noop(u'proverjaushim'), issue, events, from_email, domain
+                )
                 if message:
                     notify_messages.append(message)
-                excluded_ids.append(issue.student.id)
-
-            if issue.responsible and issue.responsible.id not in excluded_ids:
-                excluded_ids.append(issue.student.id)
-                if issue.responsible.email:
-                    message = get_message(
-                        issue.responsible, _noop(u'proverjaushim'), issue, events, from_email, domain
-                    )
-                    if message:
-                        notify_messages.append(message)
-
-            for follower in issue.followers.exclude(id__in=excluded_ids):
-                if follower.email:
-                    message = get_message(follower, _noop(u'nabludatelem'), issue, events, from_email, domain)
-                    if message:
-                        notify_messages.append(message)
-
-            if notify_messages:
-                num_sent += send_mass_mail_html(notify_messages)
-                time.sleep(1)
-                sleep_time += 1
-
-            for event in events:
-                event.sended_notify = True
-                event.save()
 
-        # logging to cron log
-        print("Command send_issue_notifications send {0} email(s) and took {1} seconds (sleep {2} seconds)"
-              .format(num_sent, time.time() - start_time, sleep_time))
+        for follower in issue.followers.all():
+            if follower.id not in excluded_ids and follower.email:
+                message = get_message(follower, _noop(u'nabludatelem'), issue, events, from_email, domain)
+                if message:
+                    notify_messages.append(message)
+
+    return notify_messages
 
 
 def get_message(user, user_type, issue, events, from_email, domain):
     user_profile = user.profile
 
     if not user_profile.send_my_own_events:
-        events = events.exclude(author_id=user.id)
+        events = [event for event in events if event.author_id != user.id]
 
     if not events:
         return ()
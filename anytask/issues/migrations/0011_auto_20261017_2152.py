@@ -0,0 +1,28 @@
+# Generated by Django 2.0.13 on 2026-10-17 18:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0010_auto_20240226_2154'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueFieldValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.TextField(blank=True)),
+                ('event', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='issues.Event')),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='issues.IssueField')),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='field_values', to='issues.Issue')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='issuefieldvalue',
+            unique_together={('issue', 'field')},
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.0.13 on 2026-10-17 20:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0011_auto_20261017_2152'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('integration', models.CharField(choices=[('contest', 'Yandex.Contest'), ('rb', 'Review Board'), ('easy_ci', 'easyCI')], max_length=32)),
+                ('status', models.CharField(choices=[('pending', 'v_ocheredi'), ('running', 'otpravljaetsja'), ('done', 'otpravleno'), ('failed', 'ne_otpravleno')], db_index=True, default='pending', max_length=32)),
+                ('payload', models.TextField(default='{}')),
+                ('language', models.CharField(blank=True, max_length=16)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='jobs', to='issues.Event')),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='jobs', to='issues.Issue')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='issuejob',
+            unique_together={('event', 'integration')},
+        ),
+    ]
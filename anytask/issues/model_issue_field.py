@@ -4,6 +4,7 @@ import inspect
 import sys
 
 from django.db import models
+from common.registry import ModelRegistry
 from issues.forms import IntForm, MarkForm, FileForm, CommentForm, get_responsible_form, get_followers_form, \
     get_status_form, get_costudents_form
 
@@ -176,6 +177,7 @@ class IssueField(models.Model):
 
 
 IssueField._init_plugins()
+IssueField.registry = ModelRegistry(IssueField, 'id', 'name')
 
 # class FieldProperties(models.Model):
 #     priority = models.IntegerField()
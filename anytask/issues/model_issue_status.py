@@ -3,6 +3,7 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from common.locale_funcs import validate_json, get_value_from_json
+from common.registry import ModelRegistry
 
 from colorfield.fields import ColorField
 
@@ -51,6 +52,9 @@ class IssueStatus(models.Model):
         verbose_name_plural = _('issue statuses')
 
 
+IssueStatus.registry = ModelRegistry(IssueStatus, 'id', 'tag')
+
+
 class IssueStatusSystem(models.Model):
     name = models.CharField(max_length=191, db_index=False, null=False, blank=False)
     statuses = models.ManyToManyField(IssueStatus, blank=True)
@@ -54,7 +54,7 @@ class IssueFilterStudent(django_filters.FilterSet):
         lang = user.profile.language
         status_choices = [(status.id, status.get_name(lang)) for status in status_set]
         for status_id in sorted(IssueStatus.HIDDEN_STATUSES.values(), reverse=True):
-            status_field = IssueStatus.objects.get(pk=status_id)
+            status_field = IssueStatus.registry.get(id=status_id)
             status_choices.insert(0, (status_field.id, status_field.get_name(lang)))
         self.filters['status_field'].field.choices = tuple(status_choices)
 
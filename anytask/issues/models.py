@@ -1,25 +1,33 @@
 # coding: utf-8
 
+import datetime
+import json
+import logging
 import os
 import uuid
 from decimal import Decimal
 
 from anyrb.common import AnyRB
 from anyrb.common import update_status_review_request
+from courses import gradebook_cache
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.dispatch import receiver
-from django.utils import timezone
-from django.utils.translation import ugettext as _
+from django.utils import timezone, translation
+from django.utils.translation import ugettext as _, ugettext_lazy
 from issues.model_issue_field import IssueField
 from issues.model_issue_status import IssueStatus
-from tasks.models import Task
+from tasks.models import Task, TaskTaken
 from text_unidecode import unidecode
 from users.common import get_user_fullname, get_user_link
 
+import requests
+
+logger = logging.getLogger('django.request')
+
 
 def get_file_path(instance, filename):
     return '/'.join(['files', str(uuid.uuid4()), filename])
@@ -106,6 +114,17 @@ class Issue(models.Model):
         on_delete=models.DO_NOTHING,
     )
 
+    GRADEBOOK_FIELDS = ('task_id', 'student_id', 'mark', 'status_field_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Issue, cls).from_db(db, field_names, values)
+        instance._gradebook_values = instance.get_gradebook_values()
+        return instance
+
+    def get_gradebook_values(self):
+        return tuple(self.__dict__.get(name) for name in self.GRADEBOOK_FIELDS)
+
     def is_status_accepted(self):
         return self.status_field.tag in [IssueStatus.STATUS_ACCEPTED, IssueStatus.STATUS_ACCEPTED_AFTER_DEADLINE]
 
@@ -131,9 +150,7 @@ class Issue(models.Model):
         return self.status_field.tag == IssueStatus.STATUS_VERIFICATION
 
     def score(self):
-        field = IssueField.objects.get(id=8)
-
-        mark = self.get_field_value(field)
+        mark = self.mark
         if mark:
             mark = normalize_decimal(mark)
         else:
@@ -141,7 +158,7 @@ class Issue(models.Model):
         return mark
 
     def last_comment(self):
-        field = IssueField.objects.get(id=1)
+        field = IssueField.registry.get(name='comment')
         comment = self.get_field_value(field)
         if not comment:
             comment = ''
@@ -199,7 +216,7 @@ class Issue(models.Model):
         return self.get_field_value(field)
 
     def get_byname(self, name):
-        field = IssueField.objects.get(name=name)
+        field = IssueField.registry.get(name=name)
         return self.get_field_value(field)
 
     def get_field_value(self, field):
@@ -231,18 +248,34 @@ class Issue(models.Model):
         if name == 'mark':
             return self.mark
 
-        events = Event.objects.filter(issue_id=self.id, field_id=field.id).order_by('-timestamp')[:1]
-        if not events:
-            fields_count = self.task.course.issue_fields.filter(id=field.id).count()
-            if fields_count:
-                self.set_field(field, field.get_default_value())
-                if field.get_default_value() is not None:
-                    return field.get_default_value()
-                return ''
-            else:
-                raise AttributeError('field_name = {0}'.format(name))
+        field_value = self.get_stored_field_value(field)
+        if field_value is not None:
+            return field_value.value
 
-        return events[0].value
+        # Values are stored for every event (by backfill_issue_field_values for older ones),
+        # so the field was never set: the default is returned without writing anything
+        course = self.task.course
+        if 'issue_fields' in getattr(course, '_prefetched_objects_cache', {}):
+            in_course = field in course.issue_fields.all()
+        else:
+            in_course = course.issue_fields.filter(id=field.id).exists()
+        if not in_course:
+            raise AttributeError('field_name = {0}'.format(name))
+        if field.get_default_value() is not None:
+            return field.get_default_value()
+        return ''
+
+    def get_stored_field_value(self, field):
+        """
+        :returns IssueFieldValue with the latest value of the field or None,
+        prefetched field_values are used when available
+        """
+        if 'field_values' in getattr(self, '_prefetched_objects_cache', {}):
+            for field_value in self.field_values.all():
+                if field_value.field_id == field.id:
+                    return field_value
+            return None
+        return self.field_values.filter(field_id=field.id).first()
 
     def get_field_value_for_form(self, field):
         ret = self.get_field_value(field)
@@ -258,18 +291,37 @@ class Issue(models.Model):
             return ret
         return ret
 
+    def defer_events(self, events):
+        """
+        New events of the issue are appended to the events list instead of being saved,
+        the caller stores them with Event.bulk_save(). None switches back to saving at once.
+        """
+        self._deferred_events = events
+
+    def save_event(self, event):
+        if getattr(self, '_deferred_events', None) is None:
+            event.save()
+        elif not any(x is event for x in self._deferred_events):
+            self._deferred_events.append(event)
+
+    def delete_event(self, event):
+        if getattr(self, '_deferred_events', None) is None:
+            event.delete()
+        else:
+            self._deferred_events[:] = [x for x in self._deferred_events if x is not event]
+
     def create_event(self, field, author):
         event = Event()
         event.issue = self
         event.field = field
         event.author = author
-        event.save()
+        self.save_event(event)
 
         return event
 
     def set_status_by_id(self, status_id, author=None):
         if int(status_id) in IssueStatus.HIDDEN_STATUSES.values():
-            return self.set_byname('status', IssueStatus.objects.get(id=status_id))
+            return self.set_byname('status', IssueStatus.registry.get(id=int(status_id)))
         else:
             status = self.task.course.issue_status_system.statuses.filter(id=status_id)
             if status:
@@ -277,7 +329,7 @@ class Issue(models.Model):
 
     def set_status_by_tag(self, tag, author=None):
         if tag in IssueStatus.HIDDEN_STATUSES:
-            return self.set_byname('status', IssueStatus.objects.get(id=IssueStatus.HIDDEN_STATUSES[tag]))
+            return self.set_byname('status', IssueStatus.registry.get(id=IssueStatus.HIDDEN_STATUSES[tag]))
         else:
             status = self.task.course.issue_status_system.statuses.filter(tag=tag)
             if status:
@@ -309,7 +361,7 @@ class Issue(models.Model):
         self.set_status_by_tag(IssueStatus.STATUS_SEMINAR, author)
 
     def set_byname(self, name, value, author=None, from_contest=False):
-        field = IssueField.objects.get(name=name)
+        field = IssueField.registry.get(name=name)
         return self.set_field(field, value, author, from_contest)
 
     def set_field(self, field, value, author=None, from_contest=False):
@@ -339,10 +391,10 @@ class Issue(models.Model):
 
         if not delete_event:
             event.value = value
-            event.save()
+            self.save_event(event)
             event.pull_plugins()
         else:
-            event.delete()
+            self.delete_event(event)
 
         return event
 
@@ -401,17 +453,23 @@ class Issue(models.Model):
 
     def set_field_comment(self, author, course, event, value):
         if value:
-            sent = True
+            contest_submissions = []
             for file_id, file in enumerate(value['files']):
                 file.name = unidecode(file.name)
                 uploaded_file = File(file=file, event=event)
                 uploaded_file.save()
                 if self.task.contest_integrated:
-                    sent = self.set_field_comment_contest_integrated(
-                        author, file, file_id, sent, uploaded_file, value)
+                    self.set_field_comment_contest_integrated(
+                        author, file, file_id, uploaded_file, value, contest_submissions)
                 if self.task.rb_integrated \
                         and (course.send_rb_and_contest_together or not self.task.contest_integrated):
-                    self.set_field_comment_rb_integrated(course, event, file, value)
+                    self.set_field_comment_rb_integrated(course, event, file)
+
+            if contest_submissions:
+                event.add_job(IssueJob.INTEGRATION_CONTEST,
+                              {'submissions': contest_submissions, 'status_id': self.status_field_id})
+                if not self.is_status_accepted():
+                    self.set_status_auto_verification()
 
             if not value['files'] and not value['comment']:
                 return True, None  # Do not include empty comments
@@ -420,16 +478,16 @@ class Issue(models.Model):
                 value = u'<div class="issue-page-comment not-sanitize">' + value['comment'] + u'</div>'
 
             if not self.is_status_auto_verification() and not self.is_status_accepted():
-                self.set_field_comment_update_status(author, sent)
+                self.set_field_comment_update_status(author)
 
         return False, value
 
-    def set_field_comment_update_status(self, author, sent):
-        if author == self.student and not self.is_status_need_info() and sent:
+    def set_field_comment_update_status(self, author):
+        if author == self.student and not self.is_status_need_info():
             self.set_status_verification()
         if author == self.responsible:
             if self.is_status_need_info():
-                status_field = IssueField.objects.get(name='status')
+                status_field = IssueField.registry.get(name='status')
                 status_events = Event.objects \
                     .filter(issue_id=self.id, field=status_field) \
                     .exclude(author__isnull=True) \
@@ -445,38 +503,24 @@ class Issue(models.Model):
             else:
                 self.set_status_rework()
 
-    def set_field_comment_rb_integrated(self, course, event, file, value):
+    def set_field_comment_rb_integrated(self, course, event, file):
         for ext in settings.RB_EXTENSIONS + [str(ext.name) for ext in course.filename_extensions.all()]:
             filename, extension = os.path.splitext(file.name)
             if ext == extension or ext == '.*':
-                anyrb = AnyRB(event)
-                review_request_id = anyrb.upload_review()
-                if review_request_id is not None:
-                    value['comment'] += u'<p><a href="{1}/r/{0}">Review request {0}</a></p>'. \
-                        format(review_request_id, settings.RB_API_URL)
-                else:
-                    value['comment'] += u'<p>{0}</p>'.format(_(u'oshibka_otpravki_v_rb'))
-                    self.followers.add(User.objects.get(username='anytask.monitoring'))
+                event.add_job(IssueJob.INTEGRATION_RB)
                 break
 
-    def set_field_comment_contest_integrated(self, author, file, file_id, sent, uploaded_file, value):
+    def set_field_comment_contest_integrated(self, author, file, file_id, uploaded_file, value, contest_submissions):
         for ext in settings.CONTEST_EXTENSIONS:
             filename, extension = os.path.splitext(file.name)
             if ext == extension:
                 contest_submission = self.contestsubmission_set.create(
                     issue=self, author=author, file=uploaded_file
                 )
-                sent = contest_submission.upload_contest(ext, compiler_id=value['compilers'][file_id])
-                if sent:
-                    value['comment'] += u"<p>{0}</p>".format(_(u'otpravleno_v_kontest'))
-                    if not self.is_status_accepted():
-                        self.set_status_auto_verification()
-                else:
-                    value['comment'] += u"<p>{0}('{1}')</p>".format(_(u'oshibka_otpravki_v_kontest'),
-                                                                    contest_submission.send_error)
-                    self.followers.add(User.objects.get(username='anytask.monitoring'))
+                contest_submissions.append({'id': contest_submission.id,
+                                            'extension': ext,
+                                            'compiler_id': value['compilers'][file_id]})
                 break
-        return sent
 
     def set_field_followers_names(self, value):
         delete_event = False
@@ -533,10 +577,34 @@ class Issue(models.Model):
         """
         :returns event objects
         """
+        review_id_field = IssueField.registry.get(name='review_id')
         events = Event.objects.filter(issue_id=self.id).exclude(Q(author__isnull=True)
-                                                                | Q(field__name='review_id')).order_by('timestamp')
+                                                                | Q(field_id=review_id_field.id)).order_by('timestamp')
         return events
 
+    @staticmethod
+    def get_history_events():
+        """
+        :returns history events of all issues with authors, profiles, fields, not deleted files (event.files)
+        and not finished integration jobs (event.unfinished_jobs)
+        """
+        review_id_field = IssueField.registry.get(name='review_id')
+        return Event.objects \
+            .exclude(Q(author__isnull=True) | Q(field_id=review_id_field.id)) \
+            .select_related('author', 'author__profile', 'field') \
+            .prefetch_related(
+                models.Prefetch('file_set', queryset=File.objects.filter(deleted=False), to_attr='files'),
+                models.Prefetch('jobs', queryset=IssueJob.objects.exclude(status=IssueJob.STATUS_DONE),
+                                to_attr='unfinished_jobs')
+            ) \
+            .order_by('timestamp')
+
+    def load_history(self):
+        """
+        :returns list of history events loaded with a fixed number of queries, see get_history_events
+        """
+        return list(self.get_history_events().filter(issue_id=self.id))
+
     def __str__(self):
         return u'Issue: {0} {1}'.format(self.id, self.task.get_title())
 
@@ -546,10 +614,10 @@ class Issue(models.Model):
     def add_comment(self, comment, author=None):
         if author is None:
             author = User.objects.get(username="anytask")
-        field, field_get = IssueField.objects.get_or_create(name='comment')
+        field = IssueField.registry.get(name='comment')
         event = self.create_event(field, author=author)
         event.value = u'<div class="contest-response-comment not-sanitize">' + comment + u'</div>'
-        event.save()
+        self.save_event(event)
         return event
 
     class Meta:
@@ -571,11 +639,40 @@ class Event(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     sended_notify = models.BooleanField(default=False, db_index=True)
 
+    @classmethod
+    def bulk_save(cls, events):
+        """
+        Inserts events collected with Issue.defer_events() and updates stored field values of their issues
+        """
+        cls.objects.bulk_create(events)
+        IssueFieldValue.rebuild_issues(set(event.issue_id for event in events))
+
+    def add_job(self, integration, payload=None):
+        """
+        Integration job is created by pull_plugins(), when the event is saved with its value
+        """
+        if not hasattr(self, '_new_jobs'):
+            self._new_jobs = {}
+        self._new_jobs[integration] = payload or {}
+
     def pull_plugins(self):
-        # upload_review(self)
-        # from anycontest.common import AnyContest
-        # AnyContest(self)
-        pass
+        new_jobs, self._new_jobs = getattr(self, '_new_jobs', {}), {}
+        for integration, payload in new_jobs.items():
+            IssueJob.enqueue(self, integration, payload)
+
+    def add_to_comment(self, html):
+        """
+        Appends html to the comment text, inside its div. Jobs of one event may finish at the same time,
+        so the value is read again under lock.
+        """
+        with transaction.atomic():
+            event = Event.objects.select_for_update().get(id=self.id)
+            if event.value.endswith(u'</div>'):
+                event.value = event.value[:-len(u'</div>')] + html + u'</div>'
+            else:
+                event.value += html
+            event.save()
+        self.value = event.value
 
     def get_message(self):
         msg_map = {
@@ -585,7 +682,8 @@ class Event(models.Model):
             'file': _('zagruzhen_faij')
         }
         message = ''
-        if self.field.name == 'followers_names':
+        field = self.get_field()
+        if field.name == 'followers_names':
             value = self.value.split('\n')
             if len(value) == 1:
                 return _('nabludaiut') + ' ' + self.value if self.value else _('nabludaet_nikto')
@@ -595,11 +693,11 @@ class Event(models.Model):
             if deleted_users:
                 message += u'\n{0} {1}'.format(_('ne_nabludaiut'), deleted_users)
         else:
-            if self.field.history_message:
-                if self.field.name in msg_map:
-                    message += msg_map[self.field.name] + ' '
+            if field.history_message:
+                if field.name in msg_map:
+                    message += msg_map[field.name] + ' '
                 else:
-                    message += self.field.history_message + ' '
+                    message += field.history_message + ' '
             message += self.value
         return message
 
@@ -616,11 +714,16 @@ class Event(models.Model):
             message.append(', '.join(file_list))
         return u'\n'.join(message)
 
+    def get_field(self):
+        if Event.field.is_cached(self):
+            return self.field
+        return IssueField.registry.get(id=self.field_id)
+
     def is_comment(self):
-        return self.field.name == 'comment'
+        return self.get_field().name == 'comment'
 
     def is_change(self):
-        return self.field.name != 'comment'
+        return self.get_field().name != 'comment'
 
     #    def save(self, *a, **ka):
     #        import traceback
@@ -634,10 +737,285 @@ class Event(models.Model):
             ret = u'{1} {0}'.format(self.author.first_name,
                                     self.issue.id)
         if self.is_change():
-            ret += u' {0}'.format(self.field.name)
+            ret += u' {0}'.format(self.get_field().name)
         return ret
 
 
+class IssueFieldValue(models.Model):
+    """
+    Latest value of the issue field, denormalized from Event history
+    """
+    issue = models.ForeignKey(
+        Issue, null=False, blank=False, related_name='field_values', on_delete=models.DO_NOTHING
+    )
+    field = models.ForeignKey(
+        IssueField, null=False, blank=False, on_delete=models.DO_NOTHING
+    )
+    event = models.ForeignKey(
+        Event, null=True, blank=True, db_constraint=False, on_delete=models.DO_NOTHING
+    )
+
+    value = models.TextField(blank=True)
+
+    @classmethod
+    def sync_event(cls, event):
+        updated = cls.objects \
+            .filter(issue_id=event.issue_id, field_id=event.field_id, event_id__lte=event.id) \
+            .update(event_id=event.id, value=event.value)
+        if not updated:
+            cls.objects.get_or_create(issue_id=event.issue_id, field_id=event.field_id,
+                                      defaults={'event_id': event.id, 'value': event.value})
+
+    @classmethod
+    def rebuild(cls, issue_id, field_id):
+        """
+        Stores the value of the latest event of the field, without events the stored value is dropped
+        """
+        event = Event.objects \
+            .filter(issue_id=issue_id, field_id=field_id) \
+            .order_by('-timestamp', '-id') \
+            .first()
+        if event is None:
+            cls.objects.filter(issue_id=issue_id, field_id=field_id).delete()
+            return None
+
+        field_value, created = cls.objects.update_or_create(
+            issue_id=issue_id, field_id=field_id,
+            defaults={'event_id': event.id, 'value': event.value}
+        )
+        return field_value
+
+    @classmethod
+    def rebuild_issues(cls, issue_ids):
+        """
+        Rebuilds values of all fields of the issues with one pass over their events
+        :returns number of stored values
+        """
+        latest_events = {}
+        events = Event.objects \
+            .filter(issue_id__in=issue_ids) \
+            .order_by('timestamp', 'id') \
+            .values_list('issue_id', 'field_id', 'id', 'value')
+        for issue_id, field_id, event_id, value in events.iterator():
+            latest_events[(issue_id, field_id)] = (event_id, value)
+
+        cls.objects.filter(issue_id__in=issue_ids).delete()
+        cls.objects.bulk_create([
+            cls(issue_id=issue_id, field_id=field_id, event_id=event_id, value=value)
+            for (issue_id, field_id), (event_id, value) in latest_events.items()
+        ])
+        return len(latest_events)
+
+    def __str__(self):
+        return u'{0} {1}'.format(self.issue_id, self.field_id)
+
+    class Meta:
+        unique_together = ("issue", "field")
+
+
+class IssueJobError(Exception):
+    pass
+
+
+class IssueJob(models.Model):
+    """
+    Call of Contest, Review Board or easyCI for a comment event, made by the run_issue_jobs command
+    instead of the request which added the comment, in the language of that request.
+    There is one job for an event and integration.
+    """
+    INTEGRATION_CONTEST = 'contest'
+    INTEGRATION_RB = 'rb'
+    INTEGRATION_EASY_CI = 'easy_ci'
+    INTEGRATIONS = (
+        (INTEGRATION_CONTEST, u'Yandex.Contest'),
+        (INTEGRATION_RB, u'Review Board'),
+        (INTEGRATION_EASY_CI, u'easyCI'),
+    )
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = (
+        (STATUS_PENDING, ugettext_lazy(u'v_ocheredi')),
+        (STATUS_RUNNING, ugettext_lazy(u'otpravljaetsja')),
+        (STATUS_DONE, ugettext_lazy(u'otpravleno')),
+        (STATUS_FAILED, ugettext_lazy(u'ne_otpravleno')),
+    )
+
+    issue = models.ForeignKey(
+        Issue, null=False, blank=False, related_name='jobs', on_delete=models.DO_NOTHING
+    )
+    event = models.ForeignKey(
+        Event, null=False, blank=False, related_name='jobs', on_delete=models.DO_NOTHING
+    )
+    integration = models.CharField(max_length=32, choices=INTEGRATIONS)
+    status = models.CharField(max_length=32, choices=STATUSES, default=STATUS_PENDING, db_index=True)
+    payload = models.TextField(default='{}')
+    language = models.CharField(max_length=16, blank=True)
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now, db_index=True)
+    error = models.TextField(null=True, blank=True)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+    update_time = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def enqueue(cls, event, integration, payload=None):
+        job, created = cls.objects.get_or_create(
+            event=event, integration=integration,
+            defaults={'issue_id': event.issue_id, 'payload': json.dumps(payload or {}),
+                      'language': translation.get_language() or ''}
+        )
+        if created and not settings.ISSUE_JOBS_ASYNC and job.claim():
+            job.run()
+        return job
+
+    @classmethod
+    def get_due(cls, limit):
+        return cls.objects \
+            .filter(status=cls.STATUS_PENDING, run_after__lte=timezone.now()) \
+            .select_related('issue', 'issue__task__course', 'event') \
+            .order_by('run_after', 'id')[:limit]
+
+    @classmethod
+    def release_stale(cls):
+        """
+        Returns jobs left running by a stopped worker to the queue
+        """
+        stale_time = timezone.now() - datetime.timedelta(seconds=settings.ISSUE_JOBS_TIMEOUT)
+        return cls.objects.filter(status=cls.STATUS_RUNNING, update_time__lt=stale_time) \
+            .update(status=cls.STATUS_PENDING)
+
+    def claim(self):
+        """
+        Marks the job running, False if another worker has taken it
+        """
+        claimed = IssueJob.objects \
+            .filter(id=self.id, status=self.STATUS_PENDING) \
+            .update(status=self.STATUS_RUNNING, attempts=F('attempts') + 1, update_time=timezone.now())
+        if claimed:
+            self.status = self.STATUS_RUNNING
+            self.attempts += 1
+        return bool(claimed)
+
+    def run(self):
+        """
+        Runs the claimed job. A failed job is retried after ISSUE_JOBS_RETRY_DELAY seconds, doubled with every
+        attempt; after ISSUE_JOBS_MAX_ATTEMPTS the failure is reported in the issue.
+        """
+        payload = json.loads(self.payload)
+        with translation.override(self.language or settings.LANGUAGE_CODE):
+            try:
+                getattr(self, 'run_' + self.integration)(payload)
+                self.status = self.STATUS_DONE
+                self.error = None
+            except Exception as e:
+                if isinstance(e, IssueJobError):
+                    logger.warning("Issue job %s (%s) failed: %s", self.id, self.integration, e)
+                else:
+                    logger.exception("Issue job %s (%s) failed: %s", self.id, self.integration, e)
+                self.error = str(e)
+                if self.attempts < settings.ISSUE_JOBS_MAX_ATTEMPTS:
+                    self.status = self.STATUS_PENDING
+                    self.run_after = timezone.now() + datetime.timedelta(
+                        seconds=settings.ISSUE_JOBS_RETRY_DELAY * 2 ** (self.attempts - 1))
+                else:
+                    self.status = self.STATUS_FAILED
+                    try:
+                        getattr(self, 'fail_' + self.integration)(payload)
+                    except Exception as e:
+                        logger.exception("Issue job %s (%s) failure was not reported: %s",
+                                         self.id, self.integration, e)
+        self.save()
+
+    def run_contest(self, payload):
+        not_sent = []
+        for submission in payload['submissions']:
+            contest_submission = self.issue.contestsubmission_set.get(id=submission['id'])
+            if contest_submission.run_id:
+                continue
+            contest_submission.send_error = None
+            if not contest_submission.upload_contest(submission['extension'],
+                                                     compiler_id=submission['compiler_id']):
+                not_sent.append(contest_submission.send_error)
+        if not_sent:
+            raise IssueJobError(u', '.join(not_sent))
+        self.event.add_to_comment(u"<p>{0}</p>".format(_(u'otpravleno_v_kontest')))
+
+    def fail_contest(self, payload):
+        self.event.add_to_comment(u"<p>{0}('{1}')</p>".format(_(u'oshibka_otpravki_v_kontest'), self.error))
+        self.issue.followers.add(User.objects.get(username='anytask.monitoring'))
+        if self.issue.is_status_auto_verification() and payload.get('status_id'):
+            self.issue.set_status_by_id(payload['status_id'])
+
+    def run_rb(self, payload):
+        review_request_id = AnyRB(self.event).upload_review()
+        if review_request_id is None:
+            raise IssueJobError("Review request was not created")
+        self.event.add_to_comment(u'<p><a href="{1}/r/{0}">Review request {0}</a></p>'.format(
+            review_request_id, settings.RB_API_URL))
+
+    def fail_rb(self, payload):
+        self.event.add_to_comment(u'<p>{0}</p>'.format(_(u'oshibka_otpravki_v_rb')))
+        self.issue.followers.add(User.objects.get(username='anytask.monitoring'))
+
+    def run_easy_ci(self, payload):
+        issue = self.issue
+        check_request_dict = {
+            'files': payload['files'],
+            'course_id': issue.task.course_id,
+            'title': issue.task.get_title(),
+            'issue_id': issue.id,
+            'event': {
+                'id': self.event.id,
+                'timestamp': self.event.timestamp.isoformat()
+            }
+        }
+        response = requests.post(issue.task.course.easyCI_url + "/api/add_task", json=check_request_dict,
+                                 timeout=settings.ISSUE_JOBS_REQUEST_TIMEOUT)
+        response.raise_for_status()
+
+    def fail_easy_ci(self, payload):
+        self.issue.add_comment("Cannot send to easyCI. Time: " + self.event.timestamp.isoformat())
+
+    def __str__(self):
+        return u'{0} {1} {2}'.format(self.event_id, self.integration, self.status)
+
+    class Meta:
+        unique_together = ("event", "integration")
+
+
+@receiver(models.signals.post_save, sender=Event)
+def post_save_sync_field_value(sender, instance, *args, **kwargs):
+    IssueFieldValue.sync_event(instance)
+
+
+@receiver(models.signals.post_delete, sender=Event)
+def post_delete_sync_field_value(sender, instance, *args, **kwargs):
+    if IssueFieldValue.objects.filter(issue_id=instance.issue_id, field_id=instance.field_id,
+                                      event_id=instance.id).exists():
+        IssueFieldValue.rebuild(instance.issue_id, instance.field_id)
+
+
+@receiver(models.signals.post_save, sender=Issue)
+def post_save_issue_results_changed(sender, instance, created, *args, **kwargs):
+    gradebook_values = instance.get_gradebook_values()
+    if instance.task_id and (created or gradebook_values != getattr(instance, '_gradebook_values', None)):
+        gradebook_cache.invalidate(instance.task.course_id)
+        if not created:
+            # The issue is not written here, the caller's instance would keep the old responsible and
+            # overwrite it on the next save. Responsible is set by check_task_taken_expires.
+            TaskTaken.reconcile(TaskTaken.objects.filter(issue_id=instance.id), set_responsible=False)
+        instance._gradebook_values = gradebook_values
+
+
+@receiver(models.signals.post_delete, sender=Issue)
+def post_delete_invalidate_gradebook(sender, instance, *args, **kwargs):
+    if instance.task_id:
+        gradebook_cache.invalidate(instance.task.course_id)
+
+
 @receiver(models.signals.post_save, sender=Issue)
 def post_create_set_default_teacher(sender, instance, created, *args, **kwargs):
     if created:
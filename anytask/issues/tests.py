@@ -9,10 +9,14 @@ Replace this with more appropriate tests for your application.
 from io import StringIO
 from unittest import skipIf
 
+from django.core import mail
 from django.core.management import call_command
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
 from django.test.testcases import SerializeMixin
 
 from schools.models import School
@@ -20,7 +24,7 @@ from courses.models import Course, IssueField
 from groups.models import Group
 from years.models import Year
 from tasks.models import Task
-from issues.models import Issue, File, Event
+from issues.models import Issue, File, Event, IssueFieldValue, IssueJob
 from issues.model_issue_status import IssueStatus
 
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -28,6 +32,7 @@ from mock import patch
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 from django.urls import reverse
+from django.utils import timezone
 from storages.backends.s3boto3 import S3Boto3Storage
 
 import issues.views
@@ -150,6 +155,29 @@ class ViewsTest(TestCase):
                                       kwargs={'issue_id': issue.id}))
         self.assertEqual(response.status_code, 302, "Need login for issue_page")
 
+    def test_issue_page_queries_do_not_depend_on_events(self):
+        issue = Issue.objects.create(task=self.task, student=self.student)
+        self.assertTrue(self.client.login(username=self.teacher.username, password=self.teacher_password))
+        url = reverse(issues.views.issue_page, kwargs={'issue_id': issue.id})
+
+        def add_comments(count):
+            for i in range(count):
+                event = issue.add_comment("comment {0}".format(i), author=[self.student, self.teacher][i % 2])
+                File.objects.create(file=SimpleUploadedFile('file{0}.py'.format(i), b'print 1'), event=event)
+
+        add_comments(2)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        queries_count = len(queries)
+        self.assertEqual(len(response.context['history']), 2)
+
+        add_comments(10)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['history']), 12)
+        self.assertEqual(len(queries), queries_count)
+
     def test_get_or_create_with_teacher(self):
         client = self.client
 
@@ -870,6 +898,7 @@ class ViewsTest(TestCase):
                          history[1].find('div', 'history-body')['class'],
                          'Wrong deadline end comment color')
 
+    @override_settings(ISSUE_JOBS_ASYNC=False, ISSUE_JOBS_MAX_ATTEMPTS=1)
     @patch('anyrb.common.AnyRB.upload_review')
     def test_upload_review_with_student(self, mock_upload_review):
         client = self.client
@@ -986,6 +1015,86 @@ class ViewsTest(TestCase):
                          u'Review request 1',
                          'Wrong comment text about RB')
 
+    @patch('anyrb.common.AnyRB.upload_review')
+    def test_upload_review_job(self, mock_upload_review):
+        client = self.client
+        issue = Issue.objects.create(task_id=self.task.id, student_id=self.student.id)
+        event_create_file = Event.objects.create(issue=issue, field=IssueField.objects.get(name='file'))
+        f = File.objects.create(file=SimpleUploadedFile('test_rb.py', b'some text'), event=event_create_file)
+        self.task.rb_integrated = True
+        self.task.save()
+
+        self.assertTrue(client.login(username=self.student.username, password=self.student_password),
+                        "Can't login via student")
+
+        # comment is saved at once, review request is left to the worker
+        response = client.post(reverse(issues.views.upload),
+                               {'comment': 'test_comment',
+                                'files[]': '',
+                                'pk_test_rb.py': str(f.id),
+                                'issue_id': str(issue.id),
+                                'form_name': 'comment_form',
+                                'update_issue': ''}, follow=True)
+        self.assertEqual(response.status_code, 200, "Can't get upload via student")
+        mock_upload_review.assert_not_called()
+
+        job = IssueJob.objects.get(issue=issue)
+        self.assertEqual(job.integration, IssueJob.INTEGRATION_RB)
+        self.assertEqual(job.status, IssueJob.STATUS_PENDING)
+        html = BeautifulSoup(response.content, features="lxml")
+        self.assertEqual(' '.join(html.find('div', 'issue-job').text.split()), 'Review Board: queued')
+
+        # one job for an event and integration
+        self.assertEqual(IssueJob.enqueue(job.event, IssueJob.INTEGRATION_RB), job)
+        self.assertEqual(IssueJob.objects.filter(issue=issue).count(), 1)
+
+        # failed attempt is retried later
+        mock_upload_review.return_value = None
+        call_command('run_issue_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, IssueJob.STATUS_PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+
+        mock_upload_review.return_value = 1
+        IssueJob.objects.filter(id=job.id).update(run_after=timezone.now())
+        call_command('run_issue_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, IssueJob.STATUS_DONE)
+        self.assertEqual(job.attempts, 2)
+        event = Event.objects.get(id=job.event_id)
+        self.assertIn('test_comment', event.value)
+        self.assertIn('Review request 1', event.value)
+
+        response = client.get(reverse(issues.views.issue_page, kwargs={'issue_id': issue.id}))
+        html = BeautifulSoup(response.content, features="lxml")
+        self.assertIsNone(html.find('div', 'issue-job'))
+
+    @patch('anyrb.common.AnyRB.upload_review')
+    def test_failed_jobs(self, mock_upload_review):
+        mock_upload_review.return_value = None
+        issue = Issue.objects.create(task_id=self.task.id, student_id=self.student.id)
+        comment_field = IssueField.objects.get(name='comment')
+        jobs = [IssueJob.enqueue(Event.objects.create(issue=issue, field=comment_field, author=self.student),
+                                 IssueJob.INTEGRATION_RB) for _i in range(3)]
+        IssueJob.objects.update(attempts=settings.ISSUE_JOBS_MAX_ATTEMPTS - 1)
+
+        save = IssueJob.save
+
+        def save_job(job, *args, **kwargs):
+            if job.id == jobs[1].id:
+                raise Exception('database error')
+            save(job, *args, **kwargs)
+
+        # failure reports have no anytask.monitoring user to add, the second job is not saved
+        with patch('issues.models.IssueJob.save', autospec=True, side_effect=save_job):
+            call_command('run_issue_jobs', stdout=StringIO())
+        self.assertEqual(mock_upload_review.call_count, 3)
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(job.status, IssueJob.STATUS_FAILED)
+        self.assertEqual(jobs[1].error, 'database error')
+
     @skipIf(not IS_S3_REACHABLE, "S3 seems misconfigured")
     def test_attached_file_in_s3(self):
         client = self.client
@@ -1036,6 +1145,164 @@ class ViewsTest(TestCase):
         self.assertTrue(comment_body.a['href'].startswith(settings.AWS_S3_ENDPOINT_URL))
 
 
+class IssueFieldValueTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='password1')
+        self.student = User.objects.create_user(username='student', password='password2')
+
+        self.year = Year.objects.create(start_year=2016)
+        self.course = Course.objects.create(name='course_name', year=self.year)
+        self.course.teachers.set([self.teacher])
+        self.course.issue_fields.set(IssueField.objects.all())
+        self.task = Task.objects.create(title='task_title', course=self.course, score_max=10)
+        self.issue = Issue.objects.create(task_id=self.task.id, student_id=self.student.id)
+
+    def test_set_field_updates_value(self):
+        self.issue.set_byname('review_id', 1)
+        self.issue.set_byname('review_id', 2)
+
+        field_value = IssueFieldValue.objects.get(issue=self.issue, field__name='review_id')
+        self.assertEqual(field_value.value, '2')
+        self.assertEqual(self.issue.get_byname('review_id'), '2')
+
+    def test_delete_event_restores_previous_value(self):
+        self.issue.set_byname('run_id', 1)
+        event = self.issue.set_byname('run_id', 2)
+        event.delete()
+
+        self.assertEqual(self.issue.get_byname('run_id'), '1')
+
+    def test_get_field_value_prefetched(self):
+        self.issue.set_byname('review_id', 1)
+        field = IssueField.objects.get(name='review_id')
+
+        issue = Issue.objects.prefetch_related('field_values').get(id=self.issue.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(issue.get_field_value(field), '1')
+
+    def test_get_field_value_prefetched_missing(self):
+        field = IssueField.objects.get(name='review_id')
+
+        issue = Issue.objects.prefetch_related('field_values').get(id=self.issue.id)
+        with self.assertNumQueries(0):
+            self.assertIsNone(issue.get_stored_field_value(field))
+
+    def test_get_field_value_without_events(self):
+        field = IssueField.objects.get(name='review_id')
+        issue = Issue.objects \
+            .select_related('task__course') \
+            .prefetch_related('field_values', 'task__course__issue_fields') \
+            .get(id=self.issue.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(issue.get_field_value(field), '')
+        self.assertEqual(self.issue.get_byname('review_id'), '')
+        self.assertFalse(Event.objects.filter(issue=self.issue, field=field).exists())
+        self.assertFalse(IssueFieldValue.objects.filter(issue=self.issue, field=field).exists())
+
+        self.course.issue_fields.remove(field)
+        with self.assertRaises(AttributeError):
+            self.issue.get_byname('review_id')
+
+    def test_backfill_command(self):
+        self.issue.set_byname('review_id', 1)
+        self.issue.add_comment('comment', author=self.teacher)
+        IssueFieldValue.objects.all().delete()
+
+        call_command('backfill_issue_field_values', stdout=StringIO())
+
+        self.assertEqual(self.issue.get_byname('review_id'), '1')
+        self.assertIn('comment', self.issue.last_comment())
+
+
+@override_settings(EMAIL_RATE_LIMIT=None)
+class SendNotificationsTest(TestCase):
+    def setUp(self):
+        site = Site.objects.get_current()
+        site.domain = 'http://localhost'
+        site.save()
+
+        self.year = Year.objects.create(start_year=2016)
+        self.course = Course.objects.create(name='course_name', year=self.year)
+        self.task = Task.objects.create(title='task_title', course=self.course, score_max=10)
+        self.teacher = User.objects.create_user(username='teacher', password='password1', email='teacher@test.com')
+        self.follower = User.objects.create_user(username='follower', password='password3',
+                                                 email='follower@test.com')
+
+        self.issues = []
+        for i in range(3):
+            student = User.objects.create_user(username='student{0}'.format(i), password='password2',
+                                               email='student{0}@test.com'.format(i))
+            issue = Issue.objects.create(task_id=self.task.id, student_id=student.id, responsible=self.teacher)
+            issue.followers.add(self.follower)
+            issue.add_comment('student comment', author=student)
+            issue.add_comment('teacher comment', author=self.teacher)
+            self.issues.append(issue)
+
+    def test_send(self):
+        with override_settings(NOTIFICATIONS_BATCH_SIZE=2):
+            call_command('send_notifications', stdout=StringIO())
+
+        # student and follower get both comments, teacher gets student's one, own events are skipped by default
+        self.assertEqual(len(mail.outbox), 9)
+        self.assertEqual(len([x for x in mail.outbox if x.to == ['follower@test.com']]), 3)
+        teacher_messages = [x for x in mail.outbox if x.to == ['teacher@test.com']]
+        self.assertIn('student comment', teacher_messages[0].alternatives[0][0])
+        self.assertNotIn('teacher comment', teacher_messages[0].alternatives[0][0])
+        self.assertFalse(Event.objects.filter(issue__in=self.issues, sended_notify=False,
+                                              author__isnull=False).exists())
+
+        mail.outbox = []
+        call_command('send_notifications', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_queries_do_not_depend_on_issues(self):
+        call_command('send_notifications', stdout=StringIO())
+        Event.objects.update(sended_notify=False)
+        with CaptureQueriesContext(connection) as context:
+            call_command('send_notifications', stdout=StringIO())
+        queries_count = len(context.captured_queries)
+
+        Event.objects.update(sended_notify=False)
+        for i in range(3, 6):
+            student = User.objects.create_user(username='student{0}'.format(i), password='password2',
+                                               email='student{0}@test.com'.format(i))
+            issue = Issue.objects.create(task_id=self.task.id, student_id=student.id, responsible=self.teacher)
+            issue.followers.add(self.follower)
+            issue.add_comment('student comment', author=student)
+
+        with CaptureQueriesContext(connection) as context:
+            call_command('send_notifications', stdout=StringIO())
+        self.assertEqual(len(context.captured_queries), queries_count)
+
+
+class RegistryTest(TestCase):
+    def test_get_without_queries(self):
+        IssueField.registry.get(name='comment')
+        IssueStatus.registry.get(id=IssueStatus.HIDDEN_STATUSES[IssueStatus.STATUS_NEW])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(IssueField.registry.get(name='comment').id, 1)
+            self.assertEqual(IssueField.registry.get(id=8).name, 'mark')
+            self.assertEqual(IssueStatus.registry.get(id=IssueStatus.HIDDEN_STATUSES[IssueStatus.STATUS_NEW]).tag,
+                             IssueStatus.STATUS_NEW)
+
+    def test_get_missing(self):
+        with self.assertRaises(IssueField.DoesNotExist):
+            IssueField.registry.get(name='no_such_field')
+
+    def test_invalidate_on_save(self):
+        status = IssueStatus.objects.create(name='{"ru": "Новый статус", "en": "New status"}', tag='seminar')
+        self.assertIn(status, IssueStatus.registry.filter(tag='seminar'))
+
+        status.color = '#000000'
+        status.save()
+        self.assertEqual(IssueStatus.registry.get(id=status.id).color, '#000000')
+
+        status.delete()
+        with self.assertRaises(IssueStatus.DoesNotExist):
+            IssueStatus.registry.get(id=status.id)
+
+
 @skipIf(not IS_S3_REACHABLE, "S3 seems misconfigured")
 class S3MigrateIssueAttachments(TestCase, SerializeMixin):
     maxDiff = None
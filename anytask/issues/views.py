@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import os
-import requests
 from copy import deepcopy
 
 from django.conf import settings
@@ -21,7 +20,7 @@ from anycontest.common import get_problem_compilers
 from anyrb.common import AnyRB
 from issues.model_issue_field import IssueField
 from issues.model_issue_status import IssueStatus
-from issues.models import Issue, Event, File
+from issues.models import Issue, Event, File, IssueJob
 
 
 def user_is_teacher_or_staff(user, issue):
@@ -88,7 +87,7 @@ def contest_rejudge(issue):
 
     old_contest_submission = got_verdict_submissions.order_by("-create_time")[0]
     author = old_contest_submission.author
-    field, field_get = IssueField.objects.get_or_create(name='comment')
+    field = IssueField.registry.get(name='comment')
     event = issue.create_event(field, author=author)
 
     file_copy = deepcopy(old_contest_submission.file)
@@ -133,24 +132,7 @@ def check_easy_ci(request, issue, event, sent_files):
             files.append(request.build_absolute_uri(sent_file.url))
 
         if len(files) != 0:
-            check_request_dict = {
-                'files': files,
-                'course_id': issue.task.course_id,
-                'title': issue.task.get_title(),
-                'issue_id': issue.id,
-                'event': {
-                    'id': event.id,
-                    'timestamp': event.timestamp.isoformat()
-                }
-            }
-            try:
-                response = requests.post(issue.task.course.easyCI_url
-                                         + "/api/add_task",
-                                         json=check_request_dict)
-                print(response.status_code)
-            except requests.exceptions.RequestException:
-                issue.add_comment("Cannot send to easyCI. Time: "
-                                  + event.timestamp.isoformat())
+            IssueJob.enqueue(event, IssueJob.INTEGRATION_EASY_CI, {'files': files})
 
 
 @login_required
@@ -200,7 +182,7 @@ def issue_page(request, issue_id):
                 if 'Accepted' in request.POST:
                     if request.POST['Accepted']:
                         issue.set_byname('status',
-                                         IssueStatus.objects.get(pk=request.POST['Accepted']),
+                                         IssueStatus.registry.get(id=int(request.POST['Accepted'])),
                                          request.user)
                     else:
                         issue.set_status_accepted(request.user)
@@ -224,16 +206,17 @@ def issue_page(request, issue_id):
 
     prepare_info_fields(issue_fields, request, issue)
 
+    history = issue.load_history()
     first_event_after_deadline = None
     events_to_show = 6
     show_top_alert = False
 
-    for event_id, event in enumerate(issue.get_history()):
-        if issue.task.deadline_time and event.timestamp > issue.task.deadline_time:
-            first_event_after_deadline = event
-            if event_id < len(issue.get_history()) - events_to_show:
-                show_top_alert = True
-            break
+    if issue.task.deadline_time:
+        for event_id, event in enumerate(history):
+            if event.timestamp > issue.task.deadline_time:
+                first_event_after_deadline = event
+                show_top_alert = event_id < len(history) - events_to_show
+                break
 
     lang = user.profile.language
     statuses_accepted = [(status.id, status.get_name(lang))
@@ -262,6 +245,7 @@ def issue_page(request, issue_id):
     context = {
         'issue': issue,
         'issue_fields': issue_fields,
+        'history': history,
         'course': issue.task.course,
         'seminar_url': seminar_url,
         'events_to_show': events_to_show,
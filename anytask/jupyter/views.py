@@ -57,7 +57,7 @@ def update_jupyter_task(request):
     if request.FILES:
         logger.debug('FILES: %r', request.FILES)
         try:
-            field = IssueField.objects.get(name='file')
+            field = IssueField.registry.get(name='file')
         except IssueField.DoesNotExist:
             return HttpResponseNotFound('No issue field')
 
@@ -1,19 +1,25 @@
 # -*- coding: utf-8 -*-
-from django.core.mail import get_connection, EmailMultiAlternatives
+from django.core.mail import get_connection
 from django.conf import settings
-from django.template import Template, Context
+from django.template import Template, Context, Variable
+from django.template.base import TextNode, VariableNode
 from django.template.loader import render_to_string
 from django.utils import translation
 from django.utils.translation import ugettext as _
-from django.utils.html import strip_tags
+from django.utils.html import strip_tags, conditional_escape
 
 import logging
+import uuid
 from contextlib import contextmanager
 
+from common.mail import MassMailSender
 from mail.base import BaseRenderer, BaseSender
 
 logger = logging.getLogger('django.request')
 
+NAME_PLACEHOLDERS = dict((name, u'anytask{0}{1}'.format(name.replace('_', ''), uuid.uuid4().hex))
+                         for name in ('first_name', 'last_name'))
+
 
 @contextmanager
 def enable_translation(user_profile):
@@ -30,6 +36,9 @@ class EmailRenderer(BaseRenderer):
         BaseRenderer.__init__(self)
         self.domain = domain
         self.from_email = from_email
+        # compiled message templates and fulltext parts by (message id, language), kept while sending
+        self._templates = {}
+        self._fulltext_cache = {}
 
     def render_notification(self, user_profile, unread_messages):
         with enable_translation(user_profile):
@@ -57,37 +66,73 @@ class EmailRenderer(BaseRenderer):
         return rendered_message
 
     def render_fulltext(self, message, recipients):
-        rendered_messages = []
+        """
+        Yields the message rendered for every recipient with an email. The parts shared by recipients
+        with the same language are rendered once, only names are filled in for every recipient.
+        """
         for user in recipients:
             if not user.email:
                 continue
-            rendered_messages.append(self.__render_fulltext_single(message, user))
-
-        return rendered_messages
+            yield self.__render_fulltext_single(message, user)
 
     def __render_fulltext_single(self, message, user):
-        user_profile = user.profile
-        with enable_translation(user_profile):
-            subject = message.title
-            message_text = self.fill_name(message, user)
-
-            plain_text = strip_tags(message_text).replace('&nbsp;', ' ')
-
-            context = {
-                "domain": self.domain,
-                "title": subject,
-                "message_text": message_text,
-            }
-            html = render_to_string('email_fulltext_mail.html', context)
-
-            rendered_message = subject, plain_text, html, self.from_email, [user.email]
-
-        return rendered_message
+        lang = user.profile.language
+        key = (message.id, lang)
+        if key not in self._fulltext_cache:
+            self._fulltext_cache[key] = self.__render_fulltext_shared(message, lang)
+        subject, plain_text, html = self._fulltext_cache[key]
+
+        if html is None:
+            with enable_translation(user.profile):
+                message_text = self.fill_name(message, user, self.__get_template(message))
+                plain_text, html = self.__render_fulltext_text(subject, message_text)
+        else:
+            for name, placeholder in NAME_PLACEHOLDERS.items():
+                value = conditional_escape(getattr(user, name))
+                plain_text = plain_text.replace(placeholder, value)
+                html = html.replace(placeholder, value)
+
+        return subject, plain_text, html, self.from_email, [user.email]
+
+    def __render_fulltext_shared(self, message, lang):
+        """
+        Returns: subject, plain text and html with NAME_PLACEHOLDERS instead of the names of the recipient,
+        (subject, None, None) if names can not be filled in by replacing
+        """
+        subject = message.title
+        if not message.variable:
+            message_text = message.text
+        else:
+            template = self.__get_template(message)
+            if not is_plain_names(template):
+                return subject, None, None
+            message_text = template.render(Context(NAME_PLACEHOLDERS))
+
+        with translation.override(lang):
+            plain_text, html = self.__render_fulltext_text(subject, message_text)
+        return subject, plain_text, html
+
+    def __render_fulltext_text(self, subject, message_text):
+        plain_text = strip_tags(message_text).replace('&nbsp;', ' ')
+
+        context = {
+            "domain": self.domain,
+            "title": subject,
+            "message_text": message_text,
+        }
+        html = render_to_string('email_fulltext_mail.html', context)
+
+        return plain_text, html
+
+    def __get_template(self, message):
+        if message.id not in self._templates:
+            self._templates[message.id] = compile_message(message)
+        return self._templates[message.id]
 
     @classmethod
-    def fill_name(cls, message, user):
+    def fill_name(cls, message, user, template=None):
         if message.variable:
-            t = Template(message.text.replace('%', '&#37;'))
+            t = template or compile_message(message)
             c = Context({
                 "last_name": user.last_name,
                 "first_name": user.first_name,
@@ -96,6 +141,26 @@ class EmailRenderer(BaseRenderer):
         return message.text
 
 
+def compile_message(message):
+    return Template(message.text.replace('%', '&#37;'))
+
+
+def is_plain_names(template):
+    """
+    Returns: True if the template only outputs names without filters, so it can be rendered by replacing
+    NAME_PLACEHOLDERS
+    """
+    for node in template.nodelist:
+        if isinstance(node, TextNode):
+            continue
+        if not isinstance(node, VariableNode) or node.filter_expression.filters:
+            return False
+        var = node.filter_expression.var
+        if not isinstance(var, Variable) or len(var.lookups or ()) != 1 or var.lookups[0] not in NAME_PLACEHOLDERS:
+            return False
+    return True
+
+
 class EmailSender(BaseSender):
     def __init__(self, from_email, fail_silently=False, user=None, password=None, connection=None):
         BaseSender.__init__(self)
@@ -104,17 +169,20 @@ class EmailSender(BaseSender):
         self.user = user
         self.password = password
         self.connection = connection
+        self.mail_sender = None
 
     def mass_send(self, prepared_messages):
-        # TODO drop from_email from prepared_messages
-        connection = self.__get_connection()
-        messages = []
-        for subject, plain_text, html, from_email, recipient in prepared_messages:
-            message = EmailMultiAlternatives(subject, plain_text, from_email, recipient)
-            message.attach_alternative(html, 'text/html')
-            messages.append(message)
-
-        return connection.send_messages(messages)
+        """
+        Sends messages one by one as they are rendered through the connection kept open by the sender
+        """
+        if self.mail_sender is None:
+            self.mail_sender = MassMailSender(self.__get_connection())
+        return self.mail_sender.send(prepared_messages)
+
+    def close(self):
+        if self.mail_sender is not None:
+            self.mail_sender.connection.close()
+            self.mail_sender = None
 
     def __get_connection(self):
         return self.connection or get_connection(username=self.user, password=self.password,
@@ -0,0 +1,49 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mail.models import Message
+
+logger = logging.getLogger('django.request')
+
+
+class Command(BaseCommand):
+    help = "Add recipients of messages sent to many users"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', dest='loop', action='store_true', default=False,
+                            help='Keep waiting for new messages')
+
+    def handle(self, **options):
+        start_time = time.time()
+        messages_count = 0
+        recipients_count = 0
+        failed_ids = set()
+        while True:
+            messages = list(Message.objects.filter(fan_out_pending=True).exclude(id__in=failed_ids).order_by('id'))
+            for message in messages:
+                try:
+                    with transaction.atomic():
+                        if not message.claim_fan_out():
+                            continue
+                        recipients_count += message.fan_out(message.get_recipient_ids())
+                except Exception as e:
+                    # The message stays pending and is tried again after the others
+                    logger.exception("Fan out of message %s failed: %s", message.id, e)
+                    failed_ids.add(message.id)
+                    continue
+                messages_count += 1
+
+            if messages:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(settings.MAIL_FAN_OUT_POLL_INTERVAL)
+            failed_ids.clear()
+
+        # logging to cron log
+        print("Command fan_out_messages add {} recipients to {} messages ({} failed) took {} seconds"
+              .format(recipients_count, messages_count, len(failed_ids), time.time() - start_time))
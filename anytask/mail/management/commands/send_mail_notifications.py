@@ -2,6 +2,7 @@
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 
 from mail.common import EmailSender, EmailRenderer
@@ -10,15 +11,13 @@ from anytelegram.common import TelegramRenderer, TelegramSender
 from users.models import UserProfile
 from mail.models import Message
 
+import itertools
 import time
 
 
 class Command(BaseCommand):
     help = "Send new mail notifications via email"
 
-    def add_arguments(self, parser):
-        pass
-
     def handle(self, **options):
         start_time = time.time()
 
@@ -32,65 +31,63 @@ class Command(BaseCommand):
         tg_sender = TelegramSender()
 
         if hasattr(settings, 'SEND_MESSAGE_FULLTEXT') and settings.SEND_MESSAGE_FULLTEXT:
-            models_fulltext = extract_fulltext()
-            notify_messages_email = list(map(lambda tpl: email_renderer.render_fulltext(*tpl), models_fulltext))
-            notify_messages_tg = list(map(lambda tpl: tg_renderer.render_fulltext(*tpl), models_fulltext))
+            models = extract_fulltext()
+            render_email = email_renderer.render_fulltext
+            render_tg = tg_renderer.render_fulltext
         else:
-            models_only_notify = extract_only_notify()
-            notify_messages_email = list(map(lambda tpl: email_renderer.render_notification(*tpl), models_only_notify))
-            notify_messages_tg = list(map(lambda tpl: tg_renderer.render_notification(*tpl), models_only_notify))
+            models = extract_only_notify()
+            render_tg = tg_renderer.render_notification
+
+            def render_email(user_profile, unread_messages):
+                return [email_renderer.render_notification(user_profile, unread_messages)]
 
+        # every item is rendered and sent before the next one is extracted
         num_sent_email = 0
         num_sent_tg = 0
-        sleep_time = 0
-        for messages_email, messages_tg in zip(notify_messages_email, notify_messages_tg):
-            sent = False
-            if messages_email:
-                num_sent_email += email_sender.mass_send([messages_email])
-                sent = True
-            elif messages_tg:
-                num_sent_tg += tg_sender.mass_send([messages_tg])
-                sent = True
-            if sent:
-                time.sleep(1)
-                sleep_time += 1
+        try:
+            for tpl in models:
+                messages_email = iter(render_email(*tpl))
+                first_message = next(messages_email, None)
+                if first_message is not None:
+                    num_sent_email += email_sender.mass_send(itertools.chain([first_message], messages_email))
+                    continue
+                messages_tg = render_tg(*tpl)
+                if messages_tg:
+                    num_sent_tg += tg_sender.mass_send([messages_tg])
+        finally:
+            email_sender.close()
 
         # logging to cron log
         time_spent = time.time() - start_time
-        print(f"Command send_mail_notifications send {num_sent_email} email(s), {num_sent_tg} tg message(s) and took"
-              f"{time_spent} seconds (sleep {sleep_time} seconds)")
+        print(f"Command send_mail_notifications send {num_sent_email} email(s), {num_sent_tg} tg message(s) and took "
+              f"{time_spent} seconds")
 
 
 def extract_only_notify():
     """
-    Returns: list of pairs (user_profile, unread messages)
+    Yields: pairs (user_profile, unread messages)
     """
-    notify_messages = []
-
     for user_profile in UserProfile.objects.exclude(send_notify_messages__isnull=True).select_related('user'):
         user = user_profile.user
         if not user.email:
             continue
 
-        unread_messages = user_profile.send_notify_messages.all()
-        unread_count = len(unread_messages)
-        if not unread_count:
+        unread_messages = list(user_profile.send_notify_messages.all())
+        if not unread_messages:
             continue
 
         user_profile.send_notify_messages.clear()
-        notify_messages.append((user_profile, unread_messages))
-
-    return notify_messages
+        yield user_profile, unread_messages
 
 
 def extract_fulltext():
     """
-    Returns: list of pairs (message, message.recipients)
+    Yields: pairs (message, recipients still not notified about the message)
     """
-    notify_messages = []
-
-    for message in Message.objects.exclude(send_notify_messages__isnull=True).prefetch_related('recipients'):
-        recipients = message.recipients.all()
-        notify_messages.append((message, recipients))
-
-    return notify_messages
+    for message in Message.objects.exclude(send_notify_messages__isnull=True).distinct():
+        recipients = list(User.objects
+                          .filter(profile__send_notify_messages=message)
+                          .select_related('profile')
+                          .order_by('id'))
+        message.send_notify_messages.clear()
+        yield message, recipients
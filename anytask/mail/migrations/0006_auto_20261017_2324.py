@@ -0,0 +1,18 @@
+# Generated by Django 2.0.13 on 2026-10-17 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0005_merge_20220122_1951'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='fan_out_pending',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
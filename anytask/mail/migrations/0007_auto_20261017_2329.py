@@ -0,0 +1,25 @@
+# Generated by Django 2.0.13 on 2026-10-17 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0006_auto_20261017_2324'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ['-create_time', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-create_time', '-id'], name='mail_messag_create__2139db_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', '-create_time', '-id'], name='mail_messag_sender__48c13c_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.db.models.signals import m2m_changed
 
 
@@ -33,6 +35,8 @@ class Message(models.Model):
     variable = models.BooleanField(default=False)
 
     create_time = models.DateTimeField(auto_now_add=True)  # remove default=timezone.now
+    # recipients are added by the fan_out_messages command
+    fan_out_pending = models.BooleanField(default=False, db_index=True)
 
     def __str__(self):
         return u'%s %s' % (self.sender.username, self.title)
@@ -41,17 +45,109 @@ class Message(models.Model):
         user_profile = user.profile
         user_profile.unread_messages.remove(self)
         user_profile.send_notify_messages.remove(self)
+        user_profile.update_mail_counts()
+
+    def get_recipient_ids(self):
+        """
+        Returns: ids of users from recipients_user, recipients_status and of students of recipients_group and
+        recipients_course groups except the sender, in one query
+        """
+        students = Q(group__in=self.recipients_group.all()) | Q(group__course__in=self.recipients_course.all())
+        users = Q(id__in=self.recipients_user.all()) | Q(profile__user_status__in=self.recipients_status.all())
+        return set(User.objects
+                   .filter(users | (students & ~Q(id=self.sender_id)))
+                   .values_list('id', flat=True)
+                   .distinct())
+
+    def fan_out(self, user_ids):
+        """
+        Adds users to recipients and makes the message unread and to be notified for them.
+        Rows are inserted into the through tables in bulk, make_unread_msg is not called.
+        """
+        from users.models import UserProfile
+
+        user_ids = set(user_ids) - set(self.recipients.values_list('id', flat=True))
+        if not user_ids:
+            return 0
+
+        with transaction.atomic():
+            recipients_through = Message.recipients.through
+            recipients_through.objects.bulk_create(
+                [recipients_through(message_id=self.id, user_id=user_id) for user_id in user_ids]
+            )
+            profiles = dict(UserProfile.objects
+                            .filter(user__in=recipients_through.objects.filter(message_id=self.id).values('user_id'))
+                            .values_list('id', 'user_id'))
+            deleted_ids = set(UserProfile.deleted_messages.through.objects.filter(message_id=self.id)
+                              .values_list('userprofile_id', flat=True))
+            new_unread_ids = set()
+            for field in (UserProfile.unread_messages, UserProfile.send_notify_messages):
+                through = field.through
+                new_ids = set(profiles) - set(through.objects.filter(message_id=self.id)
+                                              .values_list('userprofile_id', flat=True))
+                through.objects.bulk_create(
+                    [through(message_id=self.id, userprofile_id=profile_id) for profile_id in new_ids]
+                )
+                if field is UserProfile.unread_messages:
+                    new_unread_ids = new_ids
+
+            new_recipient_ids = set(profile_id for profile_id, user_id in profiles.items() if user_id in user_ids)
+            increment_mail_count(new_recipient_ids - deleted_ids, 'mail_inbox_count')
+            increment_mail_count(new_unread_ids - deleted_ids, 'mail_unread_count')
+
+        return len(user_ids)
+
+    def send(self):
+        """
+        Fans the message out to its recipients, in the fan_out_messages command when there are more than
+        MAIL_FAN_OUT_ASYNC_MIN_RECIPIENTS of them
+        """
+        from users.models import UserProfile
+
+        user_ids = self.get_recipient_ids()
+        min_async = getattr(settings, 'MAIL_FAN_OUT_ASYNC_MIN_RECIPIENTS', None)
+        if min_async is not None and len(user_ids) > min_async:
+            Message.objects.filter(id=self.id).update(fan_out_pending=True)
+            self.fan_out_pending = True
+        else:
+            self.fan_out(user_ids)
+        UserProfile.objects.filter(user_id=self.sender_id).update(mail_sent_count=F('mail_sent_count') + 1)
+
+    def claim_fan_out(self):
+        """
+        Returns: True if this worker took the pending fan out, call inside a transaction
+        """
+        return bool(Message.objects.filter(id=self.id, fan_out_pending=True).update(fan_out_pending=False))
 
     class Meta:
-        ordering = ["-create_time"]
+        ordering = ["-create_time", "-id"]
+        indexes = [
+            models.Index(fields=['-create_time', '-id']),
+            models.Index(fields=['sender', '-create_time', '-id']),
+        ]
+
 
+def increment_mail_count(profile_ids, field, chunk_size=500):
+    """
+    Adds one to the mailbox count `field` of the profiles
+    """
+    from users.models import UserProfile
 
-def make_unread_msg(sender, instance, action, **kwargs):
+    profile_ids = sorted(profile_ids)
+    for i in range(0, len(profile_ids), chunk_size):
+        UserProfile.objects.filter(id__in=profile_ids[i:i + chunk_size]).update(**{field: F(field) + 1})
+
+
+def make_unread_msg(sender, instance, action, pk_set=None, **kwargs):
     if action in ["post_add", "post_remove"]:
+        from users.models import UserProfile, update_mail_counts
+
         for user in instance.recipients.all():
             user_profile = user.profile
             user_profile.unread_messages.add(instance)
             user_profile.send_notify_messages.add(instance)
+        changed_users = Q(user__in=instance.recipients.all()) | Q(user_id__in=pk_set or [])
+        update_mail_counts(UserProfile.objects.filter(changed_users))
 
 
 m2m_changed.connect(make_unread_msg, sender=Message.recipients.through)
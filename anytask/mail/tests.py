@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
 
-from django.test import TestCase
+from contextlib import redirect_stdout
+from io import StringIO
+from mock import patch
+
+from django.core import mail as django_mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.template import Template
+from django.utils.html import strip_tags, conditional_escape
+from mail.common import EmailRenderer
 from mail.models import Message
 from courses.models import Course
 from groups.models import Group
 from years.models import Year
+from users.model_user_status import UserStatus
+from users.models import UserProfile, update_mail_counts
 
 from django.urls import reverse
 from mail.views import format_date
@@ -511,3 +523,241 @@ class ViewsTest(TestCase):
 
         # check other mailboxes recipient
         self.check_empty_mailboxes([u"sent", u"trash"], 1)
+
+
+@override_settings(EMAIL_RATE_LIMIT=None)
+class SendMailNotificationsTest(TestCase):
+    def setUp(self):
+        site = Site.objects.get_current()
+        site.domain = 'http://localhost'
+        site.save()
+
+        self.sender = User.objects.create_user(username='sender', password='password')
+        self.recipients = []
+        for i, (first_name, last_name) in enumerate([(u'Ivan', u'Ivanov'), (u'Petr', u"O'Petrov"), (u'Anna', u'')]):
+            user = User.objects.create_user(username='recipient{}'.format(i), password='password',
+                                            email='recipient{}@localhost'.format(i),
+                                            first_name=first_name, last_name=last_name)
+            self.recipients.append(user)
+        self.recipients[2].profile.language = 'en'
+        self.recipients[2].profile.save()
+
+    def create_message(self, text, variable=True):
+        message = Message.objects.create(sender=self.sender, title=u'title', text=text, variable=variable)
+        message.recipients.set(self.recipients)
+        return Message.objects.get(id=message.id)
+
+    def test_render_fulltext_compiles_once(self):
+        message = self.create_message(u'<p>Hello, {{ first_name }} {{ last_name }}! 100%</p>')
+        renderer = EmailRenderer('http://localhost', 'from@localhost')
+
+        with patch('mail.common.Template', wraps=Template) as template_mock:
+            rendered = list(renderer.render_fulltext(message, User.objects.filter(id__in=[
+                x.id for x in self.recipients]).order_by('id')))
+        self.assertEqual(template_mock.call_count, 1)
+
+        self.assertEqual(len(rendered), 3)
+        for (subject, plain_text, html, from_email, emails), user in zip(rendered, self.recipients):
+            self.assertEqual(emails, [user.email])
+            self.assertEqual(subject, u'title')
+            text = EmailRenderer.fill_name(message, user)
+            self.assertEqual(plain_text, strip_tags(text))
+            self.assertIn(u'Hello, {} {}'.format(user.first_name, conditional_escape(user.last_name)), html)
+            self.assertNotIn(u'anytask', plain_text + html)
+
+    def test_render_fulltext_with_filters(self):
+        message = self.create_message(u'Hello, {{ first_name|upper }} {{ last_name|default:"-" }}')
+        renderer = EmailRenderer('http://localhost', 'from@localhost')
+
+        rendered = list(renderer.render_fulltext(message, self.recipients))
+        self.assertEqual([x[1] for x in rendered],
+                         [u'Hello, IVAN Ivanov', u'Hello, PETR O&#39;Petrov', u'Hello, ANNA -'])
+
+    @override_settings(SEND_MESSAGE_FULLTEXT=True)
+    def test_send_fulltext(self):
+        self.create_message(u'Hello, {{ first_name }}')
+
+        with redirect_stdout(StringIO()):
+            call_command('send_mail_notifications')
+        self.assertEqual(sorted(x.body for x in django_mail.outbox), [u'Hello, Anna', u'Hello, Ivan', u'Hello, Petr'])
+        for user in self.recipients:
+            self.assertFalse(user.profile.send_notify_messages.exists())
+
+        django_mail.outbox = []
+        with redirect_stdout(StringIO()):
+            call_command('send_mail_notifications')
+        self.assertEqual(len(django_mail.outbox), 0)
+
+    def test_send_notifications(self):
+        self.create_message(u'text')
+
+        with redirect_stdout(StringIO()):
+            call_command('send_mail_notifications')
+        self.assertEqual(sorted(x.to[0] for x in django_mail.outbox), [x.email for x in self.recipients])
+        for user in self.recipients:
+            self.assertFalse(user.profile.send_notify_messages.exists())
+
+
+class FanOutTest(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', password='password')
+        self.year = Year.objects.create(start_year=2016)
+        self.course = Course.objects.create(name='course_name', year=self.year)
+        self.groups = [Group.objects.create(name='group{}_name'.format(i), year=self.year) for i in range(3)]
+        self.course.groups.set(self.groups[1:])
+        self.students = []
+        for i in range(30):
+            student = User.objects.create_user(username='student{}'.format(i), password='password')
+            self.groups[i % 3].students.add(student)
+            self.students.append(student)
+        # the sender is not sent its own message as a student
+        self.groups[1].students.add(self.sender)
+
+        self.status = UserStatus.objects.create(name='status_name', type=UserStatus.TYPE_ACTIVITY)
+        self.user_with_status = User.objects.create_user(username='user_with_status', password='password')
+        self.user_with_status.profile.user_status.add(self.status)
+
+        self.client.login(username=self.sender.username, password='password')
+
+    def send_message(self):
+        post_data = {
+            u'new_title': u'title',
+            u'new_text': u'text',
+            u'new_recipients_course[]': [self.course.id],
+            u'new_recipients_group[]': [self.groups[0].id],
+            u'new_recipients_status[]': [self.status.id],
+        }
+        response = self.client.post(reverse(mail.views.ajax_send_message), post_data)
+        self.assertEqual(response.status_code, 200)
+        return Message.objects.get()
+
+    def assert_fanned_out(self, message):
+        recipients = self.students + [self.user_with_status]
+        self.assertCountEqual(message.recipients.all(), recipients)
+        for user in recipients:
+            self.assertCountEqual(user.profile.unread_messages.all(), [message])
+            self.assertCountEqual(user.profile.send_notify_messages.all(), [message])
+        self.assertFalse(self.sender.profile.unread_messages.exists())
+
+    def test_send_message(self):
+        with self.assertNumQueries(32):
+            message = self.send_message()
+        self.assertFalse(message.fan_out_pending)
+        self.assert_fanned_out(message)
+
+    def test_fan_out_repeated(self):
+        message = self.send_message()
+        self.assertEqual(message.fan_out(message.get_recipient_ids()), 0)
+        self.assertEqual(message.fan_out([self.sender.id]), 1)
+        self.assertCountEqual(self.sender.profile.unread_messages.all(), [message])
+        self.assertEqual(UserProfile.unread_messages.through.objects.count(), len(self.students) + 2)
+
+    @override_settings(MAIL_FAN_OUT_ASYNC_MIN_RECIPIENTS=10)
+    def test_send_message_async(self):
+        message = self.send_message()
+        self.assertTrue(message.fan_out_pending)
+        self.assertFalse(message.recipients.exists())
+
+        with redirect_stdout(StringIO()):
+            call_command('fan_out_messages')
+        message = Message.objects.get(id=message.id)
+        self.assertFalse(message.fan_out_pending)
+        self.assert_fanned_out(message)
+
+    @override_settings(MAIL_FAN_OUT_ASYNC_MIN_RECIPIENTS=10)
+    def test_fan_out_failed(self):
+        broken = self.send_message()
+        Message.objects.filter(id=broken.id).update(title='broken')
+        message = Message.objects.create(sender=self.sender, title='title', text='text', fan_out_pending=True)
+        message.recipients_course.set([self.course])
+        message.recipients_group.set([self.groups[0]])
+        message.recipients_status.set([self.status])
+
+        fan_out = Message.fan_out
+
+        def fan_out_message(message, user_ids):
+            if message.title == 'broken':
+                raise Exception('database error')
+            return fan_out(message, user_ids)
+
+        with patch('mail.models.Message.fan_out', autospec=True, side_effect=fan_out_message), \
+                self.assertLogs('django.request', 'ERROR'), redirect_stdout(StringIO()):
+            call_command('fan_out_messages')
+        self.assertTrue(Message.objects.get(id=broken.id).fan_out_pending)
+        message = Message.objects.get(id=message.id)
+        self.assertFalse(message.fan_out_pending)
+        self.assert_fanned_out(message)
+
+
+class MailboxTest(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', password='password')
+        self.user = User.objects.create_user(username='user', password='password')
+        self.messages = []
+        for i in range(5):
+            message = Message.objects.create(sender=self.sender, title=u'title{}'.format(i), text=u'text')
+            message.fan_out([self.user.id])
+            self.messages.append(message)
+        # the same create_time for all messages, the order is kept by id
+        Message.objects.update(create_time=self.messages[0].create_time)
+        self.messages.reverse()
+
+    def get_mailbox(self, type_msg, start=0, length=10, **kwargs):
+        get_data = {u'draw': 1, u'start': start, u'length': length, u'type': type_msg}
+        get_data.update(kwargs)
+        response = self.client.get(reverse(mail.views.ajax_get_mailbox), get_data)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def assert_counts(self, user, unread, inbox, sent, trash):
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual((profile.mail_unread_count, profile.mail_inbox_count, profile.mail_sent_count,
+                          profile.mail_trash_count), (unread, inbox, sent, trash))
+
+        profile.mail_unread_count = profile.mail_inbox_count = profile.mail_sent_count = 0
+        profile.mail_trash_count = 0
+        profile.save()
+        update_mail_counts(UserProfile.objects.filter(id=profile.id))
+        profile.refresh_from_db()
+        self.assertEqual((profile.mail_unread_count, profile.mail_inbox_count, profile.mail_sent_count,
+                          profile.mail_trash_count), (unread, inbox, sent, trash))
+
+    def test_counts(self):
+        self.assert_counts(self.user, 5, 5, 0, 0)
+
+        self.client.login(username=self.user.username, password='password')
+        response = self.client.get(reverse(mail.views.ajax_get_message),
+                                   {u'msg_id': self.messages[0].id, u'unread_count': 5, u'mailbox': u'inbox'})
+        self.assertEqual(json.loads(response.content)['unread_count'], 4)
+        self.assert_counts(self.user, 4, 5, 0, 0)
+
+        response = self.get_mailbox(u'inbox', **{u'make_delete[]': [self.messages[1].id]})
+        self.assertEqual((response['unread_count'], response['recordsTotal']), (3, 4))
+        self.assert_counts(self.user, 3, 4, 0, 1)
+
+        response = self.get_mailbox(u'trash', **{u'make_undelete[]': [self.messages[1].id]})
+        self.assertEqual((response['unread_count'], response['recordsTotal']), (4, 0))
+
+        response = self.get_mailbox(u'inbox', **{u'make_read[]': [u'all']})
+        self.assertEqual((response['unread_count'], response['recordsTotal']), (0, 5))
+        self.assert_counts(self.user, 0, 5, 0, 0)
+
+    def test_keyset_pages(self):
+        self.client.login(username=self.user.username, password='password')
+        ids = [message.id for message in self.messages]
+
+        response = self.get_mailbox(u'inbox', 0, 2)
+        self.assertEqual([row['DT_RowData']['id'] for row in response['data']], ids[:2])
+
+        with self.assertNumQueries(8):
+            response = self.get_mailbox(u'inbox', 2, 2, after_start=2, after_id=ids[1])
+        self.assertEqual([row['DT_RowData']['id'] for row in response['data']], ids[2:4])
+        self.assertEqual(response['recordsTotal'], 5)
+
+        # a page not following the cursor is taken by offset
+        response = self.get_mailbox(u'inbox', 4, 2, after_start=2, after_id=ids[1])
+        self.assertEqual([row['DT_RowData']['id'] for row in response['data']], ids[4:])
+
+        # a broken cursor is ignored
+        response = self.get_mailbox(u'inbox', 2, 2, after_start=2, after_id='abc')
+        self.assertEqual([row['DT_RowData']['id'] for row in response['data']], ids[2:4])
@@ -4,6 +4,7 @@ import json
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db.models import Exists, OuterRef, Q
 from django.http import HttpResponseForbidden, HttpResponse
 from django.shortcuts import render
 from django.utils import timezone
@@ -12,7 +13,6 @@ from django.views.decorators.http import require_POST, require_GET
 from pytz import timezone as timezone_pytz
 
 from courses.models import Course
-from groups.models import Group
 from mail.common import EmailRenderer
 from mail.models import Message
 from users.model_user_status import get_statuses
@@ -103,29 +103,39 @@ def ajax_get_mailbox(request):
             .exclude(id__in=datatable_data["make_undelete[]"])
             .values_list("id", flat=True)
         ))
+    if any(key in datatable_data for key in ("make_read[]", "make_unread[]", "make_delete[]", "make_undelete[]")):
+        user_profile.update_mail_counts()
 
-    messages = Message.objects.none()
-    messages_deleted = user_profile.deleted_messages.all()
     type_msg = datatable_data['type'][0]
+    messages, records_total = get_mailbox(user_profile, type_msg)
 
-    if type_msg == "inbox":
-        messages = Message.objects.filter(recipients=user).exclude(id__in=messages_deleted)
-    elif type_msg == "sent":
-        messages = Message.objects.filter(sender=user).exclude(id__in=messages_deleted)
-    elif type_msg == "trash":
-        messages = messages_deleted
+    start = int(datatable_data['start'][0])
+    length = int(datatable_data['length'][0])
+    after = None
+    if datatable_data.get('after_start', [None])[0] == str(start) and 'after_id' in datatable_data:
+        try:
+            after = Message.objects.filter(id=int(datatable_data['after_id'][0])).first()
+        except ValueError:
+            pass
+    if after:
+        # the next page is taken after the last message of the previous one, no offset to count
+        older = Q(create_time__lt=after.create_time) | Q(create_time=after.create_time, id__lt=after.id)
+        page = messages.filter(older)[:length]
+    else:
+        page = messages[start:start + length]
+    page = list(page.select_related('sender'))
 
+    unread_ids = set(UserProfile.unread_messages.through.objects
+                     .filter(userprofile_id=user_profile.id, message_id__in=[msg.id for msg in page])
+                     .values_list('message_id', flat=True))
     data = list()
-    start = int(datatable_data['start'][0])
-    end = start + int(datatable_data['length'][0])
-    unread = user_profile.unread_messages.all()
-    for msg in messages[start:end]:
+    for msg in page:
         data.append({
             "0": "",
             "1": u'%s %s' % (msg.sender.last_name, msg.sender.first_name),
             "2": msg.title,
             "3": format_date(msg.create_time.astimezone(timezone_pytz(user_profile.time_zone))),
-            "DT_RowClass": "unread" if msg in unread else "",
+            "DT_RowClass": "unread" if msg.id in unread_ids else "",
             "DT_RowId": "row_msg_" + type_msg + "_" + str(msg.id),
             "DT_RowData": {
                 "id": msg.id
@@ -133,8 +143,8 @@ def ajax_get_mailbox(request):
         })
 
     response['draw'] = datatable_data['draw']
-    response['recordsTotal'] = messages.count()
-    response['recordsFiltered'] = messages.count()
+    response['recordsTotal'] = records_total
+    response['recordsFiltered'] = records_total
     response['data'] = data
     response['unread_count'] = user_profile.get_unread_count()
     response['type'] = type_msg
@@ -143,6 +153,23 @@ def ajax_get_mailbox(request):
                         content_type="application/json")
 
 
+def get_mailbox(user_profile, type_msg):
+    """
+    Returns: messages of the mailbox, newest first, and their count kept in the profile
+    """
+    deleted = UserProfile.deleted_messages.through.objects.filter(userprofile_id=user_profile.id,
+                                                                  message_id=OuterRef('pk'))
+    not_deleted = Message.objects.annotate(deleted=Exists(deleted)).filter(deleted=False)
+
+    if type_msg == "inbox":
+        return not_deleted.filter(recipients=user_profile.user_id), user_profile.mail_inbox_count
+    elif type_msg == "sent":
+        return not_deleted.filter(sender_id=user_profile.user_id), user_profile.mail_sent_count
+    elif type_msg == "trash":
+        return user_profile.deleted_messages.all(), user_profile.mail_trash_count
+    return Message.objects.none(), 0
+
+
 def format_date(date):
     date_str = ""
     now = timezone.now()
@@ -170,11 +197,11 @@ def ajax_get_message(request):
     msg_id = int(request.GET["msg_id"])
     message = Message.objects.get(id=msg_id)
 
-    if message.sender != user and user not in message.recipients.all():
+    if message.sender != user and not message.recipients.filter(id=user.id).exists():
         return HttpResponseForbidden()
 
     unread_count = int(request.GET["unread_count"])
-    if message in user_profile.unread_messages.all():
+    if user_profile.unread_messages.filter(id=message.id).exists():
         message.read_message(user)
         unread_count -= 1
 
@@ -260,36 +287,21 @@ def ajax_send_message(request):
     message.variable = variable
     message.save()
 
-    recipients_ids = set()
-
     if "new_recipients_user[]" in data or "new_recipients_preinit[]" in data:
         users = data.get("new_recipients_user[]", [])
         if "new_recipients_preinit[]" in data:
             users += request.session.get('user_ids_send_mail_' + data["new_recipients_preinit[]"][0], [])
         message.recipients_user.set(users)
-        recipients_ids.update(message.recipients_user.values_list('id', flat=True))
 
-    group_ids = []
     if "new_recipients_group[]" in data:
         message.recipients_group.set(data["new_recipients_group[]"])
 
-        for group in Group.objects.filter(id__in=data["new_recipients_group[]"]):
-            recipients_ids.update(group.students.exclude(id=user.id).values_list('id', flat=True))
-            group_ids.append(group.id)
-
     if "new_recipients_course[]" in data:
         message.recipients_course.set(data["new_recipients_course[]"])
 
-        for course in Course.objects.filter(id__in=data["new_recipients_course[]"]):
-            for group in course.groups.exclude(id__in=group_ids).distinct():
-                recipients_ids.update(group.students.exclude(id=user.id).values_list('id', flat=True))
-
     if "new_recipients_status[]" in data:
-        message.recipients_status = data["new_recipients_status[]"]
-
-        recipients_ids.update(UserProfile.objects.filter(user_status__in=data["new_recipients_status[]"])
-                              .values_list('user__id', flat=True))
+        message.recipients_status.set(data["new_recipients_status[]"])
 
-    message.recipients.set(list(recipients_ids))
+    message.send()
 
     return HttpResponse("OK")
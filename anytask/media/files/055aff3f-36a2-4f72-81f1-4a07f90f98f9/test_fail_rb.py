@@ -0,0 +1 @@
+print "_failed_"
\ No newline at end of file
@@ -0,0 +1 @@
+print 1
\ No newline at end of file
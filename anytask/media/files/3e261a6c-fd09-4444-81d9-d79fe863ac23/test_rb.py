@@ -0,0 +1 @@
+print(1)
@@ -0,0 +1 @@
+some text
\ No newline at end of file
@@ -0,0 +1 @@
+print "hello world!"
\ No newline at end of file
@@ -0,0 +1,158 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger('django.request')
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+# Most frequent duplicated queries kept per view
+DUPLICATES_KEPT = 20
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryRecorder(object):
+    """
+    connection.execute_wrapper() callback counting queries and their time, works without DEBUG
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start_time = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.time() - start_time
+            self.count += 1
+            # Parameters are passed separately, so the SQL text is the same for queries differing only in values,
+            # IN lists of any length are folded into one
+            self.fingerprints[IN_LIST_RE.sub('IN (...)', sql)] += 1
+
+
+class QueryCountMiddleware(MiddlewareMixin):
+    """
+    Records query count, duplicated queries, SQL time and total time per view.
+    Aggregates of this process are shown by staff.views.request_stats, every request is also logged,
+    with a warning when a view runs more queries than its budget in QUERY_BUDGETS (or QUERY_BUDGET_DEFAULT).
+    """
+
+    def process_request(self, request):
+        if not getattr(settings, 'QUERY_COUNT_ENABLED', True):
+            return
+
+        request._query_recorder = QueryRecorder()
+        request._query_recorder_start_time = time.time()
+        request._query_recorder_wrapper = connection.execute_wrapper(request._query_recorder)
+        request._query_recorder_wrapper.__enter__()
+
+    def process_response(self, request, response):
+        recorder = getattr(request, '_query_recorder', None)
+        if recorder is None:
+            return response
+        request._query_recorder_wrapper.__exit__(None, None, None)
+        del request._query_recorder
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None:
+            return response
+
+        if response.streaming:
+            # Streaming content is read after the middleware returns, queries of its iterator are counted too
+            response.streaming_content = record_streaming_request(
+                resolver_match.view_name, recorder, request._query_recorder_start_time, response.status_code,
+                response.streaming_content)
+            return response
+
+        record_request(resolver_match.view_name, recorder, time.time() - request._query_recorder_start_time,
+                       response.status_code)
+        return response
+
+
+def record_streaming_request(view_name, recorder, start_time, status_code, streaming_content):
+    try:
+        with connection.execute_wrapper(recorder):
+            for chunk in streaming_content:
+                yield chunk
+    finally:
+        record_request(view_name, recorder, time.time() - start_time, status_code)
+
+
+def record_request(view_name, recorder, total_time, status_code=200):
+    duplicates = dict((sql, count) for sql, count in recorder.fingerprints.items() if count > 1)
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    budget = budgets.get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+    over_budget = budget is not None and recorder.count > budget
+
+    with _stats_lock:
+        view_stats = _stats.setdefault(view_name, {
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'sql_time': 0.,
+            'total_time': 0.,
+            'over_budget': 0,
+            'duplicates': Counter(),
+        })
+        view_stats['requests'] += 1
+        view_stats['queries'] += recorder.count
+        view_stats['max_queries'] = max(view_stats['max_queries'], recorder.count)
+        view_stats['sql_time'] += recorder.time
+        view_stats['total_time'] += total_time
+        view_stats['over_budget'] += int(over_budget)
+        view_stats['duplicates'].update(duplicates)
+        if len(view_stats['duplicates']) > 2 * DUPLICATES_KEPT:
+            view_stats['duplicates'] = Counter(dict(view_stats['duplicates'].most_common(DUPLICATES_KEPT)))
+
+    record = {
+        'view': view_name,
+        'status_code': status_code,
+        'queries': recorder.count,
+        'duplicated_queries': sum(duplicates.values()),
+        'sql_time': round(recorder.time, 4),
+        'total_time': round(total_time, 4),
+    }
+    if over_budget:
+        record['budget'] = budget
+        record['top_duplicates'] = Counter(duplicates).most_common(3)
+        logger.warning("Query budget exceeded, possible N+1: %s", json.dumps(record))
+    else:
+        logger.debug("Request queries: %s", json.dumps(record))
+
+
+def get_stats():
+    """
+    :returns per view aggregates, averages included, duplicates as the most frequent SQL texts
+    """
+    ret = {}
+    with _stats_lock:
+        for view_name, view_stats in _stats.items():
+            requests_count = view_stats['requests']
+            ret[view_name] = {
+                'requests': requests_count,
+                'avg_queries': float(view_stats['queries']) / requests_count,
+                'max_queries': view_stats['max_queries'],
+                'avg_sql_time': view_stats['sql_time'] / requests_count,
+                'avg_total_time': view_stats['total_time'] / requests_count,
+                'over_budget': view_stats['over_budget'],
+                'budget': getattr(settings, 'QUERY_BUDGETS', {}).get(
+                    view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None)),
+                'top_duplicates': view_stats['duplicates'].most_common(5),
+            }
+    return ret
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
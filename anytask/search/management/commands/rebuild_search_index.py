@@ -0,0 +1,80 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from haystack import DEFAULT_ALIAS, connections
+
+from search.models import IndexUpdate
+
+SHADOW_ALIAS = 'shadow'
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Whoosh search index in a new directory and swap it in, search keeps working meanwhile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--using', dest='using', default=DEFAULT_ALIAS,
+                            help='Search connection to rebuild')
+        parser.add_argument('--batch-size', dest='batchsize', type=int, default=None,
+                            help='Number of objects indexed at once')
+
+    def handle(self, **options):
+        start_time = time.time()
+        rebuild_time = timezone.now()
+        using = options['using']
+        path = os.path.abspath(connections.connections_info[using]['PATH'])
+        shadow_path = '{0}.{1}'.format(path, rebuild_time.strftime('%Y%m%d%H%M%S%f'))
+
+        # Changes stay queued until the new index is swapped in, then they are applied to it
+        mark = IndexUpdate.pause()
+        try:
+            build_index(using, shadow_path, batchsize=options['batchsize'], verbosity=options['verbosity'])
+            old_path = swap_index(path, shadow_path)
+        finally:
+            mark.delete()
+        while IndexUpdate.apply(settings.SEARCH_INDEX_BATCH_SIZE):
+            pass
+        if old_path:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+        # logging to cron log
+        print("Command rebuild_search_index rebuild {} took {} seconds".format(shadow_path, time.time() - start_time))
+
+
+def build_index(using, path, **options):
+    """
+    Indexes all objects of the `using` connection into a new index at `path`
+    """
+    connections.connections_info[SHADOW_ALIAS] = dict(connections.connections_info[using], PATH=path)
+    try:
+        call_command('update_index', using=[SHADOW_ALIAS], **options)
+    except Exception:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    finally:
+        del connections.connections_info[SHADOW_ALIAS]
+        getattr(connections.thread_local, 'connections', {}).pop(SHADOW_ALIAS, None)
+
+
+def swap_index(path, new_path):
+    """
+    Makes `path` a symlink to `new_path`. A symlink is replaced atomically, so processes searching the index
+    see either the old or the new one. A directory at `path` is moved aside first.
+    Returns: directory `path` pointed to before
+    """
+    link_path = '{0}.link'.format(new_path)
+    os.symlink(os.path.basename(new_path), link_path)
+
+    old_path = None
+    if os.path.islink(path):
+        old_path = os.path.realpath(path)
+    elif os.path.exists(path):
+        old_path = '{0}.old'.format(new_path)
+        os.rename(path, old_path)
+
+    os.replace(link_path, path)
+    return old_path
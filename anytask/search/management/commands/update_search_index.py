@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from search.models import IndexUpdate
+
+
+class Command(BaseCommand):
+    help = "Apply changes queued by search.signals.QueuedSignalProcessor to the search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', dest='loop', action='store_true', default=False,
+                            help='Keep waiting for new changes')
+
+    def handle(self, **options):
+        start_time = time.time()
+        updates_count = 0
+        while True:
+            applied = IndexUpdate.apply(settings.SEARCH_INDEX_BATCH_SIZE)
+            updates_count += applied
+
+            if applied:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(settings.SEARCH_INDEX_POLL_INTERVAL)
+
+        # logging to cron log
+        print("Command update_search_index apply {} changes took {} seconds"
+              .format(updates_count, time.time() - start_time))
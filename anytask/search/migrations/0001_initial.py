@@ -0,0 +1,24 @@
+# Generated by Django 2.0.13 on 2026-10-17 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=191)),
+                ('object_id', models.IntegerField()),
+                ('is_delete', models.BooleanField(default=False)),
+                ('added_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
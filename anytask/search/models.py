@@ -1 +1,72 @@
-# Create your models here.
+from django.apps import apps
+from django.db import models
+from haystack import connection_router, connections
+from haystack.exceptions import NotHandled
+from haystack.utils import get_model_ct
+
+
+class IndexUpdate(models.Model):
+    """
+    Change of an indexed object queued by search.signals.QueuedSignalProcessor,
+    applied to the search index by the update_search_index command
+    """
+    model = models.CharField(max_length=191)
+    object_id = models.IntegerField()
+    is_delete = models.BooleanField(default=False)
+
+    added_time = models.DateTimeField(auto_now_add=True)
+
+    # Row of this model stops apply() while the rebuild_search_index command builds a new index
+    REBUILD_MARK = 'rebuild'
+
+    @classmethod
+    def enqueue(cls, model, object_ids, is_delete=False):
+        model_ct = get_model_ct(model)
+        cls.objects.bulk_create([cls(model=model_ct, object_id=object_id, is_delete=is_delete)
+                                 for object_id in object_ids])
+
+    @classmethod
+    def pause(cls):
+        """
+        Keeps queued changes from the index until the returned mark is deleted.
+        Marks left by an interrupted rebuild are removed.
+        """
+        cls.objects.filter(model=cls.REBUILD_MARK).delete()
+        return cls.objects.create(model=cls.REBUILD_MARK, object_id=0)
+
+    @classmethod
+    def apply(cls, limit):
+        """
+        Applies the oldest queued changes to the index, every changed object is reindexed or removed once.
+        Nothing is applied while paused.
+        Returns: number of applied changes
+        """
+        if cls.objects.filter(model=cls.REBUILD_MARK).exists():
+            return 0
+        updates = list(cls.objects.order_by('id')[:limit])
+
+        changed = {}
+        for update in updates:
+            changed.setdefault(update.model, {})[update.object_id] = update.is_delete
+
+        for model_ct, objects in changed.items():
+            model = apps.get_model(model_ct)
+            object_ids = set(object_id for object_id, is_delete in objects.items() if not is_delete)
+            for using in connection_router.for_write(models=[model]):
+                backend = connections[using].get_backend()
+                try:
+                    index = connections[using].get_unified_index().get_index(model)
+                except NotHandled:
+                    continue
+
+                indexed = list(index.index_queryset(using=using).filter(pk__in=object_ids))
+                if indexed:
+                    backend.update(index, indexed)
+                # Removed objects and the ones index_queryset leaves out
+                indexed_ids = set(obj.pk for obj in indexed)
+                for object_id in objects:
+                    if object_id not in indexed_ids:
+                        backend.remove('{0}.{1}'.format(model_ct, object_id))
+
+        cls.objects.filter(id__in=[update.id for update in updates]).delete()
+        return len(updates)
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.db import models
+from haystack import signals
+from haystack.exceptions import NotHandled
+
+from search.models import IndexUpdate
+from users.models import UserProfile, profiles_touched
+
+
+class QueuedSignalProcessor(signals.BaseSignalProcessor):
+    """
+    Queues saves and deletes of indexed objects instead of updating the index in the request,
+    the update_search_index command applies them in batches. Profiles are also queued when their user
+    is saved and when their visibility facts change (users.models.profiles_touched).
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+        profiles_touched.connect(self.handle_touch)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+        profiles_touched.disconnect(self.handle_touch)
+
+    def is_indexed(self, model):
+        for using in self.connection_router.for_write(models=[model]):
+            try:
+                self.connections[using].get_unified_index().get_index(model)
+                return True
+            except NotHandled:
+                pass
+        return False
+
+    def handle_save(self, sender, instance, update_fields=None, **kwargs):
+        if sender is User:
+            if update_fields is None or set(update_fields) - {'last_login', 'password'}:
+                IndexUpdate.enqueue(UserProfile, UserProfile.objects.filter(user=instance).values_list('id', flat=True))
+        elif self.is_indexed(sender):
+            IndexUpdate.enqueue(sender, [instance.pk])
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if self.is_indexed(sender):
+            IndexUpdate.enqueue(sender, [instance.pk], is_delete=True)
+
+    def handle_touch(self, sender, user_ids, **kwargs):
+        IndexUpdate.enqueue(UserProfile, UserProfile.objects.filter(user_id__in=user_ids).values_list('id', flat=True))
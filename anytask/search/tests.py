@@ -5,7 +5,25 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from haystack import connections
+from mock import patch
+
+from courses.models import Course
+from groups.models import Group
+from schools.models import School
+from search.models import IndexUpdate
+from search.views import search_users
+from users.models import UserProfile
+from years.models import Year
 
 
 class SimpleTest(TestCase):
@@ -14,3 +32,132 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class SearchUsersTest(TestCase):
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.path = os.path.join(temp_dir, 'whoosh')
+        self.connection_info = patch.dict(connections.connections_info['default'], PATH=self.path)
+        self.connection_info.start()
+        connections.reload('default')
+        self.addCleanup(connections.reload, 'default')
+        self.addCleanup(self.connection_info.stop)
+
+        year = Year.objects.create(start_year=2016)
+        self.teacher = User.objects.create_user(username='teacher', password='password', email='teacher@test.ru')
+        self.student = User.objects.create_user(username='student', password='password', email='student@test.ru')
+        self.classmate = User.objects.create_user(username='classmate', password='password',
+                                                  email='classmate@test.ru')
+        self.stranger = User.objects.create_user(username='stranger', password='password', email='stranger@test.ru')
+        UserProfile.objects.filter(user=self.classmate).update(show_email=False)
+        UserProfile.objects.filter(user=self.teacher).update(show_email=False)
+
+        group = Group.objects.create(name='group', year=year)
+        group.students.set([self.student, self.classmate])
+        course = Course.objects.create(name='course', year=year)
+        course.groups.set([group])
+        course.teachers.set([self.teacher])
+        other_course = Course.objects.create(name='other_course', year=year)
+        other_course.teachers.set([self.stranger])
+        school = School.objects.create(name='school', link='school')
+        school.courses.set([course])
+
+        self.index = connections['default'].get_unified_index().get_index(UserProfile)
+        self.index.clear()
+        self.index.update()
+        IndexUpdate.objects.all().delete()
+
+    def search(self, user, query):
+        return dict((item['username'], item) for item in search_users(query, user)[0])
+
+    def test_search_users_visibility(self):
+        result = self.search(self.student, 'tea')
+        self.assertEqual(set(result), {'teacher'})
+        self.assertEqual(result['teacher']['email'], 'teacher@test.ru')
+
+        result = self.search(self.classmate, 'stud')
+        self.assertEqual(set(result), {'student'})
+        self.assertEqual(result['student']['email'], 'student@test.ru')
+
+        result = self.search(self.student, 'class')
+        self.assertEqual(result['classmate']['email'], '')
+
+        result = self.search(self.teacher, 'class')
+        self.assertEqual(result['classmate']['email'], 'classmate@test.ru')
+
+        self.assertEqual(self.search(self.stranger, 'stud'), {})
+        self.assertEqual(set(self.search(User.objects.create_user(username='admin', is_staff=True), 'str')),
+                         {'stranger'})
+
+    def test_search_users_reindex(self):
+        update_time = UserProfile.objects.get(user=self.classmate).update_time
+        Group.objects.get().students.remove(self.classmate)
+        self.assertGreater(UserProfile.objects.get(user=self.classmate).update_time, update_time)
+
+        self.index.update()
+        self.assertEqual(self.search(self.student, 'class'), {})
+
+    def test_search_users_queries(self):
+        self.search(self.teacher, 'stud')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.search(self.teacher, 'stud')), 1)
+        num_queries = len(queries)
+
+        group = Group.objects.get()
+        for i in range(5):
+            group.students.add(User.objects.create_user(username='student_{}'.format(i)))
+        self.index.update()
+        with self.assertNumQueries(num_queries):
+            self.assertEqual(len(self.search(self.teacher, 'stud')), 6)
+
+    def test_update_search_index(self):
+        group = Group.objects.get()
+        newcomer = User.objects.create_user(username='newcomer', password='password')
+        group.students.add(newcomer)
+        self.assertEqual(self.search(self.student, 'newc'), {})
+
+        call_command('update_search_index')
+        self.assertEqual(set(self.search(self.student, 'newc')), {'newcomer'})
+        self.assertFalse(IndexUpdate.objects.exists())
+
+        newcomer.first_name = 'Ivan'
+        newcomer.save()
+        call_command('update_search_index')
+        self.assertEqual(set(self.search(self.teacher, 'ivan')), {'newcomer'})
+
+        group.students.remove(newcomer)
+        call_command('update_search_index')
+        self.assertEqual(self.search(self.teacher, 'ivan'), {})
+
+        profile = UserProfile.objects.get(user=newcomer)
+        profile.delete()
+        call_command('update_search_index')
+        self.assertEqual(self.search(User.objects.create_user(username='admin', is_staff=True), 'newc'), {})
+
+    def test_rebuild_search_index(self):
+        for i in range(2):
+            call_command('rebuild_search_index', verbosity=0)
+            self.assertTrue(os.path.islink(self.path))
+            self.assertEqual(len(os.listdir(os.path.dirname(self.path))), 2)
+            self.assertEqual(set(self.search(self.student, 'tea')), {'teacher'})
+
+    def test_rebuild_search_index_changes(self):
+        def update_index(*args, **kwargs):
+            call_command(*args, **kwargs)
+            # changes made while the new index is built, queued changes are not applied to the old one
+            UserProfile.objects.get(user=self.classmate).delete()
+            self.teacher.first_name = 'Ivan'
+            self.teacher.save()
+            call_command('update_search_index')
+            self.assertEqual(self.search(self.student, 'ivan'), {})
+
+        with patch('search.management.commands.rebuild_search_index.call_command', side_effect=update_index):
+            call_command('rebuild_search_index', verbosity=0)
+        self.assertEqual(self.search(self.teacher, 'clas'), {})
+        self.assertEqual(set(self.search(self.student, 'ivan')), {'teacher'})
+        self.assertFalse(IndexUpdate.objects.exists())
+
+        call_command('update_search_index')
+        self.assertFalse(IndexUpdate.objects.exists())
@@ -62,14 +62,22 @@ def ajax_search_courses(request):
 
 
 def search_users(query, user, max_result=None):
+    """
+    Users are visible to the ones sharing a school with them, staff see everyone. Email is shown
+    if the user allows it, teaches the searching user or is taught by them. Visibility is filtered
+    by the search backend on the facts indexed in UserProfileIndex.
+    """
     result = []
     result_objs = []
 
     if query:
         user_is_staff = user.is_staff
         user_is_teacher = None
+        courses = courses_teacher = set()
         if not user_is_staff:
-            user_is_teacher = True if Course.objects.filter(teachers=user).count() else False
+            courses = set(Course.objects.filter(groups__students=user).values_list('id', flat=True))
+            courses_teacher = set(Course.objects.filter(teachers=user).values_list('id', flat=True))
+            user_is_teacher = bool(courses_teacher)
 
         sgs = SearchQuerySet().models(UserProfile).exclude(user_id=user.id)
 
@@ -89,69 +97,32 @@ def search_users(query, user, max_result=None):
         sgs = sgs_fullname | sgs_login | sgs_ya_contest_login | sgs_ya_passport_email | sgs_email
 
         if not user_is_staff:
-            groups = user.group_set.all()
-            courses = Course.objects.filter(groups__in=groups)
-            schools = School.objects.filter(courses__in=courses)
-            courses_teacher = Course.objects.filter(teachers=user)
-            schools_teacher = School.objects.filter(courses__in=courses_teacher)
-
-            for sg in sgs:
-                user_to_show = sg.object.user
-                groups_user_to_show = user_to_show.group_set.all()
-                courses_user_to_show = Course.objects.filter(groups__in=groups_user_to_show)
-                schools_user_to_show = School.objects.filter(courses__in=courses_user_to_show)
-                courses_user_to_show_teacher = Course.objects.filter(teachers=user_to_show)
-                schools_user_to_show_teacher = School.objects.filter(courses__in=courses_user_to_show_teacher)
-
-                user_school_user_to_show = False
-                if (schools_user_to_show | schools_user_to_show_teacher) & (schools | schools_teacher):
-                    user_school_user_to_show = True
-
-                if not user_school_user_to_show:
-                    continue
-                user_to_show_teach_user = False
-                if courses_user_to_show_teacher & courses:
-                    user_to_show_teach_user = True
-
-                user_teach_user_to_show = False
-                if courses_teacher & courses_user_to_show:
-                    user_teach_user_to_show = True
-
-                show_email = \
-                    sg.object.show_email or \
-                    user_teach_user_to_show or \
-                    user_to_show_teach_user
-
-                result.append({
-                    "fullname": user_to_show.get_full_name(),
-                    "username": user_to_show.username,
-                    "ya_contest_login": sg.object.ya_contest_login if user_is_teacher else '',
-                    "url": user_to_show.get_absolute_url(),
-                    "avatar": sg.object.avatar.url if sg.object.avatar else '',
-                    "email": user_to_show.email if show_email else '',
-                    "ya_passport_email": sg.object.ya_passport_email if show_email else '',
-                    "id": user_to_show.id,
-                    "statuses": list(sg.object.user_status.values_list('name', 'color'))
-                })
-                result_objs.append(sg.object)
-
-                if len(result) == max_result:
-                    break
+            schools = list(School.objects
+                           .filter(courses__in=courses | courses_teacher)
+                           .values_list('id', flat=True)
+                           .distinct())
+            if not schools:
+                return result, result_objs
+            sgs = sgs.filter(school_ids__in=schools)
+
+        for sg in sgs.load_all()[:max_result]:
+            user_to_show = sg.object.user
+            show_email = user_is_staff or sg.object.show_email \
+                or not courses_teacher.isdisjoint(int(course_id) for course_id in sg.course_ids or ()) \
+                or not courses.isdisjoint(int(course_id) for course_id in sg.teacher_course_ids or ())
 
-        else:
-            for sg in sgs[:max_result]:
-                result.append({
-                    "fullname": sg.object.user.get_full_name(),
-                    "username": sg.object.user.username,
-                    "ya_contest_login": sg.object.ya_contest_login,
-                    "url": sg.object.user.get_absolute_url(),
-                    "avatar": sg.object.avatar.url if sg.object.avatar else '',
-                    "email": sg.object.user.email,
-                    "ya_passport_email": sg.object.ya_passport_email,
-                    "id": sg.object.user.id,
-                    "statuses": list(sg.object.user_status.values_list('name', 'color'))
-                })
-                result_objs.append(sg.object)
+            result.append({
+                "fullname": user_to_show.get_full_name(),
+                "username": user_to_show.username,
+                "ya_contest_login": sg.object.ya_contest_login if user_is_staff or user_is_teacher else '',
+                "url": user_to_show.get_absolute_url(),
+                "avatar": sg.object.avatar.url if sg.object.avatar else '',
+                "email": user_to_show.email if show_email else '',
+                "ya_passport_email": sg.object.ya_passport_email if show_email else '',
+                "id": user_to_show.id,
+                "statuses": [(status.name, status.color) for status in sg.object.user_status.all()]
+            })
+            result_objs.append(sg.object)
 
     return result, result_objs
 
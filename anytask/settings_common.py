@@ -119,6 +119,7 @@ SECRET_KEY = '3$uum*a)#mnl()ds5em&scsv9gz*!fwbqa&%apz&ccbdukyyku'
 # List of callables that know how to import templates from various sources.
 
 MIDDLEWARE = [
+    'anytask.middleware.query_count_middleware.QueryCountMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -257,6 +258,11 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 MAX_FILE_SIZE = 100 * 1024 * 1024
 
 EMAIL_DEFAULT_BCC = None
+# Notification emails sent per second on average and at once, see common.mail
+EMAIL_RATE_LIMIT = 5
+EMAIL_RATE_BURST = 10
+# Issues whose events are sent and marked sent at once by send_notifications
+NOTIFICATIONS_BATCH_SIZE = 100
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
@@ -266,6 +272,8 @@ HAYSTACK_CONNECTIONS = {
         'PATH': os.path.join(PROJECT_PATH, 'search/whoosh'),
     },
 }
+# Changes of indexed objects are queued and applied by the update_search_index command
+HAYSTACK_SIGNAL_PROCESSOR = 'search.signals.QueuedSignalProcessor'
 
 TEST_RUNNER = 'runner.ExcludeAppsTestSuiteRunner'
 
@@ -321,6 +329,83 @@ PREMAILER_OPTIONS = {
 }
 
 API_LANGUAGE_CODE = 'en'
+# Per view query counting, see anytask.middleware.query_count_middleware
+QUERY_COUNT_ENABLED = True
+# Queries per request above which a possible N+1 is logged, by url name
+QUERY_BUDGETS = {
+    'courses.views.gradebook': 40,
+    'courses.views.ajax_get_queue': 40,
+    'issues.views.issue_page': 60,
+    'api.views.get_issues': 30,
+}
+QUERY_BUDGET_DEFAULT = None
+
+# Issues loaded from database at once by streaming API responses
+API_STREAM_CHUNK_SIZE = 500
+# Seconds events wait before they are returned by the events feed, longer than any request adding events lasts
+API_EVENTS_FEED_LAG = 120
+
+# Seconds before in-process copies of issue fields and statuses are reloaded
+REGISTRY_TTL = 300
+
+# Seconds a course gradebook snapshot is kept; snapshots are also dropped on any change of course results.
+# Snapshots are kept only with a CACHES backend shared by all processes, e.g. memcached, not the local memory one
+GRADEBOOK_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Contest verdict polling by check_contest, see anycontest.poller
+# Concurrent results requests and requests per second allowed for one OAuth token
+CONTEST_POLL_WORKERS = 8
+CONTEST_POLL_RATE = 5
+# Waiting and running runs are checked again after this fraction of their age, but at least every
+# CONTEST_POLL_MAX_DELAY seconds
+CONTEST_POLL_BACKOFF = 0.1
+CONTEST_POLL_MAX_DELAY = 300
+# Checked submissions saved in one transaction
+CONTEST_POLL_BATCH_SIZE = 50
+# Seconds between checks of check_contest --loop
+CONTEST_POLL_INTERVAL = 5
+# Seconds to wait for a Contest response
+CONTEST_POLL_TIMEOUT = 30
+
+# Seconds Contest metadata (contest info, problems, compilers) is used without asking Contest again,
+# and seconds an old copy is still used while Contest does not answer, see anycontest.contest_cache
+CONTEST_METADATA_TTL = 10 * 60
+CONTEST_METADATA_STALE_TTL = 24 * 60 * 60
+# Seconds to wait for Contest metadata
+CONTEST_METADATA_TIMEOUT = 5
+
+# Contest, Review Board and easyCI are called for new comments by the run_issue_jobs command,
+# False calls them in the request
+ISSUE_JOBS_ASYNC = True
+# Attempts of a job, seconds before its first retry (doubled with every attempt)
+ISSUE_JOBS_MAX_ATTEMPTS = 5
+ISSUE_JOBS_RETRY_DELAY = 30
+# Seconds after which a job left running by a stopped worker is run again
+ISSUE_JOBS_TIMEOUT = 15 * 60
+# Seconds to wait for easyCI
+ISSUE_JOBS_REQUEST_TIMEOUT = 30
+# Jobs taken at once, seconds between checks of run_issue_jobs --loop when the queue is empty
+ISSUE_JOBS_BATCH_SIZE = 20
+ISSUE_JOBS_POLL_INTERVAL = 2
+
+# Messages to more recipients are fanned out by the fan_out_messages command, None adds them in the request
+MAIL_FAN_OUT_ASYNC_MIN_RECIPIENTS = 500
+# Seconds between checks of fan_out_messages --loop
+MAIL_FAN_OUT_POLL_INTERVAL = 2
+
+# Connections kept open to Review Board by a process, seconds to wait for it
+RB_API_POOL_SIZE = 10
+RB_API_TIMEOUT = 30
+# Seconds diffs of uploaded files are kept by their content, see anyrb.common.get_file_diff
+RB_DIFF_CACHE_TTL = 24 * 60 * 60
+
+# Seconds the "my courses" statistics of a student are kept, they are also dropped when the gradebook
+# of one of the courses changes. Kept only with a shared cache backend, like gradebook snapshots
+USER_COURSES_CACHE_TIMEOUT = 60 * 60
+
+# Queued search index changes applied at once, seconds between checks of update_search_index --loop
+SEARCH_INDEX_BATCH_SIZE = 500
+SEARCH_INDEX_POLL_INTERVAL = 2
 
 JUPYTER_NBGRADER_API_URL = ''
 
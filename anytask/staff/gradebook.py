@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import zipfile
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.utils.html import escape
+
+from courses.models import Course, StudentCourseMark
+
+NOT_IN_COURSE = ('--', '-2')
+NO_MARK = ('--', '-1')
+
+# Excel runs a cell starting with one of these as a formula
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def build_gradebook(profiles):
+    """
+    Builds student x course matrix of marks of the users of the profiles in every course
+    they have a mark in. Cell is (mark name, mark name_int), NO_MARK if the student is in the course
+    without a mark and NOT_IN_COURSE otherwise. Takes four queries for any number of students.
+    :returns courses and rows with name, url and marks of every student
+    """
+    student_ids = profiles.values('user_id')
+    marks = StudentCourseMark.objects \
+        .filter(student_id__in=student_ids) \
+        .values_list('student_id', 'course_id', 'mark__name', 'mark__name_int')
+
+    student_marks = defaultdict(dict)
+    course_ids = set()
+    for student_id, course_id, mark_name, mark_name_int in marks:
+        course_ids.add(course_id)
+        if mark_name is not None:
+            student_marks[student_id][course_id] = mark_name, mark_name_int
+
+    courses = list(Course.objects.filter(id__in=course_ids).order_by('name', 'id'))
+
+    memberships = Course.groups.through.objects \
+        .filter(course_id__in=course_ids, group__students__in=student_ids) \
+        .values_list('group__students', 'course_id') \
+        .distinct()
+    student_courses = defaultdict(set)
+    for student_id, course_id in memberships:
+        student_courses[student_id].add(course_id)
+
+    rows = []
+    for student in User.objects \
+            .filter(id__in=student_ids) \
+            .only('username', 'first_name', 'last_name') \
+            .order_by('last_name', 'first_name', 'id'):
+        in_courses = student_courses[student.id]
+        marks = student_marks[student.id]
+        rows.append({
+            'name': student.get_full_name(),
+            'url': student.get_absolute_url(),
+            'marks': [marks.get(course.id, NO_MARK) if course.id in in_courses else NOT_IN_COURSE
+                      for course in courses],
+        })
+
+    return courses, rows
+
+
+def iter_table(courses, rows, student_title):
+    yield [student_title] + [course.name for course in courses]
+    for row in rows:
+        yield [row['name']] + [mark for mark, _ in row['marks']]
+
+
+class Echo(object):
+    """
+    File-like object returning what is written, lets csv.writer produce lines for streaming
+    """
+
+    def write(self, value):
+        return value
+
+
+def escape_csv_cell(value):
+    """
+    Prefixes text Excel would take for a formula, such as a student name =HYPERLINK(...), with a quote.
+    The '--' of a missing mark is left as is.
+    """
+    if value.startswith(CSV_FORMULA_PREFIXES) and value != NO_MARK[0]:
+        return "'" + value
+    return value
+
+
+def iter_csv(table):
+    # BOM makes Excel read the file as UTF-8
+    yield u'\ufeff'
+    writer = csv.writer(Echo())
+    for line in table:
+        yield writer.writerow([escape_csv_cell(value) for value in line])
+
+
+def make_xlsx(table):
+    """
+    Minimal Office Open XML workbook with one sheet of inline string cells
+    """
+    sheet_rows = []
+    for i, line in enumerate(table, 1):
+        cells = ''.join('<c t="inlineStr"><is><t>{0}</t></is></c>'.format(escape(value)) for value in line)
+        sheet_rows.append('<row r="{0}">{1}</row>'.format(i, cells))
+
+    parts = {
+        '[Content_Types].xml':
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>',
+        '_rels/.rels':
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>',
+        'xl/workbook.xml':
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Gradebook" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>',
+        'xl/_rels/workbook.xml.rels':
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+            '</Relationships>',
+        'xl/worksheets/sheet1.xml':
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<sheetData>' + ''.join(sheet_rows) + '</sheetData>'
+            '</worksheet>',
+    }
+
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w', zipfile.ZIP_DEFLATED) as xlsx:
+        for name, part in parts.items():
+            xlsx.writestr(name, part.encode('utf-8'))
+    return content.getvalue()
@@ -5,7 +5,22 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import io
+import json
+import zipfile
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from anytask.middleware import query_count_middleware
+from courses.models import Course, MarkField, StudentCourseMark
+from groups.models import Group
+from users.model_user_status import UserStatus
+from years.models import Year
 
 
 class SimpleTest(TestCase):
@@ -14,3 +29,134 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class RequestStatsTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.user = User.objects.create_user(username='user', password='password')
+        query_count_middleware.reset_stats()
+
+    def test_request_stats(self):
+        self.assertTrue(self.client.login(username='staff', password='password'))
+        with override_settings(QUERY_BUDGETS={'index.views.index': 0}):
+            with self.assertLogs('django.request', 'WARNING') as logs:
+                self.client.get(reverse('index.views.index'))
+        self.assertIn('index.views.index', logs.output[0])
+
+        response = self.client.get(reverse('staff.views.request_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['X-Process-Id'])
+        stats = json.loads(response.content)['index.views.index']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['over_budget'], 1)
+        self.assertGreater(stats['max_queries'], 0)
+
+    def test_request_stats_streaming(self):
+        def iter_content():
+            yield str(User.objects.count())
+            yield str(User.objects.count())
+
+        request = RequestFactory().get('/')
+        request.resolver_match = resolve(reverse('index.views.index'))
+        middleware = query_count_middleware.QueryCountMiddleware()
+        middleware.process_request(request)
+        response = middleware.process_response(request, StreamingHttpResponse(iter_content()))
+        self.assertEqual(query_count_middleware.get_stats(), {})
+
+        self.assertEqual(b''.join(response.streaming_content), b'22')
+        self.assertEqual(query_count_middleware.get_stats()['index.views.index']['max_queries'], 2)
+
+    def test_request_stats_duplicates(self):
+        recorder = query_count_middleware.QueryRecorder()
+        for params in ([1], [1, 2], [1, 2, 3]):
+            sql = 'SELECT * FROM auth_user WHERE id IN ({0})'.format(', '.join(['%s'] * len(params)))
+            recorder(lambda *args: None, sql, params, False, {})
+        self.assertEqual(dict(recorder.fingerprints), {'SELECT * FROM auth_user WHERE id IN (...)': 3})
+
+        for i in range(100):
+            recorder.fingerprints['SELECT {0}'.format(i)] = 2
+            query_count_middleware.record_request('view', recorder, 0.)
+        stats = query_count_middleware.get_stats()['view']
+        self.assertLessEqual(len(query_count_middleware._stats['view']['duplicates']),
+                             2 * query_count_middleware.DUPLICATES_KEPT)
+        self.assertEqual(stats['top_duplicates'][0], ('SELECT * FROM auth_user WHERE id IN (...)', 300))
+
+    def test_request_stats_not_staff(self):
+        self.assertTrue(self.client.login(username='user', password='password'))
+        response = self.client.get(reverse('staff.views.request_stats'))
+        self.assertEqual(response.status_code, 403)
+
+
+class GradebookTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.status = UserStatus.objects.create(name='active', type=UserStatus.TYPE_ACTIVITY)
+        year = Year.objects.create(start_year=2016)
+        self.courses = []
+        for i in range(2):
+            group = Group.objects.create(name='group_{}'.format(i), year=year)
+            course = Course.objects.create(name='course_{}'.format(i), year=year)
+            course.groups.set([group])
+            self.courses.append(course)
+
+        self.students = []
+        mark = MarkField.objects.create(name='excellent', name_int=5)
+        for i in range(3):
+            student = User.objects.create_user(username='student_{}'.format(i), password='password',
+                                               first_name='First', last_name='Last_{}'.format(i))
+            student.profile.user_status.set([self.status])
+            self.courses[0].groups.get().students.add(student)
+            self.students.append(student)
+        StudentCourseMark.objects.create(student=self.students[0], course=self.courses[0], mark=mark)
+        StudentCourseMark.objects.create(student=self.students[1], course=self.courses[1])
+
+        self.url = reverse('staff.views.gradebook_page', kwargs={'statuses': str(self.status.id)})
+        self.assertTrue(self.client.login(username='staff', password='password'))
+
+    def test_gradebook_page(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['courses'], self.courses)
+        self.assertEqual([(student['name'], student['marks']) for student in response.context['students']], [
+            ('First Last_0', [('excellent', 5), ('--', '-2')]),
+            ('First Last_1', [('--', '-1'), ('--', '-2')]),
+            ('First Last_2', [('--', '-1'), ('--', '-2')]),
+        ])
+
+    def test_gradebook_page_queries(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        num_queries = len(queries)
+
+        for i in range(3, 20):
+            student = User.objects.create_user(username='student_{}'.format(i), password='password')
+            student.profile.user_status.set([self.status])
+            self.courses[i % 2].groups.get().students.add(student)
+            StudentCourseMark.objects.create(student=student, course=self.courses[i % 2])
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['students']), 20)
+
+    def test_gradebook_export(self):
+        self.students[2].first_name = '@SUM(1)'
+        self.students[2].save()
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'\xef\xbb\xbf'))
+        lines = content.decode('utf-8-sig').splitlines()
+        self.assertTrue(lines[0].endswith(',course_0,course_1'))
+        self.assertEqual(lines[1:], [
+            'First Last_0,excellent,--',
+            'First Last_1,--,--',
+            "'@SUM(1) Last_2,--,--",
+        ])
+
+        response = self.client.get(self.url, {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(response.content)) as xlsx:
+            sheet = xlsx.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn('<t>course_1</t>', sheet)
+        self.assertIn('<t>excellent</t>', sheet)
@@ -12,5 +12,7 @@ urlpatterns = (
     url(r'gradebook/(?P<statuses>\w+)$', staff.views.gradebook_page,
         name="staff.views.gradebook_page"),
     url(r'gradebook_page', staff.views.gradebook_page,
-        name="staff.views.gradebook_page")
+        name="staff.views.gradebook_page"),
+    url(r'request_stats$', staff.views.request_stats,
+        name="staff.views.request_stats"),
 )
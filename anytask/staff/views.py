@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from django.shortcuts import render, get_object_or_404
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.core.exceptions import PermissionDenied
 
 from django.contrib.auth.decorators import login_required
@@ -12,15 +12,17 @@ from django.db.models.signals import post_save
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import HTML
 
-from courses.models import StudentCourseMark
 from users.models import UserProfile
 from users.model_user_profile_filter import UserProfileFilter
 from users.model_user_status import UserStatus, get_statuses
 
+from anytask.middleware import query_count_middleware
+from staff import gradebook
 from reversion import revisions as reversion
 import csv
 import logging
 import json
+import os
 
 logger = logging.getLogger('django.request')
 
@@ -178,38 +180,49 @@ def gradebook_page(request, statuses=None):
         student_ids = request.session['user_ids_send_mail_' + request.GET['from_staff']]
         profiles = UserProfile.objects.filter(user_id__in=student_ids).all()
 
-    students = set()
-    for profile in profiles:
-        students.add(profile.user)
-
-    marks = StudentCourseMark.objects.filter(student__in=students).order_by('course')
-
-    courses = set()
-    for mark in marks:
-        courses.add(mark.course)
-
-    students_with_marks = []
-    for student in students:
-        entry = {}
-        marks_for_student = []
-        entry['name'] = student.get_full_name()
-        entry['url'] = student.get_absolute_url()
-        for course in courses:
-            if course.get_user_group(student):
-                if marks.filter(student=student, course=course).exclude(mark__isnull=True):
-                    mark = marks.get(student=student, course=course).mark
-                    mark = mark.name, mark.name_int
-                else:
-                    mark = '--', '-1'
-            else:
-                mark = ('--', '-2')
-            marks_for_student.append(mark)
-        entry['marks'] = marks_for_student
-        students_with_marks.append(entry)
-
+    else:
+        profiles = UserProfile.objects.none()
+
+    courses, students = gradebook.build_gradebook(profiles)
+
+    export_format = request.GET.get('format')
+    if export_format == 'csv':
+        response = StreamingHttpResponse(gradebook.iter_csv(gradebook.iter_table(courses, students, _(u'student'))),
+                                         content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="gradebook.csv"'
+        return response
+    if export_format == 'xlsx':
+        response = HttpResponse(gradebook.make_xlsx(gradebook.iter_table(courses, students, _(u'student'))),
+                                content_type=gradebook.XLSX_CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="gradebook.xlsx"'
+        return response
+
+    export_query = request.GET.copy()
+    export_query.pop('format', None)
     context = {
-        'students': students_with_marks,
+        'students': students,
         'courses': courses,
+        'export_query': export_query.urlencode(),
     }
 
     return render(request, 'gradebook.html', context)
+
+
+@require_http_methods(['GET', 'POST'])
+@login_required
+def request_stats(request):
+    """
+    Per view query counts and timings collected by QueryCountMiddleware, POST resets them.
+    Only the worker process answering the request is seen (X-Process-Id), request logs cover all of them.
+    """
+    user = request.user
+
+    if not user.is_staff:
+        raise PermissionDenied
+
+    if request.method == 'POST':
+        query_count_middleware.reset_stats()
+
+    response = HttpResponse(json.dumps(query_count_middleware.get_stats()), content_type="application/json")
+    response['X-Process-Id'] = os.getpid()
+    return response
@@ -82,9 +82,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         for course in Course.objects.filter(is_python_task=True):
-            for task in course.task_set.all():
-                for task_taken in TaskTaken.objects.filter(task=task):
-                    task_taken.update_status()
+            TaskTaken.reconcile(TaskTaken.objects.filter(task__course=course))
 
             self.out_lines.append("Course '{0}'".format(course))
             self.check_course_task_taken_expires(course)
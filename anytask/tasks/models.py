@@ -15,6 +15,7 @@ from django.urls import reverse
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.html import escape
 
+from courses import gradebook_cache
 from courses.models import Course
 from groups.models import Group
 
@@ -128,9 +129,6 @@ class Task(models.Model):
         return self.max_students or self.course.max_students_per_task or settings.PYTHONTASK_MAX_USERS_PER_TASK
 
     def user_can_take_task(self, user):
-        for task_taken in TaskTaken.objects.filter(task=self):
-            task_taken.update_status()
-
         if user.is_anonymous:
             return (False, 'Необходимо залогиниться')
 
@@ -167,7 +165,8 @@ class Task(models.Model):
         if max_incomplete_tasks:
             all_scored = TaskTaken.objects.filter(user=user).filter(task__course=self.course) \
                                                             .filter(Q(Q(status=TaskTaken.STATUS_TAKEN) | Q(
-                                                                status=TaskTaken.STATUS_SCORED)))
+                                                                status=TaskTaken.STATUS_SCORED))) \
+                                                            .select_related('task', 'issue')
             if sum(t.score != t.task.score_max for t in all_scored) + 1 > max_incomplete_tasks:
                 return (False, u'У вас слишком много не до конца доделанных задач')
 
@@ -384,27 +383,47 @@ class TaskTaken(models.Model):
 
     @property
     def score(self):
-        self.update_status()
-        if not self.issue:
+        if not self.issue_id:
             return 0
         return self.issue.mark
 
     def update_status(self):
-        if self.issue and abs(self.issue.mark) > sys.float_info.epsilon and self.status != self.STATUS_SCORED:
-            self.scored()
-
-        if not self.issue.get_byname('responsible_name'):
-            group = self.task.course.get_user_group(self.user)
+        TaskTaken.reconcile(TaskTaken.objects.filter(id=self.id))
+        self.refresh_from_db(fields=['status', 'update_time'])
+
+    @classmethod
+    def reconcile(cls, task_takens, set_responsible=True):
+        """
+        Marks task takens with a nonzero issue mark as scored and, with set_responsible, sets default teachers
+        of their groups as responsible for issues without one. Reads (score, user_can_take_task) do not change
+        anything, reconciliation runs on taking a task and from check_task_taken_expires; on issue mark changes
+        only the status is reconciled.
+        """
+        task_takens.filter(issue__isnull=False) \
+            .exclude(issue__mark__range=(-sys.float_info.epsilon, sys.float_info.epsilon)) \
+            .exclude(status=cls.STATUS_SCORED) \
+            .update(status=cls.STATUS_SCORED, update_time=timezone.now())
+
+        if not set_responsible:
+            return
+
+        without_responsible = task_takens \
+            .filter(issue__isnull=False, issue__responsible__isnull=True) \
+            .select_related('issue', 'task', 'task__course')
+        for task_taken in without_responsible:
+            course = task_taken.task.course
+            group = course.get_user_group(task_taken.user_id)
             if group:
-                default_teacher = self.task.course.get_default_teacher(group)
+                default_teacher = course.get_default_teacher(group)
                 if default_teacher:
-                    self.issue.set_byname('responsible_name', default_teacher, author=None)
+                    task_taken.issue.set_byname('responsible_name', default_teacher, author=None)
 
     def take(self):
         self.status = self.STATUS_TAKEN
         if self.taken_time is None:
             self.taken_time = timezone.now()
         self.save()
+        self.update_status()
 
     def cancel(self):
         dt_from_taken_delta = timezone.now() - self.taken_time
@@ -465,3 +484,17 @@ def task_save_to_log_post_save(sender, instance, created, **kwargs):
     task_log.groups.add(*instance.groups.all())
 
 # post_save.connect(task_save_to_log_post_save, sender=Task)
+
+
+def task_invalidate_gradebook(sender, instance, **kwargs):
+    gradebook_cache.invalidate(instance.course_id)
+
+
+def task_group_relations_invalidate_gradebook(sender, instance, **kwargs):
+    gradebook_cache.invalidate(instance.task.course_id)
+
+
+models.signals.post_save.connect(task_invalidate_gradebook, sender=Task)
+models.signals.post_delete.connect(task_invalidate_gradebook, sender=Task)
+models.signals.post_save.connect(task_group_relations_invalidate_gradebook, sender=TaskGroupRelations)
+models.signals.post_delete.connect(task_group_relations_invalidate_gradebook, sender=TaskGroupRelations)
@@ -7,15 +7,19 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
 from schools.models import School
-from courses.models import Course
+from courses.models import Course, DefaultTeacher
 from groups.models import Group
 from years.models import Year
-from tasks.models import Task, TaskGroupRelations
+from tasks.models import Task, TaskGroupRelations, TaskTaken
+from issues.models import Issue
 
 from mock import patch
+from contextlib import redirect_stdout
+from io import StringIO
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 from django.urls import reverse
@@ -481,3 +485,43 @@ class ViewsTest(TestCase):
             self.assertEqual(task_pos[0].position, idx + 1, idx)
             self.assertFalse(task_pos[0].deleted, 'Created task TaskGroupRelations deleted')
             problems_idx = 2
+
+
+class TaskTakenTest(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='password')
+        self.student = User.objects.create_user(username='student', password='password')
+        self.year = Year.objects.create(start_year=2016)
+        self.group = Group.objects.create(name='group_name', year=self.year)
+        self.group.students.set([self.student])
+        self.course = Course.objects.create(name='course_name', year=self.year, is_python_task=True)
+        self.course.groups.set([self.group])
+        self.task = Task.objects.create(title='task_title', course=self.course, score_max=10)
+        self.issue = Issue.objects.create(task=self.task, student=self.student)
+        self.task_taken = TaskTaken.objects.create(user=self.student, task=self.task, issue=self.issue)
+
+    def test_score_does_not_write(self):
+        Issue.objects.filter(id=self.issue.id).update(mark=5)
+        task_taken = TaskTaken.objects.select_related('issue').get(id=self.task_taken.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(task_taken.score, 5)
+        self.assertEqual(TaskTaken.objects.get(id=self.task_taken.id).status, TaskTaken.STATUS_TAKEN)
+
+    def test_reconcile_on_mark_change(self):
+        DefaultTeacher.objects.create(teacher=self.teacher, course=self.course, group=self.group)
+        Issue.objects.filter(id=self.issue.id).update(responsible=None)
+
+        issue = Issue.objects.get(id=self.issue.id)
+        issue.set_byname('mark', 3)
+        issue.set_byname('review_id', 7)
+
+        task_taken = TaskTaken.objects.select_related('issue').get(id=self.task_taken.id)
+        self.assertEqual(task_taken.status, TaskTaken.STATUS_SCORED)
+        self.assertIsNone(task_taken.issue.responsible)
+        self.assertIsNone(issue.get_byname('responsible_name'))
+
+        with redirect_stdout(StringIO()):
+            call_command('check_task_taken_expires')
+        issue = Issue.objects.get(id=self.issue.id)
+        self.assertEqual(issue.responsible, self.teacher)
+        self.assertEqual(issue.get_byname('responsible_name'), self.teacher)
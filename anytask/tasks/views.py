@@ -3,7 +3,6 @@
 import datetime
 import json
 
-import requests
 from reversion import revisions as reversion
 
 from django.conf import settings
@@ -17,6 +16,7 @@ from django.utils.timezone import make_aware
 from django.db.models import Sum
 from django.views.decorators.http import require_http_methods
 
+from anycontest import contest_cache
 from anycontest.common import get_contest_info
 from common.timezone import get_datetime_with_tz, convert_datetime
 from courses.models import Course
@@ -28,9 +28,6 @@ from tasks.models import Task
 from pytz import timezone
 from functools import reduce
 
-HEADERS = {'Authorization': 'OAuth ' + settings.CONTEST_OAUTH}
-PROBLEMS_API = settings.CONTEST_API_URL + 'problems?locale={lang}&contestId={cont_id}'
-
 
 def merge_two_dicts(x, y):
     z = x.copy()
@@ -360,9 +357,7 @@ def get_contest_problems(request):
                                         'error': _(u"net_prav_na_kontest")}),
                             content_type="application/json")
 
-    problem_req = requests.get(PROBLEMS_API.format(lang=lang, cont_id=str(contest_id)),
-                               headers=HEADERS)
-    problem_req = problem_req.json()
+    problem_req = contest_cache.get_problems(contest_id, lang)
 
     if 'error' in problem_req:
         is_error = True
@@ -404,11 +399,10 @@ def contest_task_import(request):
 
     got_info, contest_info = get_contest_info(contest_id)
 
-    problem_req = requests.get(PROBLEMS_API.format(lang='ru', cont_id=str(contest_id)),
-                               headers=HEADERS)
+    problem_req = contest_cache.get_problems(contest_id, 'ru')
     problems = []
-    if 'result' in problem_req.json():
-        problems = problem_req.json()['result']['problems']
+    if 'result' in problem_req:
+        problems = problem_req['result']['problems']
 
     problems_with_score = {problem['id']: problem.get('score') for problem in problems}
 
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from courses import gradebook_cache
+from courses.models import Course, StudentCourseMark
+from issues.model_issue_status import IssueStatus, IssueStatusSystem
+from issues.models import Issue
+from tasks.models import Task
+
+SUMMARY_KEY = 'user_courses:{0}:{1}:{2}'
+
+
+def get_courses_summary(student, lang):
+    """
+    Returns statistics of the student in every course of the student's groups: issues by status, score, mark
+    and number of tasks. Computed in a fixed number of queries and, with a cache shared by all processes,
+    cached until the gradebook of one of the courses changes (see courses.gradebook_cache).
+    """
+    groups = list(student.group_set.values_list('id', flat=True))
+    courses = list(Course.objects
+                   .filter(groups__in=groups)
+                   .select_related('year')
+                   .distinct()
+                   .order_by('id'))
+    if not gradebook_cache.is_enabled():
+        return build_courses_summary(student, groups, courses, lang)
+
+    version_keys = dict((course.id, gradebook_cache.VERSION_KEY.format(course.id)) for course in courses)
+    versions = cache.get_many(version_keys.values())
+    params = (groups, [(course.id, versions.get(version_keys[course.id]) or gradebook_cache.get_version(course.id))
+                       for course in courses])
+    key = SUMMARY_KEY.format(student.id, lang, hashlib.md5(repr(params).encode('utf-8')).hexdigest())
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_courses_summary(student, groups, courses, lang)
+        cache.set(key, summary, settings.USER_COURSES_CACHE_TIMEOUT)
+    return summary
+
+
+def build_courses_summary(student, groups, courses, lang):
+    course_ids = [course.id for course in courses]
+    tasks = Task.objects \
+        .filter(course_id__in=course_ids, groups__in=groups, is_hidden=False) \
+        .exclude(type=Task.TYPE_MATERIAL)
+    issues = Issue.objects.filter(student=student, task__in=tasks.values('id'))
+
+    tasks_count = dict(tasks
+                       .exclude(type=Task.TYPE_SEMINAR)
+                       .order_by()
+                       .values('course_id')
+                       .annotate(count=Count('id', distinct=True))
+                       .values_list('course_id', 'count'))
+
+    issues_count = defaultdict(dict)
+    for course_id, status_id, count in issues \
+            .order_by() \
+            .values('task__course_id', 'status_field_id') \
+            .annotate(count=Count('id')) \
+            .values_list('task__course_id', 'status_field_id', 'count'):
+        issues_count[course_id][status_id] = count
+
+    summ_score = dict(issues
+                      .filter(task__parent_task__isnull=True)
+                      .filter(
+                          Q(task__type=Task.TYPE_SEMINAR)
+                          | Q(task__score_after_deadline=True)
+                          | ~Q(task__score_after_deadline=False,
+                               status_field__tag=IssueStatus.STATUS_ACCEPTED_AFTER_DEADLINE)
+                      )
+                      .order_by()
+                      .values('task__course_id')
+                      .annotate(summ=Sum('mark'))
+                      .values_list('task__course_id', 'summ'))
+
+    marks = dict((course_mark.course_id, course_mark.mark) for course_mark in StudentCourseMark.objects
+                 .filter(student=student, course_id__in=course_ids)
+                 .select_related('mark'))
+
+    statuses = defaultdict(list)
+    for status_system_status in IssueStatusSystem.statuses.through.objects \
+            .filter(issuestatussystem_id__in=set(course.issue_status_system_id for course in courses)) \
+            .select_related('issuestatus') \
+            .order_by('id'):
+        statuses[status_system_status.issuestatussystem_id].append(status_system_status.issuestatus)
+
+    summary = []
+    for course in courses:
+        mark = marks.get(course.id)
+        summary.append({
+            'name': course.name,
+            'url': course.get_absolute_url(),
+            'issues_count': [(status.color, status.get_name(lang), issues_count[course.id].get(status.id, 0))
+                             for status in statuses[course.issue_status_system_id]],
+            'tasks': tasks_count.get(course.id, 0),
+            'mark': str(mark) if mark else '--',
+            'summ_score': summ_score.get(course.id) or 0,
+            'is_active': course.is_active,
+            'year': str(course.year),
+            'issue_status_system_id': course.issue_status_system_id,
+        })
+    return summary
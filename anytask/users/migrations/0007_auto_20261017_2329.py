@@ -0,0 +1,60 @@
+# Generated by Django 2.0.13 on 2026-10-17 20:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(queryset.order_by().values(field).annotate(count=Count('pk')).values('count')), 0)
+
+
+def count_mail(apps, schema_editor):
+    Message = apps.get_model('mail', 'Message')
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    recipients = Message.recipients.through.objects.filter(user_id=OuterRef('user_id'))
+    sent = Message.objects.filter(sender_id=OuterRef('user_id'))
+    unread = UserProfile.unread_messages.through.objects.filter(userprofile_id=OuterRef('pk'))
+    deleted = UserProfile.deleted_messages.through.objects.filter(userprofile_id=OuterRef('pk'))
+    unread_deleted = unread.filter(message__deleted_messages=OuterRef('pk'))
+    recipients_deleted = recipients.filter(message__deleted_messages=OuterRef('pk'))
+    sent_deleted = sent.filter(deleted_messages=OuterRef('pk'))
+    UserProfile.objects.update(
+        mail_unread_count=_count(unread, 'userprofile_id') - _count(unread_deleted, 'userprofile_id'),
+        mail_inbox_count=_count(recipients, 'user_id') - _count(recipients_deleted, 'user_id'),
+        mail_sent_count=_count(sent, 'sender_id') - _count(sent_deleted, 'sender_id'),
+        mail_trash_count=_count(deleted, 'userprofile_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_auto_20240413_0312'),
+        ('mail', '0007_auto_20261017_2329'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='mail_inbox_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='mail_sent_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='mail_trash_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='mail_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_mail, migrations.RunPython.noop),
+    ]
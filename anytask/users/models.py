@@ -6,9 +6,14 @@ import os
 from courses.models import Course
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import Signal
+from django.utils import timezone
 from groups.models import Group
 from mail.models import Message
+from schools.models import School
 from users.model_user_status import UserStatus
 from years.common import get_current_year
 
@@ -62,6 +67,11 @@ class UserProfile(models.Model):
     unread_messages = models.ManyToManyField(Message, blank=True, related_name='unread_messages')
     deleted_messages = models.ManyToManyField(Message, blank=True, related_name='deleted_messages')
     send_notify_messages = models.ManyToManyField(Message, blank=True, related_name='send_notify_messages')
+    # mailbox sizes without deleted messages, see update_mail_counts
+    mail_unread_count = models.PositiveIntegerField(default=0)
+    mail_inbox_count = models.PositiveIntegerField(default=0)
+    mail_sent_count = models.PositiveIntegerField(default=0)
+    mail_trash_count = models.PositiveIntegerField(default=0)
 
     added_time = models.DateTimeField(auto_now_add=True)  # remove default=timezone.now
     update_time = models.DateTimeField(auto_now=True)  # remove default=timezone.now
@@ -113,7 +123,11 @@ class UserProfile(models.Model):
         self.user_status.add(new_status)
 
     def get_unread_count(self):
-        return self.unread_messages.exclude(id__in=self.deleted_messages.all()).count()
+        return self.mail_unread_count
+
+    def update_mail_counts(self):
+        update_mail_counts(UserProfile.objects.filter(id=self.id))
+        self.refresh_from_db(fields=MAIL_COUNT_FIELDS)
 
     def can_sync_contest(self):
         for course in Course.objects.filter(is_active=True):
@@ -196,9 +210,90 @@ class UserProfileLog(models.Model):
         return str(self.user)
 
 
+MAIL_COUNT_FIELDS = ('mail_unread_count', 'mail_inbox_count', 'mail_sent_count', 'mail_trash_count')
+
+
+def _count(queryset, field):
+    """
+    Returns: count of the queryset rows, all having the same `field`, as a subquery
+    """
+    return Coalesce(Subquery(queryset.order_by().values(field).annotate(count=Count('pk')).values('count')), 0)
+
+
+def update_mail_counts(profiles):
+    """
+    Recounts mailbox sizes of the profiles in one query
+    """
+    recipients = Message.recipients.through.objects.filter(user_id=OuterRef('user_id'))
+    sent = Message.objects.filter(sender_id=OuterRef('user_id'))
+    unread = UserProfile.unread_messages.through.objects.filter(userprofile_id=OuterRef('pk'))
+    deleted = UserProfile.deleted_messages.through.objects.filter(userprofile_id=OuterRef('pk'))
+    unread_deleted = unread.filter(message__deleted_messages=OuterRef('pk'))
+    recipients_deleted = recipients.filter(message__deleted_messages=OuterRef('pk'))
+    sent_deleted = sent.filter(deleted_messages=OuterRef('pk'))
+    profiles.update(
+        mail_unread_count=_count(unread, 'userprofile_id') - _count(unread_deleted, 'userprofile_id'),
+        mail_inbox_count=_count(recipients, 'user_id') - _count(recipients_deleted, 'user_id'),
+        mail_sent_count=_count(sent, 'sender_id') - _count(sent_deleted, 'sender_id'),
+        mail_trash_count=_count(deleted, 'userprofile_id'),
+    )
+
+
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
 
 
 post_save.connect(create_user_profile, sender=User)
+
+
+# Sent when search visibility facts of the profiles of the users change without saving the profiles
+profiles_touched = Signal(providing_args=['user_ids'])
+
+
+def touch_profiles(user_ids):
+    """
+    Marks the profiles changed, so that update_index reindexes their search visibility facts
+    """
+    UserProfile.objects.filter(user_id__in=user_ids).update(update_time=timezone.now())
+    profiles_touched.send(sender=UserProfile, user_ids=user_ids)
+
+
+def _changed_ids(instance, action, reverse, pk_set, field_name):
+    """
+    Returns: ids of the objects on the forward side of the m2m relation that changed
+    """
+    if reverse:
+        return [instance.id]
+    if action == "pre_clear":
+        return getattr(instance, field_name).values('id')
+    return pk_set
+
+
+def touch_profiles_on_users_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    field_name = 'students' if sender is Group.students.through else 'teachers'
+    touch_profiles(_changed_ids(instance, action, reverse, pk_set, field_name))
+
+
+def touch_profiles_on_course_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    group_ids = _changed_ids(instance, action, reverse, pk_set, 'groups')
+    touch_profiles(Group.students.through.objects.filter(group_id__in=group_ids).values('user_id'))
+
+
+def touch_profiles_on_school_courses_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    course_ids = _changed_ids(instance, action, reverse, pk_set, 'courses')
+    group_ids = Course.groups.through.objects.filter(course_id__in=course_ids).values('group_id')
+    touch_profiles(Group.students.through.objects.filter(group_id__in=group_ids).values('user_id'))
+    touch_profiles(Course.teachers.through.objects.filter(course_id__in=course_ids).values('user_id'))
+
+
+m2m_changed.connect(touch_profiles_on_users_change, sender=Group.students.through)
+m2m_changed.connect(touch_profiles_on_users_change, sender=Course.teachers.through)
+m2m_changed.connect(touch_profiles_on_course_groups_change, sender=Course.groups.through)
+m2m_changed.connect(touch_profiles_on_school_courses_change, sender=School.courses.through)
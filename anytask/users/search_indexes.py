@@ -1,5 +1,8 @@
+from django.db.models import Q
 from haystack import indexes
 
+from courses.models import Course
+from schools.models import School
 from users.models import UserProfile
 
 
@@ -13,14 +16,32 @@ class UserProfileIndex(indexes.SearchIndex, indexes.Indexable):
     ya_passport_email_auto = indexes.NgramField(model_attr='ya_passport_email')
     email_auto = indexes.NgramField(model_attr='user__email')
 
+    # Visibility facts, see search.views.search_users
+    course_ids = indexes.MultiValueField()
+    teacher_course_ids = indexes.MultiValueField()
+    school_ids = indexes.MultiValueField()
+
     def get_model(self):
         return UserProfile
 
     def prepare_fullname_auto(self, obj):
         return u'{0}'.format(obj.user.get_full_name())
 
+    def prepare_course_ids(self, obj):
+        return list(Course.objects.filter(groups__students=obj.user_id).values_list('id', flat=True).distinct())
+
+    def prepare_teacher_course_ids(self, obj):
+        return list(Course.objects.filter(teachers=obj.user_id).values_list('id', flat=True))
+
+    def prepare_school_ids(self, obj):
+        course_ids = Course.objects.filter(Q(groups__students=obj.user_id) | Q(teachers=obj.user_id)).values('id')
+        return list(School.objects.filter(courses__in=course_ids).values_list('id', flat=True).distinct())
+
     def index_queryset(self, using=None):
         return self.get_model().objects.all()
 
+    def read_queryset(self, using=None):
+        return self.get_model().objects.select_related('user').prefetch_related('user_status')
+
     def get_updated_field(self):
         return 'update_time'
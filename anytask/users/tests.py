@@ -1,15 +1,23 @@
 ﻿# encoding: utf-8
 
 import re
+import shutil
+import tempfile
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.sites.models import Site
 
 from schools.models import School
 from years.models import Year
-from courses.models import Course
+from courses.models import Course, MarkField, StudentCourseMark
 from groups.models import Group
+from issues.model_issue_status import IssueStatus
+from issues.models import Issue
+from tasks.models import Task
 
 from django.core import mail
 from django.urls import reverse
@@ -433,3 +441,106 @@ class UserProfileAccess(TestCase):
                                         200,  # student_1_group_3
                                         200,  # user_staff
                                     ])
+
+
+class UserCoursesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create_user(username='student', password='password')
+        self.year = Year.objects.create(start_year=2016)
+        self.statuses = dict((status.tag, status) for status in IssueStatus.objects.all())
+
+        self.courses = []
+        self.tasks = []
+        for i in range(3):
+            group = Group.objects.create(name='group_{}'.format(i), year=self.year)
+            group.students.set([self.student])
+            course = Course.objects.create(name='course_{}'.format(i), year=self.year, is_active=i != 2)
+            course.groups.set([group])
+            self.courses.append(course)
+
+            task = Task.objects.create(title='task_{}'.format(i), course=course, score_max=10)
+            task.groups.set([group])
+            seminar = Task.objects.create(title='seminar_{}'.format(i), course=course, type=Task.TYPE_SEMINAR)
+            seminar.groups.set([group])
+            material = Task.objects.create(title='material_{}'.format(i), course=course, type=Task.TYPE_MATERIAL)
+            material.groups.set([group])
+            self.tasks.append(task)
+
+            Issue.objects.create(task=task, student=self.student, mark=i + 1,
+                                 status_field=self.statuses[IssueStatus.STATUS_ACCEPTED])
+            Issue.objects.create(task=seminar, student=self.student, mark=1,
+                                 status_field=self.statuses[IssueStatus.STATUS_REWORK])
+            Issue.objects.create(task=material, student=self.student, mark=100,
+                                 status_field=self.statuses[IssueStatus.STATUS_REWORK])
+
+        StudentCourseMark.objects.create(student=self.student, course=self.courses[0],
+                                         mark=MarkField.objects.create(name='excellent', name_int=5))
+        self.client.login(username='student', password='password')
+
+    def get_courses_statistics(self):
+        response = self.client.get(reverse('users.views.user_courses', kwargs={'username': 'student'}))
+        self.assertEqual(response.status_code, 200)
+        statistics = {}
+        for table in response.context['tables']:
+            for year, courses_by_status_system in table:
+                for courses in courses_by_status_system.values():
+                    for course in courses:
+                        statistics[course['name']] = course
+        return statistics
+
+    def test_statistics(self):
+        statistics = self.get_courses_statistics()
+        self.assertEqual(len(statistics), 3)
+
+        course = statistics['course_0']
+        self.assertEqual((course['tasks'], course['summ_score'], course['mark']), (1, 2, 'excellent'))
+        issues_count = dict((name, count) for color, name, count in course['issues_count'])
+        self.assertEqual(len(issues_count), self.courses[0].issue_status_system.statuses.count())
+        self.assertEqual(issues_count[self.statuses[IssueStatus.STATUS_ACCEPTED].get_name('ru')], 1)
+        self.assertEqual(issues_count[self.statuses[IssueStatus.STATUS_REWORK].get_name('ru')], 1)
+        self.assertEqual((statistics['course_2']['summ_score'], statistics['course_2']['mark']), (4, '--'))
+
+        # changed issues are seen at once
+        issue = Issue.objects.get(task=self.tasks[0], student=self.student)
+        issue.mark = 7
+        issue.save()
+        self.assertEqual(self.get_courses_statistics()['course_0']['summ_score'], 8)
+
+    def test_query_count(self):
+        self.get_courses_statistics()
+        cache.clear()
+        for course in self.courses[1:]:
+            course.groups.clear()
+        with CaptureQueriesContext(connection) as one_course_queries:
+            self.assertEqual(len(self.get_courses_statistics()), 1)
+
+        cache.clear()
+        for i, course in enumerate(self.courses[1:], 1):
+            course.groups.set(Group.objects.filter(name='group_{}'.format(i)))
+        with CaptureQueriesContext(connection) as three_courses_queries:
+            self.assertEqual(len(self.get_courses_statistics()), 3)
+        self.assertEqual(len(three_courses_queries), len(one_course_queries))
+
+        # the statistics are cached only in a cache shared by all processes
+        with CaptureQueriesContext(connection) as local_cache_queries:
+            self.get_courses_statistics()
+        self.assertEqual(len(local_cache_queries), len(three_courses_queries))
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}):
+            with CaptureQueriesContext(connection) as shared_cache_queries:
+                self.get_courses_statistics()
+            with CaptureQueriesContext(connection) as cached_queries:
+                self.get_courses_statistics()
+            self.assertEqual(len(shared_cache_queries), len(three_courses_queries))
+            self.assertLess(len(cached_queries), len(three_courses_queries))
+
+            issue = Issue.objects.get(task=self.tasks[0], student=self.student)
+            issue.mark = 7
+            issue.save()
+            self.assertEqual(self.get_courses_statistics()['course_0']['summ_score'], 8)
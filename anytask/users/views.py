@@ -3,7 +3,6 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect
 from django.db.models import Q
-from django.db.models import Sum
 from django.conf import settings
 from django.utils.http import is_safe_url
 from django.contrib.auth.decorators import login_required
@@ -12,16 +11,16 @@ from django.utils.translation import ugettext as _
 from django.utils.translation import check_for_language
 from django.utils import timezone
 
+from users.courses_summary import get_courses_summary
 from users.models import UserProfile
 from users.model_user_status import UserStatus
 from issues.model_issue_student_filter import IssueFilterStudent
 from django.contrib.auth.models import User
 from years.models import Year
 from groups.models import Group
-from courses.models import Course, StudentCourseMark
+from courses.models import Course
 from invites.models import Invite
 from issues.models import Issue
-from issues.model_issue_status import IssueStatus
 from tasks.models import Task
 from schools.models import School
 from users.forms import InviteActivationForm
@@ -532,51 +531,12 @@ def user_courses(request, username=None, year=None):
     else:
         current_year = get_current_year()
 
-    groups = user_to_show.group_set.all()
-
-    courses = Course.objects.filter(groups__in=groups).distinct()
-
     tables = [{}, {}]
 
-    for course in courses:
-
-        tasks = Task.objects\
-            .filter(course=course, groups__in=groups, is_hidden=False) \
-            .exclude(type=Task.TYPE_MATERIAL)\
-            .distinct()
-        issues = Issue.objects.filter(student=user_to_show, task__in=tasks)
-
-        if StudentCourseMark.objects.filter(student=user_to_show, course=course):
-            mark = StudentCourseMark.objects.get(student=user_to_show, course=course).mark
-        else:
-            mark = None
-
-        student_summ_score = issues \
-            .filter(task__parent_task__isnull=True) \
-            .filter(
-                Q(task__type=Task.TYPE_SEMINAR)
-                | Q(task__score_after_deadline=True)
-                | ~Q(task__score_after_deadline=False, status_field__tag=IssueStatus.STATUS_ACCEPTED_AFTER_DEADLINE)
-            ) \
-            .distinct() \
-            .aggregate(Sum('mark'))['mark__sum'] or 0
-
-        new_course_statistics = dict()
-        new_course_statistics['name'] = course.name
-        new_course_statistics['url'] = course.get_absolute_url()
-
-        new_course_statistics['issues_count'] = []
-        for status in course.issue_status_system.statuses.all():
-            new_course_statistics['issues_count'].append((status.color, status.get_name(lang),
-                                                          issues.filter(status_field=status).count()))
-
-        new_course_statistics['tasks'] = tasks.exclude(type=Task.TYPE_SEMINAR).count()
-        new_course_statistics['mark'] = mark if mark else '--'
-        new_course_statistics['summ_score'] = student_summ_score
-
-        is_archive = int(not course.is_active)
-        table_year = str(course.year)
-        table_key = course.issue_status_system.id
+    for new_course_statistics in get_courses_summary(user_to_show, lang):
+        is_archive = int(not new_course_statistics['is_active'])
+        table_year = new_course_statistics['year']
+        table_key = new_course_statistics['issue_status_system_id']
 
         if table_year not in tables[is_archive]:
             tables[is_archive][table_year] = dict()
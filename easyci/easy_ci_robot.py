@@ -19,6 +19,8 @@ from contextlib import contextmanager
 
 CONFIG = "config.json"
 PASSWORDS = "passwords.json"
+STATE = "state.json"
+EVENTS_LIMIT = 1000
 MAX_COMMENT_SIZE = 10000
 PROCS = 1
 REQUEST_TIMEOUT = 300
@@ -120,43 +122,77 @@ def get_auth(passwords, host):
     return (host_auth["username"], host_auth["password"])
 
 
+def load_state(filename=STATE):
+    if not os.path.exists(filename):
+        return {}
+    return load_config(filename)
+
+
+def save_state(state, filename=STATE):
+    with open(filename, "w") as state_fn:
+        json.dump(state, state_fn)
+
+
+def get_course_key(course):
+    return "{}/{}".format(course["host"], course["course_id"])
+
+
+def get_events(course, auth, since_id):
+    events = []
+    while True:
+        response = requests.get("{}/api/v1/events".format(course["host"]),
+                                params={"course_id": course["course_id"], "since_id": since_id,
+                                        "limit": EVENTS_LIMIT},
+                                auth=auth, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        page = response.json()
+        events.extend(page)
+        if len(page) < EVENTS_LIMIT:
+            return events
+        since_id = page[-1]["id"]
+
+
 DONE_MESSAGE_RE = re.compile(r'\[id:(\d+)\] Check DONE!')
-def make_queue(config, passwords):
+def make_queue(config, passwords, state):
+    """
+    Reads only events added since the last run (ids are kept in state) and
+    updates state with the last seen event id of every course.
+    """
     queue = OrderedDict()
     for course in config:
-        course_id = course["course_id"]
+        course_key = get_course_key(course)
         auth = get_auth(passwords, course["host"])
-        response = requests.get("{}/api/v1/course/{}/issues?add_events=1".format(course["host"], course_id),
-                                auth=auth, timeout=REQUEST_TIMEOUT)
-        if response.status_code != 200:
-            logging.error("Course %d has non-200 reply. Skipped", course["course_id"])
+        try:
+            events = get_events(course, auth, state.get(course_key, 0))
+        except requests.RequestException:
+            logging.exception("Course %d events are not loaded. Skipped", course["course_id"])
             continue
 
-        for issue in response.json():
-            for event in issue.get("events", []):
-                if event["author"]["username"] == auth[0]:
-                    m = DONE_MESSAGE_RE.search(event["message"])
-                    if m:
-                        done_id = int(m.group(1))
-                        queue.pop(done_id, None)
-                    continue
-
-                files = event.get("files")
-                if not files:
-                    continue
-
-                qtask = QueueTask()
-                qtask.host = course["host"]
-                qtask.auth = auth
-                qtask.config = config
-                qtask.course = course
-                qtask.task = issue["task"]
-                qtask.issue = issue
-                qtask.event = event
-                qtask.files = files
-                qtask.id = event["id"]
-
-                queue[qtask.id] = qtask
+        for event in events:
+            state[course_key] = event["id"]
+            if event["author"]["username"] == auth[0]:
+                m = DONE_MESSAGE_RE.search(event["message"])
+                if m:
+                    done_id = int(m.group(1))
+                    queue.pop(done_id, None)
+                continue
+
+            files = event.get("files")
+            if not files:
+                continue
+
+            qtask = QueueTask()
+            qtask.host = course["host"]
+            qtask.auth = auth
+            qtask.config = config
+            qtask.course = course
+            qtask.task = event["issue"]["task"]
+            qtask.issue = event["issue"]
+            qtask.event = event
+            qtask.files = files
+            qtask.id = event["id"]
+
+            queue[qtask.id] = qtask
 
     return queue
 
@@ -165,7 +201,8 @@ def main():
     logging.info("Start parallel version!")
     config = load_config()
     passwords = load_config(PASSWORDS)
-    queue = make_queue(config, passwords)
+    state = load_state()
+    queue = make_queue(config, passwords, state)
     pool = Pool(processes=PROCS)
 
     logging.info("Queue:")
@@ -178,6 +215,8 @@ def main():
     for qtask in pool.imap_unordered(proccess_task, queue.values()):
         logging.info(" == Parralel Task %d DONE!, URL: %s/issue/%d", qtask.id, qtask.host, qtask.issue["id"])
 
+    # Saved only when the whole queue is checked, otherwise unchecked events are read again next time
+    save_state(state)
     logging.info("All DONE!")
 
 if __name__ == "__main__":